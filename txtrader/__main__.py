@@ -3,13 +3,22 @@ from twisted.internet import reactor
 
 from txtrader.tws import TWS
 from txtrader.tcpserver import serverFactory
+from txtrader.fanout import FanoutService
 from txtrader.webserver import webServerFactory
 
 msvc = service.MultiService()
 
 api = TWS()
 internet.TCPServer(api.http_port, webServerFactory(api)).setServiceParent(msvc)
-internet.TCPServer(api.tcp_port, serverFactory(api)).setServiceParent(msvc)
+if api.fanout_workers:
+    FanoutService(api, api.tcp_port, api.fanout_workers).setServiceParent(msvc)
+else:
+    internet.TCPServer(api.tcp_port, serverFactory(api)).setServiceParent(msvc)
+# optional Unix domain sockets for co-located clients; with SOCKET_AUTH the file mode is the only access control
+if api.http_socket:
+    internet.UNIXServer(api.http_socket, webServerFactory(api, api.socket_auth), mode=api.socket_mode, wantPID=True).setServiceParent(msvc)
+if api.tcp_socket:
+    internet.UNIXServer(api.tcp_socket, serverFactory(api, api.socket_auth), mode=api.socket_mode, wantPID=True).setServiceParent(msvc)
 application = service.Application('txtrader')
 msvc.setServiceParent(application)
 reactor.run()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  asyncclient.py
+  --------------
+
+  TxTrader asynchronous client module - the client API with Deferred results.
+
+  AsyncAPI has the commands of client.API, but each call returns a Deferred instead of
+  blocking, so many calls can be in flight at once.  Requests are sent with twisted.web's
+  Agent over a pool of keep-alive connections (TXTRADER_HTTP_POOL_SIZE per host).
+
+    api = AsyncAPI('rtx')
+    quotes = yield defer.gatherResults([api.query_symbol(s) for s in symbols])
+
+  events() connects to the TCP event stream and returns an EventStream; each call to its next()
+  returns a Deferred firing with the next (type, data) pair, using the event types and data of
+  Monitor's callbacks:
+
+    stream = yield api.events(['quote', 'order'])
+    while True:
+        event_type, data = yield stream.next()
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+
+import base64
+import urllib
+import json
+
+from twisted.internet import reactor, defer
+from twisted.internet.endpoints import TCP4ClientEndpoint
+from twisted.internet.protocol import Factory
+from twisted.web.client import Agent, HTTPConnectionPool, FileBodyProducer, readBody
+from twisted.web.http_headers import Headers
+from StringIO import StringIO
+
+from txtrader.client import API
+from txtrader.monitor import Monitor, StatusClient
+
+
+class AsyncAPI(API):
+    """client.API returning Deferreds; calls run concurrently over pooled keep-alive connections"""
+
+    def __init__(self, server):
+        API.__init__(self, server)
+        self.session.close()
+        self.session = None
+        self.pool = HTTPConnectionPool(reactor, persistent=True)
+        self.pool.maxPersistentPerHost = self.http_pool_size
+        self.agent = Agent(reactor, pool=self.pool)
+        self.headers = {
+            'Authorization': ['Basic %s' % base64.b64encode('%s:%s' % (self.username, self.password))],
+            'Content-type': ['application/json'],
+        }
+
+    def close(self):
+        """close the pooled connections; returns a Deferred"""
+        return self.pool.closeCachedConnections()
+
+    def cmd(self, cmd, args):
+        if cmd not in self.cmdmap.keys():
+            return defer.fail(Exception('Error: unknown command: %s\n' % cmd))
+        func, require_account, parms = self.cmdmap[cmd]
+        if not require_account:
+            return defer.maybeDeferred(func, *args)
+
+        def account_set(ret):
+            if not ret:
+                raise Exception('Error: set_account required')
+            return func(*args)
+        return self.set_account(self.account).addCallback(account_set)
+
+    def request(self, method, url, body=None):
+        d = self.agent.request(method, url, Headers(self.headers), body and FileBodyProducer(StringIO(body)))
+        d.addCallback(self.response)
+        return d
+
+    def response(self, response):
+        if response.code != 200:
+            raise Exception('%d %s' % (response.code, response.phrase))
+        return readBody(response).addCallback(json.loads)
+
+    def call_txtrader_post(self, function_name, args):
+        return self.request('POST', '%s/%s' % (self.url, function_name), json.dumps(args))
+
+    def call_txtrader_get(self, function_name, args):
+        # None values are left out, as requests does
+        params = urllib.urlencode([(k, v) for k, v in args.items() if v is not None])
+        return self.request('GET', '%s/%s%s' % (self.url, function_name, '?' + params if params else ''))
+
+    def help(self, *args):
+        return self.call_txtrader_get('help', {})
+
+    def set_account(self, *args):
+        account = args[0]
+
+        def account_set(ret):
+            if ret:
+                self.account = account
+            return ret
+        return self.call_txtrader_post('set_account', {'account': account}).addCallback(account_set)
+
+    def set_order_route(self, *args):
+        def route_set(ret):
+            if ret:
+                self.order_route = ret
+            return ret
+        return self.call_txtrader_post('set_order_route', {'route': args[0]}).addCallback(route_set)
+
+    def batch(self, commands):
+        def results(results):
+            errors = ['%s: %s' % (commands[i][0], r['error']) for i, r in enumerate(results) if 'error' in r]
+            if errors:
+                raise Exception('Error: batch failed: %s' % '; '.join(errors))
+            return [r['result'] for r in results]
+        return self.call_txtrader_post('batch', [{'command': c, 'args': a} for c, a in commands]).addCallback(results)
+
+    def events(self, types=None, encoding=None):
+        """connect to the event stream; return a Deferred firing with an EventStream once connected
+
+        types is a list of Monitor callback names ('quote', 'trade', 'order', 'execution', 'time',
+        'status', 'error'); the server filters out the categories not listed.  None for all.
+        """
+        stream = EventStream(self.username, self.password, types, encoding)
+        endpoint = TCP4ClientEndpoint(reactor, self.hostname, int(self.config.get('TCP_PORT')))
+        return endpoint.connect(EventStreamFactory(stream)).addCallback(lambda protocol: stream.connected(protocol))
+
+
+class EventStream(Monitor):
+    """the event stream as a Deferred iterator: next() fires with the next (type, data)"""
+
+    def __init__(self, user, password, types=None, encoding=None):
+        types = types or ['status', 'error', 'time', 'order', 'execution', 'quote', 'trade']
+        Monitor.__init__(self, user=user, password=password, encoding=encoding,
+                         callbacks=dict([(t, self.queue_event) for t in types + ['error']]))
+        self.queue = defer.DeferredQueue()
+        self.protocol = None
+
+    def shutdown_event(self):
+        self.close()
+
+    def connected(self, protocol):
+        self.protocol = protocol
+        return self
+
+    def queue_event(self, event_type, data):
+        self.queue.put((event_type, data))
+        return True
+
+    def next(self):
+        """return a Deferred firing with the next (type, data); ('error', ...) follows a lost connection"""
+        return self.queue.get()
+
+    def close(self):
+        if self.protocol and self.protocol.transport:
+            self.protocol.transport.loseConnection()
+
+
+class EventStreamClient(StatusClient):
+
+    def connectionLost(self, reason):
+        self.factory.rx._callback('error', 'connection lost, reason=%s' % reason.getErrorMessage())
+
+
+class EventStreamFactory(Factory):
+    protocol = EventStreamClient
+
+    def __init__(self, stream):
+        self.rx = stream
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+  asyncclient_test.py
+  -------------------
+
+  TxTrader asynchronous client unit test script
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+from txtrader.tcpserver import serverFactory
+from txtrader.webserver_test import VersionedAPI
+from twisted.internet import reactor, defer
+from twisted.web.server import Site
+
+import os
+import pytest
+
+pytestmark = pytest.mark.skipif('TXTRADER_API_HOST' not in os.environ, reason='needs the etc/txtrader environment (envdir)')
+
+
+@pytest.fixture(scope='module', autouse=True)
+def threadpool():
+    # the reactor is iterated by hand: start the threadpool the Agent resolves host names on
+    pool = reactor.getThreadPool()
+    pool.start()
+    yield pool
+    pool.stop()
+
+
+def iterate(done, timeout=1000):
+    for i in range(timeout):
+        if done():
+            break
+        reactor.iterate(0.01)
+    assert done()
+    return done()
+
+
+def test_concurrent_calls():
+    from txtrader.asyncclient import AsyncAPI
+    api = VersionedAPI()
+    api.username, api.password = os.environ['TXTRADER_USERNAME'], os.environ['TXTRADER_PASSWORD']
+    port = reactor.listenTCP(0, Site(serverFactory(api).webserver.root), interface='127.0.0.1')
+    client = AsyncAPI('rtx')
+    client.url = 'http://127.0.0.1:%d' % port.getHost().port
+    results = []
+    try:
+        account = client.set_account('demo1.test.demo.1')
+        calls = [client.status(), client.add_symbol('ibm'), client.query_symbols()]
+        defer.gatherResults(calls).addCallback(results.append)
+        # set_account is still waiting on the api while the other calls complete
+        iterate(lambda: results)
+        assert results == [['Up', True, ['IBM']]]
+        account.addCallback(results.append)
+        api.pending['DEMO1.TEST.DEMO.1'].complete(True)
+        iterate(lambda: len(results) == 2)
+        assert results[1] is True
+        assert client.account == 'demo1.test.demo.1'
+        # commands that need the account set it first
+        results = []
+        client.cmd('query_symbol_data', ['XXX']).addCallback(results.append)
+        client.cmd('no_such_command', []).addErrback(results.append)
+        iterate(lambda: 'DEMO1.TEST.DEMO.1' in api.pending and not api.pending['DEMO1.TEST.DEMO.1'].done)
+        api.pending['DEMO1.TEST.DEMO.1'].complete(True)
+        iterate(lambda: len(results) == 2)
+        assert 'unknown command' in str(results[0].value) and results[1] is None
+    finally:
+        client.close()
+        port.stopListening()
+
+
+def test_event_stream():
+    from txtrader.asyncclient import AsyncAPI
+    api = VersionedAPI()
+    api.username, api.password = os.environ['TXTRADER_USERNAME'], os.environ['TXTRADER_PASSWORD']
+    port = reactor.listenTCP(0, serverFactory(api), interface='127.0.0.1')
+    client = AsyncAPI('rtx')
+    client.hostname = '127.0.0.1'
+    os.environ['TXTRADER_TCP_PORT'], tcp_port = str(port.getHost().port), os.environ['TXTRADER_TCP_PORT']
+    try:
+        connected = client.events(['quote', 'order'])
+        stream = iterate(lambda: connected.called and connected.result)
+        iterate(lambda: api.clients)
+        api.WriteAllClients('time: 2018-01-02 09:30:00')
+        api.WriteAllClients('quote.IBM:131.2 300 131.25 100', ('IBM', 131.2, 300, 131.25, 100))
+        events = [stream.next(), stream.next()]
+        iterate(lambda: events[0].called)
+        assert events[0].result == ('quote', 'IBM:131.2 300 131.25 100')
+        stream.close()
+        iterate(lambda: events[1].called)
+        assert events[1].result[0] == 'error'
+    finally:
+        os.environ['TXTRADER_TCP_PORT'] = tcp_port
+        client.close()
+        port.stopListening()
@@ -0,0 +1,582 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  benchmark.py
+  ------------
+
+  TxTrader micro-benchmark suite - time the server hot paths in process, with no network.
+
+  An RTX instance is connected to the RTGW simulator through an in-memory link, brought up
+  (accounts, order advise, symbols, filled orders), then each benchmark times one hot path:
+
+    gateway_receive.update      RTX.gateway_receive of LIVEQUOTE update messages
+    gateway_receive.response    RTX.gateway_receive of ORDERS request response rows
+    gateway_receive.status      RTX.gateway_receive of advise status messages
+    parse_fields                API_Symbol.parse_fields of quote and trade updates
+    write_all_clients.N         RTX.WriteAllClients fan-out to N text encoded tcpserver protocols
+    write_all_clients.binary.N  RTX.WriteAllClients fan-out to N binary encoded tcpserver protocols
+    order.update                API_Order.update with new suborder rows
+    order.render                API_Order.render
+    format_orders.N             API_Callback 'orders' result formatting with N orders
+    monitor.dispatch            Monitor StatusClient.stringReceived dispatch
+    quote_table.publish         QuoteTable.publish of a symbol's fields
+    quote_table.snapshot        QuoteReader.snapshot of a symbol
+    client.new_session          client.API status calls, opening a new session and connection per call
+    client.session              client.API status calls on its pooled keep-alive session
+    roundtrip.tcp               'status' command round trips to serverFactory over loopback TCP
+    roundtrip.unix              'status' command round trips to serverFactory over a Unix socket
+
+  The client and roundtrip benchmarks are the exception to 'no network': they talk to the
+  server over loopback sockets.  The reactor is iterated by hand; the blocking HTTP client runs
+  in a thread meanwhile.  Their rate is calls or round trips per second; the latency is its
+  inverse.
+
+  Results are written as JSON: {name: {'ops', 'seconds', 'rate', 'unit'}} where rate is ops per
+  second of the best of several repeats.  --save stores the results as a baseline; --baseline
+  compares against a stored baseline and exits with status 1 if any rate dropped by more than
+  the threshold.
+
+  usage: envdir etc/txtrader python -m txtrader.benchmark [--quick] [--save FILE] [--baseline FILE] [NAME...]
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+
+import gc
+import os
+import sys
+import shutil
+import tempfile
+import platform
+import threading
+import timeit
+import ujson as json
+from collections import deque
+
+from twisted.protocols.basic import NetstringReceiver
+from twisted.internet import reactor
+from twisted.internet.protocol import ClientFactory
+
+from txtrader.version import VERSION
+from txtrader.rtx import API_Order, API_Callback, RTX_LocalCallback
+from txtrader.replay import ReplayRTX, ReplayProtocol
+from txtrader.simulator import GatewaySimulator, TICK_INTERVAL
+from txtrader.monitor import Monitor, StatusClient, StatusClientFactory
+from txtrader.tcpserver import tcpserver, serverFactory
+from txtrader.webserver import webServerFactory
+from txtrader.client import API as ClientAPI, requests_retry_session
+from txtrader.events import ENCODINGS
+from txtrader.quotetable import QuoteTable, QuoteReader
+
+ACCOUNT = 'BENCH.TEST.BENCH.1'
+ROUTE = 'BENCH'
+SYMBOLS = ['IBM', 'AAPL', 'MSFT', 'GOOG', 'TSLA', 'INTC', 'CSCO', 'ORCL', 'AMZN', 'NFLX']
+
+REPEAT = 3
+
+# suborder rows applied to each order by the order.update benchmark
+ORDER_UPDATE_ROWS = 10
+DEFAULT_THRESHOLD = 0.15
+
+
+class NullTransport(object):
+    """transport for benchmark client protocols; output is discarded"""
+    disconnecting = False
+
+    def write(self, data):
+        pass
+
+    def writeSequence(self, data):
+        pass
+
+    def getPeer(self):
+        return None
+
+    def loseConnection(self):
+        pass
+
+
+class RoundTripClient(NetstringReceiver):
+    """sends the next command as soon as the response to the previous one arrives"""
+
+    def __init__(self):
+        self.responses = []
+        self.remaining = 0
+
+    def connectionMade(self):
+        self.factory.client = self
+
+    def stringReceived(self, data):
+        self.responses.append(data)
+        if self.remaining:
+            self.remaining -= 1
+            self.sendString('status')
+
+
+class RoundTripFactory(ClientFactory):
+    protocol = RoundTripClient
+    client = None
+
+
+class GatewayLink(object):
+    """in-memory connection between an RTX and a GatewaySimulator protocol
+
+    Lines are queued in both directions and delivered by pump(), so neither side is re-entered
+    while it is still sending, as with a socket.  With capture set, lines from the simulator are
+    collected instead of being passed to the RTX.
+    """
+
+    def __init__(self, api, simulator):
+        self.api = api
+        self.capture = False
+        self.captured = []
+        self.buffer = ''
+        self.disconnecting = False
+        self.to_gateway = deque()
+        self.from_gateway = deque()
+        self.gateway = simulator.buildProtocol(None)
+        api.gateway_connect(ReplayProtocol(self.to_gateway.append))
+        self.gateway.makeConnection(self)
+        self.pump()
+
+    def write(self, data):
+        lines = (self.buffer + data).split('\n')
+        self.buffer = lines.pop()
+        self.from_gateway.extend(lines)
+
+    def writeSequence(self, data):
+        self.write(''.join(data))
+
+    def getPeer(self):
+        return None
+
+    def getHost(self):
+        return None
+
+    def loseConnection(self):
+        pass
+
+    def pump(self):
+        while self.to_gateway or self.from_gateway:
+            while self.to_gateway:
+                self.gateway.dataReceived(self.to_gateway.popleft())
+            while self.from_gateway:
+                line = self.from_gateway.popleft()
+                if self.capture:
+                    self.captured.append(line)
+                else:
+                    self.api.gateway_receive(line)
+
+    def call(self, f, *args):
+        """call f and deliver the resulting traffic"""
+        ret = f(*args)
+        self.pump()
+        return ret
+
+    def collect(self, f, *args):
+        """call f with the simulator output captured; return the captured lines"""
+        self.capture = True
+        self.captured = []
+        try:
+            self.call(f, *args)
+        finally:
+            self.capture = False
+        return self.captured
+
+
+class BenchRTX(ReplayRTX):
+    """RTX configured for repeatable benchmarks regardless of the envdir switches"""
+
+    def __init__(self):
+        ReplayRTX.__init__(self)
+        self.repeater.stop()
+        self.enable_ticker = True
+        self.enable_high_low = True
+        self.enable_seconds_tick = False
+        self.log_api_messages = False
+        self.debug_api_messages = False
+        self.log_client_messages = False
+        self.log_order_updates = False
+        self.tick_capture = None
+        self.quote_table = None
+        self.gateway_recorder = None
+        self.set_order_route(ROUTE, None)
+
+    def output(self, msg):
+        pass
+
+
+class Benchmark(object):
+    def __init__(self, quick=False, output=None):
+        self.quick = quick
+        self.output = output or (lambda msg: None)
+        self.results = {}
+        self.api = BenchRTX()
+        self.simulator = GatewaySimulator([ACCOUNT], rate=20.0, seed=1, output=lambda msg: None)
+        self.link = GatewayLink(self.api, self.simulator)
+        for symbol in SYMBOLS:
+            self.link.call(self.api.symbol_enable, symbol, 'bench', RTX_LocalCallback(self.api, lambda data: None))
+        for i, symbol in enumerate(SYMBOLS):
+            self.link.call(self.api.market_order, ACCOUNT, ROUTE, symbol, 100 * (i + 1), RTX_LocalCallback(self.api, lambda data: None))
+        if self.api.connection_status != 'Up' or len(self.api.symbols) != len(SYMBOLS):
+            raise Exception('benchmark setup failed: status=%s symbols=%d' % (self.api.connection_status, len(self.api.symbols)))
+
+    def size(self, full, quick):
+        return quick if self.quick else full
+
+    def measure(self, name, unit, ops, setup, run):
+        """time run() REPEAT times, calling setup() before each, and record the best rate"""
+        best = None
+        for i in range(REPEAT):
+            args = setup()
+            gc.collect()
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                start = timeit.default_timer()
+                run(*args)
+                elapsed = timeit.default_timer() - start
+            finally:
+                if gc_enabled:
+                    gc.enable()
+            if best is None or elapsed < best:
+                best = elapsed
+        best = max(best, 1e-9)
+        self.results[name] = {'ops': ops, 'seconds': best, 'rate': ops / best, 'unit': unit}
+        self.output('%-28s %12.1f %s/s' % (name, ops / best, unit))
+
+    # gateway_receive
+
+    def quote_updates(self, count):
+        self.simulator.rate = float(count) / (len(SYMBOLS) * TICK_INTERVAL)
+        lines = self.link.collect(self.simulator.tick)
+        return [l for l in lines if '"update"' in l]
+
+    def bench_gateway_receive_update(self):
+        lines = self.quote_updates(self.size(50000, 5000))
+        api = self.api
+
+        def run():
+            for line in lines:
+                api.gateway_receive(line)
+
+        self.measure('gateway_receive.update', 'msgs', len(lines), lambda: (), run)
+
+    def order_rows(self):
+        cxn = self.api.cxn_get('ACCOUNT_GATEWAY', 'ORDER')
+        lines = self.link.collect(cxn.request, 'ORDERS', '*', '', API_Callback(self.api, 0, 'bench', RTX_LocalCallback(self.api, lambda data: None)))
+        for line in lines:
+            self.api.gateway_receive(line)
+        return [json.loads(l)['data']['row'] for l in lines if '"response"' in l]
+
+    def bench_gateway_receive_response(self):
+        rows = self.order_rows()
+        rows = (rows * (self.size(20000, 2000) / len(rows) + 1))[:self.size(20000, 2000)]
+        api = self.api
+
+        def setup():
+            cxn = api.cxn_get('ACCOUNT_GATEWAY', 'ORDER')
+            ack = self.link.collect(cxn.request, 'ORDERS', '*', '', API_Callback(api, 0, 'bench', RTX_LocalCallback(api, lambda data: None)))[0]
+            api.gateway_receive(ack)
+            last = len(rows) - 1
+            return ([json.dumps({'type': 'response', 'id': cxn.id, 'data': {'row': row, 'complete': i == last}}) for i, row in enumerate(rows)],)
+
+        def run(lines):
+            for line in lines:
+                api.gateway_receive(line)
+
+        self.measure('gateway_receive.response', 'msgs', len(rows), setup, run)
+
+    def bench_gateway_receive_status(self):
+        advise = [c for c in self.api.active_cxn.values() if c.update_handler == self.api.handle_order_update][0]
+        count = self.size(50000, 5000)
+        lines = [json.dumps({'type': 'status', 'id': advise.id, 'data': {'msg': 'OnOtherAck', 'status': '1'}})] * count
+        api = self.api
+
+        def run():
+            for line in lines:
+                api.gateway_receive(line)
+
+        self.measure('gateway_receive.status', 'msgs', count, lambda: (), run)
+
+    # market data
+
+    def bench_parse_fields(self):
+        rows = [json.loads(l)['data']['row'] for l in self.quote_updates(self.size(50000, 5000))]
+        symbol = self.api.symbols[SYMBOLS[0]]
+
+        def run():
+            for row in rows:
+                symbol.parse_fields(None, row)
+
+        self.measure('parse_fields', 'rows', len(rows), lambda: (), run)
+
+    def bench_write_all_clients(self):
+        api = self.api
+        encodings = [None] + ENCODINGS
+        for encoding in encodings:
+            for clients in [1, 10, 100]:
+                count = self.size(100000, 10000) / clients
+
+                def setup():
+                    api.clients = set([self.client(encoding) for i in range(clients)])
+                    return ()
+
+                def run():
+                    for i in xrange(count):
+                        api.WriteAllClients('quote.IBM:131.2 300 131.22 500', ('IBM', 131.2, 300, 131.22, 500))
+
+                name = 'write_all_clients.%s%d' % ('%s.' % encoding if encoding else '', clients)
+                self.measure(name, 'msgs', count, setup, run)
+        api.clients = set([])
+
+    def client(self, encoding):
+        # both encodings go through the same client protocol, so their numbers are comparable
+        client = tcpserver()
+        client.transport = NullTransport()
+        client.encoding = encoding
+        return client
+
+    # orders
+
+    def filled_order(self):
+        return [o for o in self.api.orders.values() if o.is_filled()][0]
+
+    def bench_order_update(self):
+        template = self.filled_order()
+        count = self.size(20000, 2000)
+        rows = []
+        for i in range(ORDER_UPDATE_ROWS):
+            row = dict(template.suborders.values()[0])
+            row['ORDER_ID'] = 'BENCH%08d' % i
+            row['TYPE'] = 'ExchangeTradeOrder'
+            row['VOLUME_TRADED'] = '%d' % i
+            rows.append(row)
+
+        def setup():
+            return ([API_Order(self.api, template.oid, dict(template.fields)) for i in range(count / ORDER_UPDATE_ROWS)],)
+
+        def run(orders):
+            for order in orders:
+                for row in rows:
+                    order.update(row)
+
+        self.measure('order.update', 'rows', count, setup, run)
+
+    def bench_order_render(self):
+        order = self.filled_order()
+        count = self.size(100000, 10000)
+
+        def run():
+            for i in xrange(count):
+                order.render()
+
+        self.measure('order.render', 'orders', count, lambda: (), run)
+
+    def bench_format_orders(self):
+        template = self.filled_order()
+        saved = self.api.orders
+        try:
+            for count in [self.size(10000, 1000), self.size(100000, 5000)]:
+                self.api.orders = {}
+                for i in range(count):
+                    oid = 'BENCH%08d' % i
+                    order = API_Order(self.api, oid, dict(template.fields))
+                    order.updates = list(template.updates)
+                    order.suborders = dict(template.suborders)
+                    self.api.orders[oid] = order
+
+                def run():
+                    API_Callback(self.api, 0, 'orders', RTX_LocalCallback(self.api, None)).format_results([])
+
+                self.measure('format_orders.%d' % count, 'orders', count, lambda: (), run)
+        finally:
+            self.api.orders = saved
+
+    # monitor
+
+    def bench_monitor_dispatch(self):
+        callbacks = dict([(t, lambda label, data: True) for t in ['status', 'error', 'time', 'order', 'execution', 'quote', 'trade', 'tick', 'shutdown']])
+        monitor = Monitor(callbacks=callbacks)
+        client = StatusClient()
+        client.factory = StatusClientFactory(monitor)
+        client.stringReceived('.Authorized rtx')
+        messages = [
+            'rtx.quote.IBM:131.2 300 131.22 500',
+            'rtx.trade.IBM:131.21 100 1234500',
+            'rtx.quote.AAPL:210.5 100 210.52 200',
+            'rtx.trade.AAPL:210.51 200 2345600',
+            'rtx.order.SIM00000001 %s ExchangeTradeOrder Filled' % ACCOUNT,
+            'rtx.time: 2018-08-30 14:37:00',
+            'rtx.current-account: %s' % ACCOUNT,
+            'rtx.connection-status-changed: Up',
+        ]
+        count = self.size(100000, 10000)
+        messages = (messages * (count / len(messages) + 1))[:count]
+
+        def run():
+            for msg in messages:
+                client.stringReceived(msg)
+
+        self.measure('monitor.dispatch', 'msgs', count, lambda: (), run)
+
+    def bench_quote_table(self):
+        directory = tempfile.mkdtemp(prefix='txtrader-bench-')
+        try:
+            path = os.path.join(directory, 'quotes')
+            table = QuoteTable(path)
+            symbols = [self.api.symbols[s] for s in SYMBOLS]
+            slots = [(table.slot(s.symbol), s) for s in symbols]
+            count = self.size(100000, 10000)
+
+            def publish():
+                for i in xrange(count / len(slots)):
+                    for slot, symbol in slots:
+                        table.publish(slot, symbol)
+
+            self.measure('quote_table.publish', 'updates', count / len(slots) * len(slots), lambda: (), publish)
+            reader = QuoteReader(path)
+
+            def snapshot():
+                for i in xrange(count / len(SYMBOLS)):
+                    for symbol in SYMBOLS:
+                        reader.snapshot(symbol)
+
+            self.measure('quote_table.snapshot', 'reads', count / len(SYMBOLS) * len(SYMBOLS), lambda: (), snapshot)
+            reader.close()
+            table.close()
+        finally:
+            shutil.rmtree(directory)
+
+    # sockets
+
+    def bench_client(self):
+        port = reactor.listenTCP(0, webServerFactory(self.api), interface='127.0.0.1')
+        client = ClientAPI(self.api.channel)
+        client.url = 'http://127.0.0.1:%d' % port.getHost().port
+        client.session.auth = (self.api.username, self.api.password)
+        count = self.size(2000, 200)
+
+        def new_session():
+            # the client before pooling: a new session, adapter and connection for every call
+            for i in xrange(count):
+                r = requests_retry_session(retries=client.get_retries, backoff_factor=client.get_backoff_factor).get(
+                    '%s/status' % client.url, auth=client.session.auth)
+                r.json()
+                r.close()
+
+        def session():
+            for i in xrange(count):
+                client.status()
+
+        try:
+            self.measure('client.new_session', 'calls', count, lambda: (), lambda: self.in_thread(new_session))
+            self.measure('client.session', 'calls', count, lambda: (), lambda: self.in_thread(session))
+        finally:
+            client.session.close()
+            port.stopListening()
+            self.iterate(lambda: True)
+
+    def in_thread(self, func):
+        """run a blocking client function in a thread, iterating the reactor until it returns"""
+        thread = threading.Thread(target=func)
+        thread.start()
+        # block in the reactor's poll between events, leaving the GIL to the client thread
+        self.iterate(lambda: not thread.is_alive(), 0.001)
+
+    def bench_roundtrip(self):
+        directory = tempfile.mkdtemp(prefix='txtrader-bench-')
+        try:
+            factory = serverFactory(self.api)
+            port = reactor.listenTCP(0, factory, interface='127.0.0.1')
+            self.roundtrips('roundtrip.tcp', port, lambda f: reactor.connectTCP('127.0.0.1', port.getHost().port, f))
+            path = os.path.join(directory, 'tcp.sock')
+            port = reactor.listenUNIX(path, factory)
+            self.roundtrips('roundtrip.unix', port, lambda f: reactor.connectUNIX(path, f))
+        finally:
+            shutil.rmtree(directory)
+
+    def roundtrips(self, name, port, connect):
+        factory = RoundTripFactory()
+        connect(factory)
+        client = self.iterate(lambda: factory.client)
+        client.sendString('auth %s %s' % (self.api.username, self.api.password))
+        self.iterate(lambda: client.responses)
+        count = self.size(20000, 2000)
+
+        def run():
+            client.remaining = count - 1
+            client.sendString('status')
+            self.iterate(lambda: len(client.responses) > count)
+            del client.responses[1:]
+
+        try:
+            self.measure(name, 'roundtrips', count, lambda: (), run)
+        finally:
+            client.transport.loseConnection()
+            port.stopListening()
+            self.iterate(lambda: not self.api.clients)
+
+    def iterate(self, done, delay=0):
+        """run the reactor by hand until done() returns true, then return its value"""
+        while not done():
+            reactor.iterate(delay)
+        return done()
+
+    def run(self, names=None):
+        """run the benchmarks selected by name prefix (all if names is empty), returning the results"""
+        for attr in sorted(dir(self)):
+            if attr.startswith('bench_'):
+                bench = attr[6:]
+                selected = [n for n in names or [] if bench.startswith(n.replace('.', '_')) or n.replace('.', '_').startswith(bench)]
+                if selected or not names:
+                    getattr(self, attr)()
+        return self.results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """return {name: ratio} for results slower than baseline by more than threshold"""
+    regressions = {}
+    for name, result in results.items():
+        if name in baseline and baseline[name]['rate']:
+            ratio = result['rate'] / baseline[name]['rate']
+            if ratio < 1.0 - threshold:
+                regressions[name] = ratio
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='TxTrader hot path benchmarks')
+    parser.add_argument('names', nargs='*', help='run only benchmarks whose name starts with NAME')
+    parser.add_argument('--quick', action='store_true', help='smaller data sets')
+    parser.add_argument('--save', help='write results to FILE for use as a baseline')
+    parser.add_argument('--baseline', help='compare results with baseline FILE')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='allowed fractional slowdown')
+    options = parser.parse_args()
+
+    bench = Benchmark(options.quick, lambda msg: sys.stderr.write('%s\n' % msg))
+    results = bench.run(options.names)
+    report = {'version': VERSION, 'python': platform.python_version(), 'quick': options.quick, 'results': results}
+
+    status = 0
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('quick') != options.quick:
+            sys.stderr.write('baseline %s was %s a --quick run\n' % (options.baseline, 'made with' if baseline.get('quick') else 'not'))
+            sys.exit(2)
+        baseline = baseline['results']
+        regressions = compare(results, baseline, options.threshold)
+        report['baseline'] = options.baseline
+        report['regressions'] = regressions
+        for name in sorted(results):
+            if name in baseline:
+                sys.stderr.write('%-28s %6.2fx%s\n' % (name, results[name]['rate'] / baseline[name]['rate'], ' REGRESSION' if name in regressions else ''))
+        status = 1 if regressions else 0
+    if options.save:
+        with open(options.save, 'w') as f:
+            f.write(json.dumps(report, indent=2))
+    print(json.dumps(report, indent=2))
+    sys.exit(status)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+  benchmark_test.py
+  -----------------
+
+  TxTrader benchmark suite unit test script
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+from txtrader import benchmark
+
+import os
+import pytest
+
+
+def test_compare():
+    baseline = {'a': {'rate': 100.0}, 'b': {'rate': 100.0}, 'c': {'rate': 100.0}}
+    results = {'a': {'rate': 90.0}, 'b': {'rate': 50.0}, 'c': {'rate': 200.0}, 'd': {'rate': 1.0}}
+    assert benchmark.compare(results, baseline, 0.15) == {'b': 0.5}
+
+
+@pytest.mark.skipif('TXTRADER_API_HOST' not in os.environ, reason='needs the etc/txtrader environment (envdir)')
+def test_quick_run(monkeypatch):
+    monkeypatch.setattr(benchmark, 'REPEAT', 1)
+    results = benchmark.Benchmark(quick=True).run(['gateway_receive.update', 'order', 'monitor'])
+    assert sorted(results.keys()) == ['gateway_receive.update', 'monitor.dispatch', 'order.render', 'order.update']
+    for result in results.values():
+        assert result['ops'] > 0 and result['rate'] > 0
@@ -19,6 +19,7 @@ import json
 
 from txtrader.version import VERSION
 from txtrader.config import Config
+from txtrader.quotetable import QuoteReader
 
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
@@ -28,7 +29,13 @@ def requests_retry_session(
     backoff_factor=0.3,
     status_forcelist=(502, 504),
     session=None,
+    pool_size=10,
 ):
+    """return a session with retries and a keep-alive pool of up to pool_size connections per host
+
+    Read errors and forced statuses are only retried for idempotent methods; a POST is retried
+    only if it could not connect.
+    """
     session = session or requests.Session()
     retry = Retry(
         total=retries,
@@ -37,11 +44,17 @@ def requests_retry_session(
         backoff_factor=backoff_factor,
         status_forcelist=status_forcelist,
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     return session
 
+
+def order_filters(status, symbol, account, since, fields):
+    """query_orders and query_executions parameters: lists are sent comma separated, unset filters are left out"""
+    args = {'status': status, 'symbol': symbol, 'account': account, 'since': since, 'fields': fields}
+    return dict([(k, ','.join(v) if isinstance(v, list) else v) for k, v in args.items() if v])
+
 class API(object):
     def __init__(self, server):
         self.server = server
@@ -55,9 +68,15 @@ class API(object):
         self.mode = self.config.get('MODE')
         self.get_retries = int(self.config.get('GET_RETRIES'))
         self.get_backoff_factor = float(self.config.get('GET_BACKOFF_FACTOR'))
+        self.http_pool_size = int(self.config.get('HTTP_POOL_SIZE'))
 
         self.url = 'http://%s:%s' % (self.hostname, self.port)
 
+        # one keep-alive session for all calls; connections are reused instead of reopened per call
+        self.session = requests_retry_session(retries=self.get_retries, backoff_factor=self.get_backoff_factor, pool_size=self.http_pool_size)
+        self.session.auth = (self.username, self.password)
+        self.session.headers['Content-type'] = 'application/json'
+
         self.cmdmap = {
             'help': (self.help, False, ()),
             'status': (self.status, False, ()),
@@ -65,11 +84,14 @@ class API(object):
             'time': (self.time, False, ()),
             'shutdown': (self.shutdown, False, ('message')),
             'uptime': (self.uptime, False, ()),
+            'query_clients': (self.query_clients, False, ()),
+            'log_levels': (self.log_levels, False, ('level', 'levels', 'sample')),
             'query_bars': (self.query_bars, True, ('symbol', 'interval', 'start_time', 'end_time')),
             'add_symbol': (self.add_symbol, True, ('symbol',)),
             'del_symbol': (self.del_symbol, True, ('symbol',)),
             'query_symbol': (self.query_symbol, True, ('symbol',)),
             'query_symbol_data': (self.query_symbol_data, True, ('symbol',)),
+            'query_symbols_data': (self.query_symbols_data, True, ('symbols', 'fields')),
             'query_symbols': (self.query_symbols, True, ()),
             'set_account': (self.set_account, False, ('account',)),
             'set_order_route': (self.set_order_route, True, ('route',)),
@@ -77,10 +99,10 @@ class API(object):
             'query_accounts': (self.query_accounts, False, ()),
             'query_account': (self.query_account, True, ('account', 'fields')),
             'query_positions': (self.query_positions, True, ()),
-            'query_orders': (self.query_orders, True, ()),
+            'query_orders': (self.query_orders, True, ('status', 'symbol', 'account', 'since', 'fields')),
             'query_order': (self.query_order, True, ('order_id',)),
             'cancel_order': (self.cancel_order, True, ('order_id',)),
-            'query_executions': (self.query_executions, True, ()),
+            'query_executions': (self.query_executions, True, ('status', 'symbol', 'account', 'since', 'fields')),
             'market_order': (self.market_order, True, ('symbol', 'quantity')),
             'create_staged_order_ticket': (self.create_staged_order_ticket, True, ()),
             'stage_market_order': (self.stage_market_order, True, ('tag', 'symbol', 'quantity')),
@@ -106,9 +128,7 @@ class API(object):
     def call_txtrader_post(self, function_name, args):
         #print('call_txtrader_post(%s, %s)' % (repr(function_name), repr(args)))
         url = '%s/%s' % (self.url, function_name)
-        headers = {'Content-type': 'application/json'}
-        r = requests.post(url, json=args, headers=headers,
-                          auth=(self.username, self.password))
+        r = self.session.post(url, json=args)
         if r.status_code != requests.codes.ok:
             r.raise_for_status()
         ret = r.json()
@@ -117,9 +137,7 @@ class API(object):
 
     def call_txtrader_get(self, function_name, args):
         url = '%s/%s' % (self.url, function_name)
-        headers = {'Content-type': 'application/json'}
-        r = requests_retry_session(retries=self.get_retries, backoff_factor=self.get_backoff_factor).get(url, params=args, headers=headers,
-                          auth=(self.username, self.password))
+        r = self.session.get(url, params=args)
         if r.status_code != requests.codes.ok:
             r.raise_for_status()
         ret = r.json()
@@ -150,6 +168,13 @@ class API(object):
     def time(self, *args):
         return self.call_txtrader_get('time', {})
 
+    def query_clients(self, *args):
+        return self.call_txtrader_get('query_clients', {})
+
+    def log_levels(self, level=None, levels=None, sample=None):
+        """return the server's log settings, first changing those given"""
+        return self.call_txtrader_get('log_levels', {'level': level, 'levels': levels, 'sample': sample})
+
     def query_bars(self, *args):
         args = {
             'symbol': args[0],
@@ -174,6 +199,25 @@ class API(object):
     def query_symbol_data(self, *args):
         return self.call_txtrader_get('query_symbol_data', {'symbol': args[0]})
 
+    def query_symbols_data(self, symbols=None, fields=None):
+        """symbols and fields are lists or comma separated strings; None for all"""
+        return self.call_txtrader_get('query_symbols_data', {
+            'symbols': ','.join(symbols) if isinstance(symbols, list) else symbols or '',
+            'fields': ','.join(fields) if isinstance(fields, list) else fields or '',
+        })
+
+    def batch(self, commands):
+        """run [(command, {args}), ...] in one request; return the results in order, raising if any command failed"""
+        results = self.call_txtrader_post('batch', [{'command': c, 'args': a} for c, a in commands])
+        errors = ['%s: %s' % (commands[i][0], r['error']) for i, r in enumerate(results) if 'error' in r]
+        if errors:
+            raise Exception('Error: batch failed: %s' % '; '.join(errors))
+        return [r['result'] for r in results]
+
+    def quote_reader(self):
+        """return a QuoteReader on the server's quote table; only on the server host, with TXTRADER_ENABLE_QUOTE_TABLE set"""
+        return QuoteReader(self.config.get('QUOTE_TABLE_FILE'))
+
     def query_accounts(self, *args):
         return self.call_txtrader_get('query_accounts', {})
 
@@ -200,8 +244,9 @@ class API(object):
     def query_positions(self, *args):
         return self.call_txtrader_get('query_positions', {})
 
-    def query_orders(self, *args):
-        return self.call_txtrader_get('query_orders', {})
+    def query_orders(self, status=None, symbol=None, account=None, since=None, fields=None):
+        """status, symbol, account and fields are lists or comma separated strings; None for all"""
+        return self.call_txtrader_get('query_orders', order_filters(status, symbol, account, since, fields))
 
     def query_order(self, *args):
         return self.call_txtrader_get('query_order', {'id': args[0]})
@@ -209,8 +254,9 @@ class API(object):
     def cancel_order(self, *args):
         return self.call_txtrader_post('cancel_order', {'id': args[0]})
 
-    def query_executions(self, *args):
-        return self.call_txtrader_get('query_executions', {})
+    def query_executions(self, status=None, symbol=None, account=None, since=None, fields=None):
+        """filters as for query_orders"""
+        return self.call_txtrader_get('query_executions', order_filters(status, symbol, account, since, fields))
 
     def create_staged_order_ticket(self, *args):
         return self.call_txtrader_post('create_staged_order_ticket', {})
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  events.py
+  ---------
+
+  TxTrader client event module - events written to the TCP clients and their wire encodings.
+
+  By default each event is sent as the text netstring '<channel>.<message>'.  A client may
+  request the binary encoding at auth time ('auth USER PASS encoding=binary'); each event is
+  then sent as one fixed layout frame, packed once and shared by every binary client.  Frames
+  are netstrings in network byte order, starting with a one byte frame type:
+
+    TEXT       B + text                       any other event, and command responses
+    SYMBOL     B H(sid) + symbol              symbol id definition, sent before its first use
+    QUOTE      B H(sid) d(bid) I(bidsize) d(ask) I(asksize)
+    TRADE      B H(sid) d(last) I(size) Q(volume)
+    ORDER      B + json [permid, fields]      fields is a list (rtx) or an object (tws)
+    EXECUTION  B + json [id, fields]
+    TIME       B + 'YYYY-MM-DD HH:MM:SS'
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+
+import json
+import marshal
+import struct
+from collections import deque
+
+TEXT, SYMBOL, QUOTE, TRADE, ORDER, EXECUTION, TIME = range(7)
+
+ENCODINGS = ['binary']
+
+CATEGORY_PREFIXES = (
+    ('quote.', 'quote'),
+    ('trade.', 'trade'),
+    ('order.', 'order'),
+    ('open-order.', 'order'),
+    ('execution.', 'execution'),
+    ('time:', 'time'),
+    ('error', 'error'),
+)
+
+CATEGORIES = ['quote', 'trade', 'order', 'execution', 'time', 'status', 'error']
+
+# client filter flags, each excluding one category
+FILTER_FLAGS = {
+    'noquotes': 'quote',
+    'notrades': 'trade',
+    'noorders': 'order',
+    'noexecutions': 'execution',
+    'notime': 'time',
+    'nostatus': 'status',
+    'noerrors': 'error',
+}
+
+# categories conflated to the latest event per symbol while a client is paused
+CONFLATED_CATEGORIES = ('quote', 'trade')
+
+FRAME_TYPES = {'quote': QUOTE, 'trade': TRADE, 'order': ORDER, 'execution': EXECUTION, 'time': TIME}
+
+HEADER = struct.Struct('!B')
+SYMBOL_HEADER = struct.Struct('!BH')
+QUOTE_FRAME = struct.Struct('!BHdIdI')
+TRADE_FRAME = struct.Struct('!BHdIQ')
+
+
+def classify(msg):
+    """return the event category of a client message (without the channel prefix)"""
+    for prefix, category in CATEGORY_PREFIXES:
+        if msg.startswith(prefix):
+            return category
+    return 'status'
+
+
+def text_frame(text):
+    return HEADER.pack(TEXT) + text
+
+
+class SymbolTable(object):
+    """symbol ids used by the binary encoding; ids are never reused while the server runs"""
+
+    def __init__(self):
+        self.ids = {}
+
+    def sid(self, symbol):
+        if symbol not in self.ids:
+            self.ids[symbol] = len(self.ids)
+        return self.ids[symbol]
+
+
+class Event(object):
+    """a client event; the binary frame is packed at most once however many clients receive it"""
+
+    def __init__(self, channel, msg, data=None, symbols=None):
+        self.msg = msg
+        self.text = str('%s.%s' % (channel, msg))
+        self.category = classify(msg)
+        self.data = data
+        self.frame_type = FRAME_TYPES.get(self.category, TEXT) if data is not None else TEXT
+        self.sid = symbols.sid(data[0]) if self.frame_type in (QUOTE, TRADE) else None
+        self.frame = None
+        self.relay = None
+        # the Server-Sent Events message, built by sseserver for the first SSE client
+        self.sse = None
+
+    def encode(self):
+        if self.frame is None:
+            try:
+                if self.frame_type == QUOTE:
+                    self.frame = QUOTE_FRAME.pack(QUOTE, self.sid, *self.data[1:])
+                elif self.frame_type == TRADE:
+                    self.frame = TRADE_FRAME.pack(TRADE, self.sid, *self.data[1:])
+                elif self.frame_type in (ORDER, EXECUTION):
+                    self.frame = HEADER.pack(self.frame_type) + json.dumps(self.data)
+                elif self.frame_type == TIME:
+                    self.frame = HEADER.pack(TIME) + self.data
+            except (struct.error, TypeError, ValueError):
+                pass
+            if self.frame is None:
+                self.frame = text_frame(self.text)
+        return self.frame
+
+    def symbol_frame(self):
+        """the definition of the event's symbol id, for clients that have not been sent it yet"""
+        return SYMBOL_HEADER.pack(SYMBOL, self.sid) + self.data[0]
+
+    def relay_frame(self):
+        """the event as sent to fan-out worker processes, marshalled at most once; see relay_event"""
+        if self.relay is None:
+            try:
+                self.relay = marshal.dumps((self.msg, self.data))
+            except ValueError:
+                self.relay = marshal.dumps((self.msg, None))
+        return self.relay
+
+
+def relay_event(channel, frame, symbols):
+    """rebuild an event from its relay frame in a fan-out worker process"""
+    msg, data = marshal.loads(frame)
+    return Event(channel, msg, data, symbols)
+
+
+class EventSubscriber(object):
+    """client protocol mixin: flow control of the event stream
+
+    The protocol registers itself as a push producer with its transport.  While the transport
+    is paused (its write buffer is full), events are queued instead of written: quotes and
+    trades are conflated to the latest event per symbol, everything else is kept in order.  A
+    client whose queue grows past the high-water mark is disconnected.  Events in categories
+    the client has filtered out are discarded before they are queued or encoded.  The protocol
+    class provides transmit_event(event) to write an event to the transport.
+    """
+
+    encoding = None
+    paused = False
+    high_water = 0
+
+    def init_events(self):
+        self.queue = deque()
+        self.latest = {}
+        self.sent_symbols = set([])
+        self.excluded = set([])
+        self.event_stats = {'max_queued': 0, 'dropped': 0, 'pauses': 0, 'disconnected': False}
+
+    def start_events(self, high_water):
+        self.high_water = high_water
+        self.transport.registerProducer(self, True)
+
+    def set_filter(self, flags):
+        """exclude the categories named by the filter flags; other words are ignored"""
+        self.excluded = set([FILTER_FLAGS[f] for f in flags if f in FILTER_FLAGS])
+
+    def send_event(self, event):
+        if event.category in self.excluded:
+            return
+        if self.paused or self.queue:
+            self.queue_event(event)
+        else:
+            self.transmit_event(event)
+
+    def queue_event(self, event):
+        if event.data is not None and event.category in CONFLATED_CATEGORIES:
+            key = (event.category, event.data[0])
+            if key in self.latest:
+                self.latest[key] = event
+                self.event_stats['dropped'] += 1
+                return
+            self.latest[key] = event
+            self.queue.append(key)
+        else:
+            self.queue.append(event)
+        if len(self.queue) > self.event_stats['max_queued']:
+            self.event_stats['max_queued'] = len(self.queue)
+            if self.high_water and len(self.queue) > self.high_water:
+                self.slow_consumer()
+
+    def slow_consumer(self):
+        self.event_stats['disconnected'] = True
+        self.stopProducing()
+        if hasattr(self.transport, 'abortConnection'):
+            self.transport.abortConnection()
+        else:
+            self.transport.loseConnection()
+
+    def pauseProducing(self):
+        if not self.paused:
+            self.paused = True
+            self.event_stats['pauses'] += 1
+
+    def resumeProducing(self):
+        self.paused = False
+        while self.queue and not self.paused:
+            item = self.queue.popleft()
+            if isinstance(item, tuple):
+                item = self.latest.pop(item)
+            self.transmit_event(item)
+
+    def stopProducing(self):
+        self.paused = True
+        self.queue.clear()
+        self.latest.clear()
+
+    def peer_name(self):
+        peer = self.transport.getPeer()
+        return '%s:%s' % (peer.host, peer.port) if hasattr(peer, 'host') else str(peer)
+
+    def event_status(self):
+        """return flow control status and counters for the client"""
+        status = dict(self.event_stats)
+        status['peer'] = self.peer_name()
+        status['encoding'] = self.encoding or 'text'
+        status['paused'] = self.paused
+        status['queued'] = len(self.queue)
+        status['categories'] = [c for c in CATEGORIES if c not in self.excluded]
+        return status
+
+
+def write_event(clients, event):
+    """send an event to each client in the encoding it negotiated"""
+    for c in clients:
+        if isinstance(c, EventSubscriber):
+            c.send_event(event)
+        else:
+            c.sendString(event.text)
+
+
+class Decoder(object):
+    """client side: turn received frames back into the text messages the server would have sent"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.symbols = {}
+
+    def decode(self, data):
+        """return the text message for a frame, or None for frames that carry no message"""
+        ftype = ord(data[0])
+        if ftype == TEXT:
+            return data[1:]
+        elif ftype == QUOTE:
+            t, sid, bid, bidsize, ask, asksize = QUOTE_FRAME.unpack(data)
+            return '%s.quote.%s:%s %d %s %d' % (self.channel, self.symbols[sid], bid, bidsize, ask, asksize)
+        elif ftype == TRADE:
+            t, sid, last, size, volume = TRADE_FRAME.unpack(data)
+            return '%s.trade.%s:%s %d %d' % (self.channel, self.symbols[sid], last, size, volume)
+        elif ftype == SYMBOL:
+            t, sid = SYMBOL_HEADER.unpack_from(data)
+            self.symbols[sid] = data[SYMBOL_HEADER.size:]
+            return None
+        elif ftype == ORDER:
+            permid, fields = json.loads(data[1:])
+            if isinstance(fields, dict):
+                return str('%s.order.%s: %s' % (self.channel, permid, json.dumps(fields)))
+            return str('%s.order.%s %s' % (self.channel, permid, ' '.join(fields)))
+        elif ftype == EXECUTION:
+            eid, fields = json.loads(data[1:])
+            return str('%s.execution.%s: %s' % (self.channel, eid, json.dumps(fields)))
+        elif ftype == TIME:
+            return '%s.time: %s' % (self.channel, data[1:])
+        return None
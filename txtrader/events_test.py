@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+  events_test.py
+  --------------
+
+  TxTrader client event encoding unit test script
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+from txtrader.events import Event, SymbolTable, Decoder, write_event, classify, QUOTE
+from txtrader.tcpserver import serverFactory
+from txtrader.monitor import Monitor, StatusClient, StatusClientFactory
+from twisted.test import proto_helpers
+from twisted.protocols.basic import NetstringReceiver
+
+import json
+
+
+class API(object):
+    channel = 'rtx'
+    label = 'test api'
+    username = 'user'
+    password = 'pass'
+    client_high_water = 0
+
+    def __init__(self):
+        self.clients = set([])
+        self.event_symbols = SymbolTable()
+
+    def output(self, msg):
+        pass
+
+    def open_client(self, client):
+        self.clients.add(client)
+
+    def close_client(self, client):
+        self.clients.discard(client)
+
+    def query_connection_status(self):
+        return 'Up'
+
+    def WriteAllClients(self, msg, data=None):
+        write_event(self.clients, Event(self.channel, msg, data, self.event_symbols))
+
+
+class Reader(NetstringReceiver):
+    def __init__(self):
+        self.strings = []
+
+    def stringReceived(self, data):
+        self.strings.append(data)
+
+
+def connect(api, auth):
+    protocol = serverFactory(api).buildProtocol(('127.0.0.1', 0))
+    transport = proto_helpers.StringTransport()
+    protocol.makeConnection(transport)
+    protocol.dataReceived(auth)
+    return protocol, transport
+
+
+def received(transport):
+    reader = Reader()
+    reader.makeConnection(proto_helpers.StringTransport())
+    reader.dataReceived(transport.value())
+    transport.clear()
+    return reader.strings
+
+
+def netstring(s):
+    return '%d:%s,' % (len(s), s)
+
+
+EVENTS = [
+    ('quote.IBM:131.2 300 131.25 100', ('IBM', 131.2, 300, 131.25, 100)),
+    ('trade.IBM:131.21 100 1234500', ('IBM', 131.21, 100, 1234500)),
+    ('quote.AAPL:210.5 100 210.52 200', ('AAPL', 210.5, 100, 210.52, 200)),
+    ('quote.IBM:131.22 200 131.25 100', ('IBM', 131.22, 200, 131.25, 100)),
+    ('order.SIM00000001 DEMO1.TEST.DEMO.1 ExchangeTradeOrder Filled', ('SIM00000001', ['DEMO1.TEST.DEMO.1', 'ExchangeTradeOrder', 'Filled'])),
+    ('order.1234: %s' % json.dumps({'permid': 1234, 'status': 'Filled'}), (1234, {'permid': 1234, 'status': 'Filled'})),
+    ('time: 2018-08-30 14:37:00', '2018-08-30 14:37:00'),
+    ('connection-status-changed: Up', None),
+    ('quote.BAD:None 0 None 0', ('BAD', None, 0, None, 0)),
+]
+
+
+def test_classify():
+    assert [classify(msg) for msg, data in EVENTS] == ['quote', 'trade', 'quote', 'quote', 'order', 'order', 'time', 'status', 'quote']
+    assert classify('error: API Disconnect') == 'error'
+    assert classify('open-order.1234: {}') == 'order'
+
+
+def test_encoding_negotiation():
+    api = API()
+    text, text_transport = connect(api, netstring('auth user pass'))
+    binary, binary_transport = connect(api, netstring('auth user pass encoding=binary'))
+    assert received(text_transport)[-1] == '.Authorized rtx'
+    assert received(binary_transport)[-1] == '.Authorized rtx binary'
+    assert (text.encoding, binary.encoding) == (None, 'binary')
+
+    for msg, data in EVENTS:
+        api.WriteAllClients(msg, data)
+    assert len(binary_transport.value()) < len(text_transport.value())
+    assert received(text_transport) == ['rtx.%s' % msg for msg, data in EVENTS]
+
+    frames = received(binary_transport)
+    decoder = Decoder('rtx')
+    decoded = [decoder.decode(frame) for frame in frames]
+    # symbol id definitions decode to None, once per symbol
+    assert decoded.count(None) == 3
+    assert [d for d in decoded if d is not None] == ['rtx.%s' % msg for msg, data in EVENTS]
+    assert len(frames[1]) < len('rtx.%s' % EVENTS[0][0])
+    assert ord(frames[1][0]) == QUOTE
+
+    # command responses are sent as text frames
+    binary.dataReceived(netstring('status'))
+    assert [decoder.decode(f) for f in received(binary_transport)] == ['.status: Up']
+
+
+def test_monitor_decodes_binary():
+    api = API()
+    server, transport = connect(api, '')
+    data = []
+    callbacks = dict([(t, lambda label, msg: data.append((label, msg)) or True) for t in ['status', 'quote', 'trade', 'order', 'time']])
+    # the text stream is the default
+    assert Monitor(user='user', password='pass', callbacks=callbacks).auth_flags() == 'noerrors noexecutions'
+    monitor = Monitor(user='user', password='pass', callbacks=callbacks, encoding='binary')
+    assert monitor.auth_flags() == 'noerrors noexecutions encoding=binary'
+    client = StatusClient()
+    client.factory = StatusClientFactory(monitor)
+    client.makeConnection(proto_helpers.StringTransport())
+
+    # relay the server's output to the monitor and the monitor's auth command to the server
+    client.dataReceived(transport.value())
+    transport.clear()
+    server.dataReceived(client.transport.value())
+    for msg, d in EVENTS[:5]:
+        api.WriteAllClients(msg, d)
+    client.dataReceived(transport.value())
+
+    assert data[1] == ('status', '.Authorized rtx binary')
+    assert data[2:] == [
+        ('quote', 'IBM:131.2 300 131.25 100'),
+        ('trade', 'IBM:131.21 100 1234500'),
+        ('quote', 'AAPL:210.5 100 210.52 200'),
+        ('quote', 'IBM:131.22 200 131.25 100'),
+        ('order', 'SIM00000001 DEMO1.TEST.DEMO.1 ExchangeTradeOrder Filled'),
+    ]
+
+
+def test_slow_consumer_conflation():
+    api = API()
+    server, transport = connect(api, netstring('auth user pass'))
+    received(transport)
+    server.pauseProducing()
+    for msg, data in EVENTS[:5]:
+        api.WriteAllClients(msg, data)
+    api.WriteAllClients('quote.IBM:131.23 200 131.25 100', ('IBM', 131.23, 200, 131.25, 100))
+    assert transport.value() == ''
+    status = server.event_status()
+    assert (status['paused'], status['queued'], status['dropped'], status['pauses']) == (True, 4, 2, 1)
+
+    server.resumeProducing()
+    assert received(transport) == [
+        'rtx.quote.IBM:131.23 200 131.25 100',
+        'rtx.trade.IBM:131.21 100 1234500',
+        'rtx.quote.AAPL:210.5 100 210.52 200',
+        'rtx.order.SIM00000001 DEMO1.TEST.DEMO.1 ExchangeTradeOrder Filled',
+    ]
+    assert server.event_status()['queued'] == 0
+
+
+def test_slow_consumer_disconnect():
+    api = API()
+    api.client_high_water = 2
+    server, transport = connect(api, netstring('auth user pass'))
+    server.pauseProducing()
+    for i in range(3):
+        api.WriteAllClients('order.%d DEMO1.TEST.DEMO.1 ExchangeTradeOrder Filled' % i, (i, ['DEMO1.TEST.DEMO.1', 'ExchangeTradeOrder', 'Filled']))
+    assert transport.disconnecting
+    assert server.event_status()['disconnected']
+
+
+def test_category_filter():
+    api = API()
+    server, transport = connect(api, netstring('auth user pass noquotes notrades'))
+    assert received(transport)[-1] == '.Authorized rtx'
+    for msg, data in EVENTS[:8]:
+        api.WriteAllClients(msg, data)
+    assert received(transport) == ['rtx.%s' % msg for msg, data in EVENTS[4:8]]
+
+    server.dataReceived(netstring('filter noorders nostatus'))
+    assert received(transport) == ['.filter: quote trade execution time error']
+    for msg, data in EVENTS[:8]:
+        api.WriteAllClients(msg, data)
+    assert received(transport) == ['rtx.%s' % msg for msg, data in EVENTS[:4] + EVENTS[6:7]]
+    assert server.event_status()['categories'] == ['quote', 'trade', 'execution', 'time', 'error']
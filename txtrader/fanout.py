@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  fanout.py
+  ---------
+
+  TxTrader fan-out module - serve the TCP clients from worker processes.
+
+  With TXTRADER_FANOUT_WORKERS set, the broker (the process running the API) opens the TCP
+  client port but does not accept on it.  It starts that many worker processes, which inherit
+  the listening socket and share its connections, so client I/O is spread across cores and
+  stays off the reactor that parses the API stream.
+
+  Each worker is connected to the broker by its stdin/stdout pipes, carrying netstrings:
+
+    broker -> worker   E<event>            an event, marshalled once for all workers
+                       S<cid> <event>      an event for worker client cid alone (a symbol snapshot)
+                       R<cid> <string>     a response for worker client cid
+                       D<cid>              disconnect client cid
+    worker -> broker   C<cid> <command>    a command from client cid
+                       L<cid>              client cid disconnected
+
+  Workers authenticate their clients and apply filters, encodings and flow control locally;
+  auth, filter, help and quit are answered by the worker, every other command is relayed to a
+  trusted tcpserver session in the broker.  Events reach each worker once, and each worker
+  writes them to its own clients; the events the broker sends to one session are passed on to
+  its client in the worker, which applies the client's filter and encoding to them too.  A
+  worker that exits is restarted.
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+
+import os
+import sys
+import socket
+
+from twisted.application import service
+from twisted.internet import reactor, stdio
+from twisted.internet.error import ProcessExitedAlready
+from twisted.internet.protocol import ProcessProtocol
+from twisted.protocols.basic import NetstringReceiver
+from twisted.python import log
+
+from txtrader.config import Config
+from txtrader.events import EventSubscriber, SymbolTable, relay_event, write_event
+from txtrader.tcpserver import tcpserver, serverFactory
+
+# commands answered by the worker; all others are relayed to the broker
+LOCAL_COMMANDS = ['auth', 'filter', 'help', 'quit', 'exit', 'bye']
+
+# the listening socket's descriptor in the worker
+LISTEN_FD = 3
+
+RESTART_DELAY = 1
+
+
+# broker side
+
+class RelayTransport(object):
+    """transport of a broker session: the client connection is in a worker"""
+
+    def __init__(self, link, cid):
+        self.link = link
+        self.cid = cid
+
+    def getPeer(self):
+        return 'fanout worker %s client %d' % (self.link.pid, self.cid)
+
+    def loseConnection(self):
+        self.link.sendString('D%d' % self.cid)
+
+
+class RelaySession(tcpserver):
+    """broker side of a worker client: runs its relayed commands and sends the responses back"""
+
+    def __init__(self, link, cid):
+        tcpserver.__init__(self)
+        self.link = link
+        self.cid = cid
+        self.factory = link.factory
+        self.transport = RelayTransport(link, cid)
+
+    def write_string(self, data):
+        self.link.sendString('R%d %s' % (self.cid, data))
+
+    def send_event(self, event):
+        # filtered, encoded and flow controlled by the client in the worker
+        self.link.sendString('S%d %s' % (self.cid, event.relay_frame()))
+
+
+class WorkerLink(EventSubscriber, NetstringReceiver):
+    """the broker's client for one worker process: relays events and commands over its pipes"""
+
+    def __init__(self, factory, pid):
+        self.factory = factory
+        self.pid = pid
+        self.sessions = {}
+        self.init_events()
+
+    def connectionMade(self):
+        # the worker is never disconnected as a slow consumer; quotes and trades are conflated
+        self.start_events(0)
+        self.factory.api.open_client(self)
+
+    def transmit_event(self, event):
+        self.sendString('E' + event.relay_frame())
+
+    def stringReceived(self, data):
+        if data.startswith('C'):
+            cid, line = (data[1:].split(' ', 1) + [''])[:2]
+            cid = int(cid)
+            if cid not in self.sessions:
+                self.sessions[cid] = RelaySession(self, cid)
+            self.sessions[cid].stringReceived(line)
+        elif data.startswith('L'):
+            session = self.sessions.pop(int(data[1:]), None)
+            if session:
+                session.connectionLost(None)
+
+    def connectionLost(self, reason):
+        self.factory.api.close_client(self)
+        for session in self.sessions.values():
+            session.connectionLost(reason)
+        self.sessions.clear()
+
+    def peer_name(self):
+        return 'fanout worker %s' % self.pid
+
+
+class WorkerProcess(ProcessProtocol):
+    def __init__(self, service):
+        self.service = service
+        self.link = None
+
+    def connectionMade(self):
+        self.link = WorkerLink(self.service.factory, self.transport.pid)
+        self.link.makeConnection(self.transport)
+        self.service.api.output('fanout worker %s started' % self.transport.pid)
+
+    def outReceived(self, data):
+        self.link.dataReceived(data)
+
+    def processEnded(self, reason):
+        self.service.api.output('fanout worker %s ended: %s' % (self.link.pid, reason.getErrorMessage()))
+        self.link.connectionLost(reason)
+        self.service.worker_ended(self)
+
+
+class FanoutService(service.Service):
+    """listen on the TCP client port and serve its connections from worker processes"""
+
+    def __init__(self, api, port, workers, interface=''):
+        self.api = api
+        self.port = port
+        self.count = workers
+        self.interface = interface
+        self.factory = serverFactory(api, trusted=True)
+        self.workers = set([])
+        self.socket = None
+
+    def startService(self):
+        service.Service.startService(self)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.interface, self.port))
+        self.socket.listen(50)
+        self.socket.setblocking(False)
+        for i in range(self.count):
+            self.start_worker()
+
+    def start_worker(self):
+        if not self.running:
+            return
+        worker = WorkerProcess(self)
+        args = [sys.executable, '-m', 'txtrader.fanout', self.api.channel, self.api.label]
+        reactor.spawnProcess(worker, sys.executable, args, env=os.environ,
+                             childFDs={0: 'w', 1: 'r', 2: 2, LISTEN_FD: self.socket.fileno()})
+        self.workers.add(worker)
+
+    def worker_ended(self, worker):
+        self.workers.discard(worker)
+        reactor.callLater(RESTART_DELAY, self.start_worker)
+
+    def stopService(self):
+        service.Service.stopService(self)
+        for worker in self.workers:
+            try:
+                worker.transport.signalProcess('TERM')
+            except ProcessExitedAlready:
+                pass
+        self.socket.close()
+
+
+# worker side
+
+class WorkerAPI(object):
+    """stands in for the API in a worker process: local clients and the events relayed to them"""
+
+    def __init__(self, channel, label):
+        self.channel = channel
+        self.label = label
+        self.config = Config(channel)
+        self.username = self.config.get('USERNAME')
+        self.password = self.config.get('PASSWORD')
+        self.client_high_water = int(self.config.get('CLIENT_HIGH_WATER'))
+        self.clients = set([])
+        self.event_symbols = SymbolTable()
+
+    def output(self, msg):
+        log.msg('fanout[%d] %s' % (os.getpid(), msg))
+
+    def open_client(self, client):
+        self.clients.add(client)
+
+    def close_client(self, client):
+        self.clients.discard(client)
+
+    def relay(self, frame):
+        if self.clients:
+            write_event(self.clients, relay_event(self.channel, frame, self.event_symbols))
+
+
+class WorkerClient(tcpserver):
+    """a client connection in a worker: local commands are run here, the rest in the broker"""
+
+    def __init__(self):
+        tcpserver.__init__(self)
+        for cmd in self.commands:
+            if cmd not in LOCAL_COMMANDS:
+                self.commands[cmd] = self.cmd_relay
+
+    def cmd_relay(self, line, responder):
+        self.factory.broker.sendString('C%d %s%s' % (self.cid, responder.prefix, line))
+
+    def connectionMade(self):
+        self.cid = self.factory.next_cid()
+        self.factory.broker.clients[self.cid] = self
+        tcpserver.connectionMade(self)
+
+    def connectionLost(self, reason):
+        tcpserver.connectionLost(self, reason)
+        if self.factory.broker.clients.pop(self.cid, None):
+            self.factory.broker.sendString('L%d' % self.cid)
+
+
+class WorkerFactory(serverFactory):
+    protocol = WorkerClient
+
+    def __init__(self, api, broker):
+        serverFactory.__init__(self, api)
+        self.broker = broker
+        self.cid = 0
+
+    def next_cid(self):
+        self.cid += 1
+        return self.cid
+
+
+class BrokerLink(NetstringReceiver):
+    """the worker's connection to the broker on stdin/stdout"""
+
+    def __init__(self, api):
+        self.api = api
+        self.clients = {}
+
+    def stringReceived(self, data):
+        if data.startswith('E'):
+            self.api.relay(data[1:])
+        elif data.startswith('S'):
+            cid, frame = data[1:].split(' ', 1)
+            client = self.clients.get(int(cid))
+            if client:
+                client.send_event(relay_event(self.api.channel, frame, self.api.event_symbols))
+        elif data.startswith('R'):
+            cid, string = data[1:].split(' ', 1)
+            client = self.clients.get(int(cid))
+            if client:
+                client.sendString(string)
+        elif data.startswith('D'):
+            client = self.clients.get(int(data[1:]))
+            if client:
+                client.transport.loseConnection()
+
+    def connectionLost(self, reason):
+        self.api.output('broker connection lost: %s' % reason.getErrorMessage())
+        if reactor.running:
+            reactor.stop()
+
+
+def run_worker(channel, label):
+    log.startLogging(sys.stderr)
+    api = WorkerAPI(channel, label)
+    broker = BrokerLink(api)
+    stdio.StandardIO(broker)
+    reactor.adoptStreamPort(LISTEN_FD, socket.AF_INET, WorkerFactory(api, broker))
+    os.close(LISTEN_FD)
+    api.output('serving clients')
+    reactor.run()
+
+
+if __name__ == '__main__':
+    run_worker(*sys.argv[1:3])
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+  fanout_test.py
+  --------------
+
+  TxTrader fan-out worker unit test script
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+from txtrader.fanout import WorkerLink, WorkerAPI, WorkerFactory, BrokerLink
+from txtrader.tcpserver import serverFactory
+from txtrader.events import Event, Decoder
+from txtrader.events_test import API, received, netstring, EVENTS
+from twisted.test import proto_helpers
+
+
+class Pipe(object):
+    """the broker and worker ends of a worker's stdin/stdout, pumped by hand"""
+
+    def __init__(self, api, monkeypatch):
+        for key, value in [('USERNAME', 'user'), ('PASSWORD', 'pass'), ('CLIENT_HIGH_WATER', '0')]:
+            monkeypatch.setenv('TXTRADER_%s' % key, value)
+        self.link = WorkerLink(serverFactory(api, trusted=True), 1)
+        self.link.makeConnection(proto_helpers.StringTransport())
+        self.worker = WorkerAPI(api.channel, api.label)
+        self.broker = BrokerLink(self.worker)
+        self.broker.makeConnection(proto_helpers.StringTransport())
+        self.factory = WorkerFactory(self.worker, self.broker)
+
+    def connect(self):
+        client = self.factory.buildProtocol(('127.0.0.1', 0))
+        transport = proto_helpers.StringTransport()
+        client.makeConnection(transport)
+        return client, transport
+
+    def pump(self):
+        while self.link.transport.value() or self.broker.transport.value():
+            data = self.link.transport.value()
+            self.link.transport.clear()
+            self.broker.dataReceived(data)
+            data = self.broker.transport.value()
+            self.broker.transport.clear()
+            self.link.dataReceived(data)
+
+
+def test_worker_relay(monkeypatch):
+    api = API()
+    pipe = Pipe(api, monkeypatch)
+    assert api.clients == set([pipe.link])
+
+    clients = [pipe.connect() for i in range(3)]
+    for client, transport in clients[0], clients[2]:
+        client.dataReceived(netstring('#1 auth user pass') + netstring('#2 status'))
+    clients[2][0].dataReceived(netstring('filter noquotes notrades'))
+    clients[1][0].dataReceived(netstring('auth user wrong') + netstring('status'))
+    pipe.pump()
+    # auth and filter are answered by the worker, status by a session in the broker
+    assert received(clients[0][1])[1:] == ['#1 .Authorized rtx', '#2 .status: Up']
+    assert sorted(pipe.link.sessions.keys()) == [1, 3]
+    assert clients[1][1].disconnecting
+
+    for msg, data in EVENTS:
+        api.WriteAllClients(msg, data)
+    pipe.pump()
+    assert received(clients[0][1]) == ['rtx.%s' % msg for msg, data in EVENTS]
+    assert received(clients[2][1])[-4:] == ['rtx.%s' % msg for msg, data in EVENTS[4:8]]
+
+    clients[0][0].connectionLost(None)
+    pipe.pump()
+    assert sorted(pipe.link.sessions.keys()) == [3]
+
+
+class SnapshotAPI(API):
+    """sends the current quote to a client adding a symbol, as the apis do for streaming symbols"""
+
+    def symbol_enable(self, symbol, client, callback):
+        callback.callback('%s.add-symbol: true' % self.channel)
+        msg, data = EVENTS[0]
+        client.send_event(Event(self.channel, msg, data, self.event_symbols))
+
+
+def test_worker_snapshot(monkeypatch):
+    api = SnapshotAPI()
+    pipe = Pipe(api, monkeypatch)
+    clients = [pipe.connect() for i in range(3)]
+    clients[0][0].dataReceived(netstring('auth user pass encoding=binary'))
+    clients[1][0].dataReceived(netstring('auth user pass noquotes'))
+    clients[2][0].dataReceived(netstring('auth user pass'))
+    for client, transport in clients:
+        client.dataReceived(netstring('add IBM'))
+    pipe.pump()
+    decoder = Decoder('rtx')
+    # the snapshot is sent in each client's encoding, and filtered out for noquotes
+    assert [decoder.decode(f) for f in received(clients[0][1])[2:]] == ['rtx.add-symbol: true', None, 'rtx.%s' % EVENTS[0][0]]
+    assert received(clients[1][1])[1:] == ['.Authorized rtx', 'rtx.add-symbol: true']
+    assert received(clients[2][1])[1:] == ['.Authorized rtx', 'rtx.add-symbol: true', 'rtx.%s' % EVENTS[0][0]]
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  logger.py
+  ---------
+
+  TxTrader logging module - buffered log records with per-subsystem levels and sampling.
+
+  Code logs through a named subsystem logger:
+
+    log = logger('tcp')
+    log.info('user command: %s', line)
+
+  A record below the subsystem's level, or skipped by its sample rate, costs one dict lookup
+  and is never formatted.  Other records are queued with their format string, arguments and
+  time; a writer thread formats them and publishes them to the twisted log observers, so the
+  reactor thread does not format or write log output.  The writer thread must not read objects
+  the reactor thread changes: dict, list and set arguments are formatted when the record is
+  queued, and so are lazy() arguments, for work that should only be done if the record is kept.
+
+  Levels and sample rates are read from the environment (TXTRADER_LOG_LEVEL, TXTRADER_LOG_LEVELS,
+  TXTRADER_LOG_SAMPLE) and can be changed at runtime with the log_levels command.
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+
+import time
+import atexit
+import threading
+from collections import deque
+
+from twisted.logger import globalLogPublisher, LogLevel
+
+# the standard library logging levels, as used by twisted's logLevel key
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+LEVELS = {'DEBUG': DEBUG, 'INFO': INFO, 'WARNING': WARNING, 'ERROR': ERROR, 'OFF': OFF}
+LEVEL_NAMES = dict([(v, k) for k, v in LEVELS.items()])
+
+# seconds between writer thread passes
+FLUSH_INTERVAL = 0.1
+
+# records beyond this many waiting for the writer are dropped and counted
+MAX_QUEUE = 100000
+
+
+def parse_level(level):
+    """return the numeric level for a name or number"""
+    if str(level).upper() in LEVELS:
+        return LEVELS[str(level).upper()]
+    return int(level)
+
+
+def parse_settings(text, parse):
+    """parse 'subsystem=value,...' into a dict"""
+    ret = {}
+    for item in (text or '').split(','):
+        if item.strip():
+            name, value = item.split('=', 1)
+            ret[name.strip()] = parse(value.strip())
+    return ret
+
+
+class lazy(object):
+    """a log argument computed only if the record passes the level and sampling checks"""
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+
+class snapshot(object):
+    """a mutable log argument, formatted when the record is queued"""
+
+    def __init__(self, value):
+        self.text = repr(value)
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return self.text
+
+
+def freeze(arg):
+    """return a log argument the writer thread can format: values as of the log call"""
+    if isinstance(arg, lazy):
+        arg = arg.func(*arg.args)
+    if isinstance(arg, (dict, list, set)):
+        return snapshot(arg)
+    return arg
+
+
+def twisted_level(level):
+    if level >= ERROR:
+        return LogLevel.error
+    if level >= WARNING:
+        return LogLevel.warn
+    if level >= INFO:
+        return LogLevel.info
+    return LogLevel.debug
+
+
+class LogWriter(object):
+    """the queue of pending records and the thread writing them"""
+
+    def __init__(self, level=INFO, write=None):
+        self.level = level
+        self.levels = {}
+        self.sample = {}
+        self.counts = {}
+        self.queue = deque()
+        self.dropped = 0
+        self.write = write or self.write_twisted
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def configure(self, level=None, levels=None, sample=None):
+        """set the default level and replace the per-subsystem levels and sample rates given"""
+        if level is not None:
+            self.level = parse_level(level)
+        if levels is not None:
+            self.levels = parse_settings(levels, parse_level) if isinstance(levels, basestring) else dict(levels)
+        if sample is not None:
+            sample = parse_settings(sample, int) if isinstance(sample, basestring) else sample
+            self.sample = dict([(k, v) for k, v in sample.items() if v > 1])
+            self.counts = {}
+
+    def settings(self):
+        return {
+            'level': LEVEL_NAMES.get(self.level, self.level),
+            'levels': dict([(k, LEVEL_NAMES.get(v, v)) for k, v in self.levels.items()]),
+            'sample': dict(self.sample),
+            'dropped': self.dropped,
+        }
+
+    def enabled(self, subsystem, level):
+        return level >= self.levels.get(subsystem, self.level)
+
+    def log(self, subsystem, level, fmt, args):
+        if level < self.levels.get(subsystem, self.level):
+            return
+        # errors are never sampled out
+        if level < ERROR and subsystem in self.sample:
+            count = self.counts.get(subsystem, 0)
+            self.counts[subsystem] = count + 1
+            if count % self.sample[subsystem]:
+                return
+        if len(self.queue) >= MAX_QUEUE:
+            self.dropped += 1
+            return
+        self.queue.append((subsystem, level, fmt, tuple([freeze(a) for a in args]), time.time()))
+        if not self.thread:
+            self.start()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='txtrader-log')
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        """write all queued records"""
+        with self.lock:
+            while self.queue:
+                subsystem, level, fmt, args, when = self.queue.popleft()
+                try:
+                    text = fmt % args if args else fmt
+                except Exception as ex:
+                    text = 'log format failed: %r %% %r: %r' % (fmt, args, ex)
+                    level = ERROR
+                self.write(subsystem, level, text, when)
+
+    def write_twisted(self, subsystem, level, text, when):
+        # log.msg would stamp the record with the time it is written; the event keeps the time of the call
+        globalLogPublisher({
+            'log_time': when,
+            'log_level': twisted_level(level),
+            'log_namespace': 'txtrader.%s' % subsystem,
+            'log_system': subsystem,
+            'log_format': u'{log_text}',
+            'log_text': text,
+            'message': (text,),
+            'logLevel': level,
+            'isError': int(level >= ERROR),
+        })
+
+
+class Logger(object):
+    """the log of one subsystem"""
+
+    def __init__(self, writer, subsystem):
+        self.writer = writer
+        self.subsystem = subsystem
+
+    def enabled(self, level):
+        return self.writer.enabled(self.subsystem, level)
+
+    def log(self, level, fmt, *args):
+        self.writer.log(self.subsystem, level, fmt, args)
+
+    def debug(self, fmt, *args):
+        self.writer.log(self.subsystem, DEBUG, fmt, args)
+
+    def info(self, fmt, *args):
+        self.writer.log(self.subsystem, INFO, fmt, args)
+
+    def warning(self, fmt, *args):
+        self.writer.log(self.subsystem, WARNING, fmt, args)
+
+    def error(self, fmt, *args):
+        self.writer.log(self.subsystem, ERROR, fmt, args)
+
+
+# one writer per process
+WRITER = LogWriter()
+
+
+def logger(subsystem):
+    return Logger(WRITER, subsystem)
+
+
+def configure_logging(config):
+    """apply the LOG_LEVEL, LOG_LEVELS and LOG_SAMPLE settings of a Config"""
+    WRITER.configure(config.get('LOG_LEVEL'), config.get('LOG_LEVELS'), config.get('LOG_SAMPLE'))
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+  logger_test.py
+  --------------
+
+  TxTrader logging unit test script
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+from txtrader.logger import LogWriter, Logger, lazy, DEBUG, INFO, ERROR
+from twisted.logger import globalLogPublisher, formatEvent
+
+import time
+
+
+class Writer(LogWriter):
+    """writes to a list, flushed by hand"""
+
+    def __init__(self):
+        self.written = []
+        self.times = []
+        LogWriter.__init__(self, write=self.record)
+        self.thread = True
+
+    def record(self, subsystem, level, text, when):
+        self.written.append((subsystem, level, text))
+        self.times.append(when)
+
+
+def test_levels_and_sampling():
+    writer = Writer()
+    tcp, http = Logger(writer, 'tcp'), Logger(writer, 'http')
+    calls = []
+    writer.configure('INFO', 'tcp=DEBUG', 'http=3')
+    tcp.debug('line %d', 1)
+    http.debug('never %s', lazy(calls.append, 'formatted'))
+    for i in range(6):
+        http.info('request %d', i)
+    http.error('failed %s', 'always')
+    assert writer.written == []
+    writer.flush()
+    assert writer.written == [
+        ('tcp', DEBUG, 'line 1'),
+        ('http', INFO, 'request 0'),
+        ('http', INFO, 'request 3'),
+        ('http', ERROR, 'failed always'),
+    ]
+    # records below the level are never formatted
+    assert calls == []
+    assert writer.settings() == {'level': 'INFO', 'levels': {'tcp': 'DEBUG'}, 'sample': {'http': 3}, 'dropped': 0}
+
+    writer.configure(levels='', sample='')
+    assert not tcp.enabled(DEBUG)
+    writer.written = []
+    tcp.info('bad %d', 'format')
+    tcp.info('100%')
+    writer.flush()
+    assert writer.written[0][:2] == ('tcp', ERROR) and writer.written[0][2].startswith('log format failed:')
+    assert writer.written[1] == ('tcp', INFO, '100%')
+
+
+def test_values_as_of_the_call():
+    writer = Writer()
+    tcp = Logger(writer, 'tcp')
+    symbols = {'IBM': 1}
+    calls = []
+    before = time.time()
+    tcp.info('symbols=%r %s', symbols, lazy(lambda: calls.append(1) or len(symbols)))
+    # lazy arguments of a kept record are computed by the caller, mutable ones formatted
+    assert calls == [1]
+    symbols['MSFT'] = 2
+    time.sleep(0.01)
+    after = time.time()
+    writer.flush()
+    assert writer.written == [('tcp', INFO, "symbols={'IBM': 1} 1")]
+    # the record has the time of the call, not of the flush
+    assert before <= writer.times[0] < after
+
+
+def test_write_twisted():
+    events = []
+    globalLogPublisher.addObserver(events.append)
+    try:
+        LogWriter().write_twisted('tcp', ERROR, 'gone', 1234.5)
+    finally:
+        globalLogPublisher.removeObserver(events.append)
+    assert events[0]['log_time'] == 1234.5
+    assert events[0]['log_system'] == 'tcp' and events[0]['isError'] == 1
+    assert formatEvent(events[0]) == 'gone'
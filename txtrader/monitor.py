@@ -15,11 +15,14 @@
 import time
 from twisted.internet import reactor, protocol, task
 from twisted.protocols.basic import NetstringReceiver
+from txtrader.events import ENCODINGS, FILTER_FLAGS, Decoder
 
 class Monitor(object):
-    def __init__(self, host='localhost', port=50090, user=None, password=None, callbacks=None):
+    def __init__(self, host='localhost', port=50090, user=None, password=None, callbacks=None, encoding=None):
         """Initialize Monitor:
           connection parameters: host, port, user, password, 
+          encoding: event stream encoding requested from the server ('binary' for smaller frames);
+            the text stream is used if the encoding is None or not supported by the server
           callbacks: {'name':function ...}  
             where name is one of ['status', 'error', 'time', 'order', 'execution', 'quote', 'trade', 'tick', 'shutdown']
             and function(data) is the callback that will receive event data
@@ -31,7 +34,7 @@ class Monitor(object):
         self.password = password
         self.channel = ''
         self.callback_types = ['status', 'error', 'time', 'order', 'execution', 'quote', 'trade', 'tick', 'shutdown']
-        self.flags = 'noquotes notrades'
+        self.encoding = encoding if encoding in ENCODINGS else None
         self.connection = None
 
         if callbacks:
@@ -63,6 +66,13 @@ class Monitor(object):
     def ticker(self):
         self._callback('tick', time.time())
 
+    def auth_flags(self):
+        """return the auth flags: filter out the event categories without a callback, request the encoding"""
+        flags = sorted([f for f, category in FILTER_FLAGS.items() if category not in self.callbacks])
+        if self.encoding:
+            flags.append('encoding=%s' % self.encoding)
+        return ' '.join(flags)
+
     def delete_callback(self, cb_type):
         """Delete a callback function for a message type."""
         if cb_type in self.callbacks.keys():
@@ -91,17 +101,25 @@ class StatusClient(NetstringReceiver):
         self.message_types = []
         self.channel_map = {}
         self.last_account = ''
+        self.decoder = None
 
     def connectionMade(self):
         pass
 
     def stringReceived(self, data):
+        if self.decoder:
+            data = self.decoder.decode(data)
+            if data is None:
+                return
         if data.startswith('.'):
             self.factory.rx._callback('status', data)
             if data.startswith('.connected'):
-                self.sendString('auth %s %s %s' % (self.factory.rx.user, self.factory.rx.password, self.factory.rx.flags))
+                self.sendString('auth %s %s %s' % (self.factory.rx.user, self.factory.rx.password, self.factory.rx.auth_flags()))
             elif data.startswith('.Authorized'):
                 dummy, self.channel = data.split()[:2]
+                encoding = data.split()[2:3]
+                if encoding and encoding[0] in ENCODINGS:
+                    self.decoder = Decoder(self.channel)
                 # setup channel map now that we have the channel name
                 self.channel_map = {
                     '%s.time: ' % self.channel: 'time',
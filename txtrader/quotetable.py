@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  quotetable.py
+  -------------
+
+  TxTrader quote table module - the latest market data per symbol in a memory-mapped file.
+
+  The server publishes each symbol's current quote and trade fields into a fixed size file;
+  processes on the same host read them with QuoteReader without any request to the server.
+  The file holds a header, a symbol directory and one record per directory entry:
+
+    header      magic, format version, capacity, symbol count
+    directory   capacity x 16 byte symbol names, NUL padded; the slot is the entry's index
+    records     capacity x (sequence, time, bid, bidsize, ask, asksize, last, size, volume, high, low)
+
+  Each record is guarded by its sequence number (a seqlock): the writer makes it odd before
+  changing the record and even again afterwards, and a reader retries until it sees the same
+  even number before and after copying the record.  There is one writer, the server's reactor
+  thread.  Python has no memory fences; the scheme relies on aligned 8 byte stores becoming
+  visible in program order, as they do on x86.  Symbol names are truncated to 16 bytes.
+
+  The server creates a new file at startup and renames it into place, so a reader that is
+  still mapping the previous file keeps reading its last values; stale() detects this.
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+
+import os
+import time
+import mmap
+import struct
+
+MAGIC = 'TXQT'
+FORMAT_VERSION = 1
+
+DEFAULT_CAPACITY = 4096
+
+# header: magic, format version, capacity, symbol count
+HEADER = struct.Struct('<4sIII')
+
+SYMBOL = struct.Struct('<16s')
+
+# record: sequence, update time, bid, bidsize, ask, asksize, last, size, volume, high, low
+RECORD = struct.Struct('<Qddqdqdqqdd')
+SEQUENCE = struct.Struct('<Q')
+
+FIELDS = ['time', 'bid', 'bidsize', 'ask', 'asksize', 'last', 'size', 'volume', 'high', 'low']
+
+# a reader gives up on a record still being written after this many attempts
+READ_RETRIES = 1000
+
+
+def table_size(capacity):
+    return HEADER.size + capacity * (SYMBOL.size + RECORD.size)
+
+
+def record_offset(capacity, slot):
+    return HEADER.size + capacity * SYMBOL.size + slot * RECORD.size
+
+
+class QuoteTable(object):
+    """Single writer; call publish() from the market data handlers with the slot from slot()"""
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, output=None):
+        self.path = path
+        self.capacity = capacity
+        self.output = output
+        self.slots = {}
+        self.sequence = []
+        self.full = False
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        temp = '%s.%d' % (path, os.getpid())
+        with open(temp, 'w+b') as f:
+            f.truncate(table_size(capacity))
+            self.map = mmap.mmap(f.fileno(), table_size(capacity))
+        HEADER.pack_into(self.map, 0, MAGIC, FORMAT_VERSION, capacity, 0)
+        os.rename(temp, path)
+        if self.output:
+            self.output('%s opened' % self)
+
+    def __str__(self):
+        return 'QuoteTable(%s symbols=%d capacity=%d)' % (self.path, len(self.slots), self.capacity)
+
+    def __repr__(self):
+        return str(self)
+
+    def slot(self, symbol):
+        """return the table slot for symbol, adding it to the directory on first use; None if the table is full"""
+        slot = self.slots.get(symbol)
+        if slot is None and self.map:
+            if len(self.slots) >= self.capacity:
+                if not self.full and self.output:
+                    self.output('ALERT: QuoteTable: %s is full, %s not published' % (self.path, symbol))
+                self.full = True
+                return None
+            slot = len(self.slots)
+            self.slots[symbol] = slot
+            self.sequence.append(0)
+            SYMBOL.pack_into(self.map, HEADER.size + slot * SYMBOL.size, symbol)
+            # the count is written last: readers never see a slot before its name
+            HEADER.pack_into(self.map, 0, MAGIC, FORMAT_VERSION, self.capacity, len(self.slots))
+        return slot
+
+    def publish(self, slot, symbol):
+        """write the current fields of an API_Symbol or TWS_Symbol"""
+        if slot is None or not self.map:
+            return
+        offset = record_offset(self.capacity, slot)
+        sequence = self.sequence[slot] + 1
+        SEQUENCE.pack_into(self.map, offset, sequence)
+        RECORD.pack_into(self.map, offset, sequence, time.time(),
+                         symbol.bid, symbol.bid_size, symbol.ask, symbol.ask_size,
+                         symbol.last, symbol.size, symbol.volume,
+                         getattr(symbol, 'high', 0.0), getattr(symbol, 'low', 0.0))
+        self.sequence[slot] = sequence + 1
+        SEQUENCE.pack_into(self.map, offset, sequence + 1)
+
+    def close(self):
+        if self.map:
+            self.map.close()
+            self.map = None
+
+
+class QuoteReader(object):
+    """read snapshots from a QuoteTable file published by a server on this host"""
+
+    def __init__(self, path):
+        self.path = path
+        self.slots = {}
+        self.count = 0
+        with open(path, 'rb') as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.capacity, count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.map.close()
+            raise Exception('%s: incompatible quote table file' % path)
+
+    def refresh(self):
+        """pick up symbols added to the directory since the last refresh"""
+        count = HEADER.unpack_from(self.map, 0)[3]
+        for slot in range(self.count, count):
+            symbol = SYMBOL.unpack_from(self.map, HEADER.size + slot * SYMBOL.size)[0].rstrip('\0')
+            self.slots[symbol] = slot
+        self.count = count
+
+    def symbols(self):
+        self.refresh()
+        return sorted(self.slots.keys())
+
+    def snapshot(self, symbol):
+        """return {'symbol', 'time', 'bid', ...} for symbol, or None if it is not published"""
+        slot = self.slots.get(symbol)
+        if slot is None:
+            self.refresh()
+            slot = self.slots.get(symbol)
+            if slot is None:
+                return None
+        offset = record_offset(self.capacity, slot)
+        for i in xrange(READ_RETRIES):
+            record = RECORD.unpack_from(self.map, offset)
+            if not record[0] & 1 and SEQUENCE.unpack_from(self.map, offset)[0] == record[0]:
+                if not record[0]:
+                    return None
+                ret = dict(zip(FIELDS, record[1:]))
+                ret['symbol'] = symbol
+                return ret
+        raise Exception('%s: %s is not readable' % (self.path, symbol))
+
+    def stale(self):
+        """True if the server has since created a new table at the path (it restarted)"""
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except OSError:
+            return True
+
+    def close(self):
+        self.map.close()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+  quotetable_test.py
+  ------------------
+
+  TxTrader quote table unit test script
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+from txtrader import quotetable
+
+import pytest
+
+
+class Symbol(object):
+    def __init__(self, bid, bid_size, ask, ask_size, last=0.0, size=0, volume=0):
+        self.bid, self.bid_size, self.ask, self.ask_size = bid, bid_size, ask, ask_size
+        self.last, self.size, self.volume = last, size, volume
+
+
+def test_publish_read(tmpdir):
+    path = str(tmpdir.join('quotes'))
+    table = quotetable.QuoteTable(path, capacity=2)
+    ibm = table.slot('IBM')
+    reader = quotetable.QuoteReader(path)
+    assert reader.snapshot('IBM') is None
+    table.publish(ibm, Symbol(131.2, 300, 131.25, 100, 131.21, 100, 1234500))
+    snapshot = reader.snapshot('IBM')
+    assert [snapshot[f] for f in ['symbol', 'bid', 'bidsize', 'ask', 'asksize', 'last', 'size', 'volume', 'high']] == ['IBM', 131.2, 300, 131.25, 100, 131.21, 100, 1234500, 0.0]
+    assert snapshot['time'] > 0
+
+    # symbols added after the reader opened the table are found in the directory
+    table.publish(table.slot('AAPL'), Symbol(210.5, 100, 210.52, 200))
+    assert reader.snapshot('AAPL')['ask'] == 210.52
+    assert table.slot('TSLA') is None
+    assert reader.symbols() == ['AAPL', 'IBM']
+    assert reader.snapshot('TSLA') is None
+
+
+def test_seqlock_and_restart(tmpdir, monkeypatch):
+    path = str(tmpdir.join('quotes'))
+    table = quotetable.QuoteTable(path)
+    slot = table.slot('IBM')
+    table.publish(slot, Symbol(131.2, 300, 131.25, 100))
+    reader = quotetable.QuoteReader(path)
+    assert reader.snapshot('IBM')['bid'] == 131.2
+
+    # a record the writer is in the middle of updating is not returned
+    offset = quotetable.record_offset(table.capacity, slot)
+    quotetable.SEQUENCE.pack_into(table.map, offset, 3)
+    monkeypatch.setattr(quotetable, 'READ_RETRIES', 10)
+    with pytest.raises(Exception):
+        reader.snapshot('IBM')
+
+    assert not reader.stale()
+    quotetable.QuoteTable(path)
+    assert reader.stale()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  recorder.py
+  -----------
+
+  TxTrader RTGW session recorder - save the raw gateway line stream with timestamps.
+
+  Each line of a recording is '<time> <direction> <message>' where direction is
+  '>' for lines received from the gateway and '<' for lines sent to it.
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+
+import os
+import time
+
+RECEIVED = '>'
+SENT = '<'
+
+
+class GatewayRecorder(object):
+    def __init__(self, directory, output=None):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.filename = os.path.join(directory, 'rtgw-%s.log' % time.strftime('%Y%m%d-%H%M%S'))
+        self.file = open(self.filename, 'a')
+        if output:
+            output('GatewayRecorder: recording RTGW session to %s' % self.filename)
+
+    def receive(self, line):
+        if self.file:
+            self.file.write('%.6f > %s\n' % (time.time(), line))
+
+    def send(self, line):
+        if self.file:
+            self.file.write('%.6f < %s\n' % (time.time(), line))
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def read_recording(filename):
+    """generate (time, direction, line) tuples from a recording"""
+    with open(filename) as f:
+        for record in f:
+            t, direction, line = record.rstrip('\n').split(' ', 2)
+            yield (float(t), direction, line)
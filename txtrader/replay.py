@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  replay.py
+  ---------
+
+  TxTrader RTGW session replay - feed a recorded gateway session back into RTX.gateway_receive
+
+  Connection ids are uuids chosen by the RTX instance, so the replay maps each recorded
+  connection id onto the id of the connection the replaying RTX opens for the same
+  service/topic, in order.  Symbol subscriptions and $TIME requests found in the recorded
+  outbound stream are re-issued at the same point of the session (at the connect when the
+  request opened a new connection); other client driven
+  traffic (orders) is not reproduced, and responses to it are counted as unmatched.
+
+  usage: envdir etc/txtrader python -m txtrader.replay [--realtime] RECORDING
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+
+import sys
+import time
+import ujson as json
+from collections import deque
+
+from twisted.python import log
+from twisted.internet import reactor, defer
+
+from txtrader.rtx import RTX
+from txtrader.recorder import read_recording, RECEIVED, SENT
+
+
+class ReplayRTX(RTX):
+    """RTX that never opens the RTGW connection; the gateway is supplied with gateway_connect()"""
+
+    def start_gateway(self):
+        pass
+
+
+class ReplayProtocol(object):
+    """fake RtxClient and transport: lines the api sends to the gateway are passed to the replay"""
+
+    def __init__(self, sent_handler):
+        self.sent_handler = sent_handler
+        self.transport = self
+
+    def sendLine(self, line):
+        self.sent_handler(line)
+
+    def write(self, data):
+        self.sent_handler(data)
+
+    def loseConnection(self):
+        pass
+
+
+class ReplayClient(object):
+    """symbol subscriber used for subscriptions re-issued from the recording"""
+
+    def __str__(self):
+        return 'ReplayClient()'
+
+    def __repr__(self):
+        return str(self)
+
+    def sendString(self, msg):
+        pass
+
+
+class GatewayReplay(object):
+    def __init__(self, api, filename, realtime=False):
+        self.api = api
+        self.realtime = realtime
+        self.client = ReplayClient()
+        self.records = []
+        self.connect_ids = {}
+        self.id_map = {}
+        self.actions = {}
+        self.load(filename)
+        self.index = 0
+        self.started = None
+        self.receive_time = 0.0
+        self.stats = {'messages': 0, 'unmatched': 0, 'types': {}}
+        self.done = defer.Deferred()
+
+    def load(self, filename):
+        unclaimed_connects = {}
+        for t, direction, line in read_recording(filename):
+            if direction == RECEIVED:
+                try:
+                    o = json.loads(line)
+                    self.records.append((t, direction, line, o['type'], o['id']))
+                except Exception:
+                    self.records.append((t, direction, line, None, None))
+            elif direction == SENT:
+                cmd, cid, args = (line.split(' ', 2) + ['', ''])[:3]
+                if cmd == 'connect':
+                    self.connect_ids.setdefault(args, deque()).append(cid)
+                    unclaimed_connects[cid] = len(self.records)
+                elif cmd == 'request':
+                    action = self.parse_action(args)
+                    if action:
+                        # the first request on a new connection is sent only after the connect is acknowledged,
+                        # so the action must be taken at the connect to open the replaying connection in time
+                        index = unclaimed_connects.pop(cid, len(self.records))
+                        self.actions[index] = action
+                self.records.append((t, direction, line, cmd, args))
+
+    def parse_action(self, args):
+        """return the client action behind a recorded request, or None"""
+        if args.startswith('LIVEQUOTE;'):
+            table, what, where = args.split(';', 2)
+            if where.startswith("DISP_NAME='") and where.endswith("'"):
+                symbol = where[11:-1]
+                if symbol == '$TIME':
+                    return ('time', None)
+                elif what == '*':
+                    return ('symbol', symbol)
+        return None
+
+    def api_sent(self, line):
+        cmd, cid, args = (line.strip().split(' ', 2) + ['', ''])[:3]
+        if cmd == 'connect':
+            recorded = self.connect_ids.get(args)
+            if recorded:
+                self.id_map[recorded.popleft()] = cid
+
+    def start(self):
+        """begin the replay, returning a Deferred that fires with the replay statistics"""
+        self.api.enable_seconds_tick = False
+        self.api.gateway_connect(ReplayProtocol(self.api_sent))
+        self.started = time.time()
+        if self.realtime:
+            self.schedule_next()
+        else:
+            while self.index < len(self.records):
+                self.replay_record(self.index)
+                self.index += 1
+            self.finish()
+        return self.done
+
+    def schedule_next(self):
+        if self.index < len(self.records):
+            t0 = self.records[0][0]
+            delay = self.started + (self.records[self.index][0] - t0) - time.time()
+            reactor.callLater(max(delay, 0), self.replay_next)
+        else:
+            self.finish()
+
+    def replay_next(self):
+        self.replay_record(self.index)
+        self.index += 1
+        self.schedule_next()
+
+    def replay_record(self, index):
+        t, direction, line, a, b = self.records[index]
+        if direction == RECEIVED:
+            self.replay_received(line, a, b)
+        elif index in self.actions:
+            self.replay_action(*self.actions[index])
+
+    def replay_received(self, line, msg_type, msg_id):
+        if msg_type != 'system':
+            cid = self.id_map.get(msg_id)
+            if not cid:
+                self.stats['unmatched'] += 1
+                return
+            line = line.replace('"%s"' % msg_id, '"%s"' % cid)
+        types = self.stats['types']
+        types[msg_type] = types.get(msg_type, 0) + 1
+        self.stats['messages'] += 1
+        start = time.time()
+        self.api.gateway_receive(line)
+        self.receive_time += time.time() - start
+
+    def replay_action(self, action, symbol):
+        if action == 'time':
+            self.api.request_time()
+        elif action == 'symbol' and symbol not in self.api.symbols:
+            d = defer.Deferred()
+            d.addErrback(lambda failure: None)
+            self.api.symbol_enable(symbol, self.client, d)
+
+    def finish(self):
+        elapsed = time.time() - self.started
+        self.stats['elapsed'] = elapsed
+        self.stats['receive_time'] = self.receive_time
+        self.stats['messages_per_second'] = self.stats['messages'] / self.receive_time if self.receive_time else 0.0
+        self.done.callback(self.stats)
+
+
+if __name__ == '__main__':
+    from sys import argv
+    realtime = '--realtime' in argv
+    args = [a for a in argv[1:] if not a.startswith('--')]
+
+    def report(stats):
+        print(json.dumps(stats))
+        reactor.stop()
+
+    def failed(failure):
+        sys.stderr.write('replay failed: %s\n' % failure.getErrorMessage())
+        reactor.stop()
+
+    def run():
+        replay = GatewayReplay(ReplayRTX(), args[0], realtime)
+        replay.start().addCallbacks(report, failed)
+
+    if '--log' in argv:
+        log.startLogging(sys.stderr)
+    reactor.callWhenRunning(run)
+    reactor.run()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+  replay_test.py
+  --------------
+
+  TxTrader RTGW session record and replay unit test script
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+from txtrader.recorder import GatewayRecorder, read_recording, RECEIVED, SENT
+from txtrader.simulator import GatewaySimulator
+
+import os
+import pytest
+
+SYMBOLS = ['IBM', 'MSFT']
+
+
+def record_session(directory):
+    """record an RTX session with the simulator: two subscriptions and one filled market order"""
+    from txtrader.benchmark import BenchRTX, GatewayLink, ACCOUNT, ROUTE
+    from txtrader.rtx import RTX_LocalCallback
+    api = BenchRTX()
+    recorder = GatewayRecorder(directory)
+    api.gateway_recorder = recorder
+    receive = api.gateway_receive
+
+    # the gateway link delivers lines to gateway_receive; record them as RtxClient does
+    def recorded_receive(line):
+        recorder.receive(line)
+        receive(line)
+    api.gateway_receive = recorded_receive
+    link = GatewayLink(api, GatewaySimulator([ACCOUNT], rate=20.0, seed=1, output=lambda msg: None))
+    for symbol in SYMBOLS:
+        link.call(api.symbol_enable, symbol, 'test', RTX_LocalCallback(api, lambda data: None))
+    link.call(api.market_order, ACCOUNT, ROUTE, 'IBM', 100, RTX_LocalCallback(api, lambda data: None))
+    recorder.close()
+    return api, recorder.filename
+
+
+@pytest.mark.skipif('TXTRADER_API_HOST' not in os.environ, reason='needs the etc/txtrader environment (envdir)')
+def test_record_replay(tmpdir):
+    from txtrader.benchmark import BenchRTX
+    from txtrader.replay import GatewayReplay
+    recorded, filename = record_session(str(tmpdir))
+    records = list(read_recording(filename))
+    assert set([direction for t, direction, line in records]) == set([RECEIVED, SENT])
+    received = len([r for r in records if r[1] == RECEIVED])
+
+    api = BenchRTX()
+    stats = []
+    GatewayReplay(api, filename).start().addCallback(stats.append)
+    stats = stats[0]
+    # every recorded gateway line is replayed and matched to a replayed request
+    assert stats['messages'] == received == 32
+    assert stats['unmatched'] == 0
+    assert sorted(api.symbols.keys()) == SYMBOLS
+    for symbol in SYMBOLS:
+        assert (api.symbols[symbol].bid, api.symbols[symbol].ask) == (recorded.symbols[symbol].bid, recorded.symbols[symbol].ask)
+    # the order advise is replayed, so the order reaches the state the recording ended with
+    assert sorted(api.orders.keys()) == sorted(recorded.orders.keys())
+    assert [o.render()['status'] for o in api.orders.values()] == ['Filled']
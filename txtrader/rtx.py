@@ -23,11 +23,52 @@ import datetime
 from pprint import pprint
 
 from txtrader.config import Config
+from txtrader import tickcapture, quotetable
+from txtrader.recorder import GatewayRecorder
+from txtrader.events import Event, EventSubscriber, SymbolTable, write_event
+from txtrader.logger import logger, lazy, configure_logging, INFO, ERROR
 
 CALLBACK_METRIC_HISTORY_LIMIT = 1024
 
+# LIVEQUOTE fields recorded by tick capture: TQL field -> (API_Symbol attribute, capture field id)
+TICK_CAPTURE_FIELDS = {
+    'BID': ('bid', tickcapture.BID),
+    'BIDSIZE': ('bid_size', tickcapture.BIDSIZE),
+    'ASK': ('ask', tickcapture.ASK),
+    'ASKSIZE': ('ask_size', tickcapture.ASKSIZE),
+    'TRDPRC_1': ('last', tickcapture.LAST),
+    'TRDVOL_1': ('size', tickcapture.SIZE),
+    'ACVOL_1': ('volume', tickcapture.VOLUME),
+    'HIGH_1': ('high', tickcapture.HIGH),
+    'LOW_1': ('low', tickcapture.LOW),
+    'HST_CLOSE': ('close', tickcapture.CLOSE),
+    'VWAP': ('vwap', tickcapture.VWAP),
+}
+
 TIMEOUT_TYPES = ['DEFAULT', 'ACCOUNT', 'ADDSYMBOL', 'ORDER', 'ORDERSTATUS', 'POSITION', 'TIMER']
 
+# callback results passed unserialized to HTTP requests, which stream them
+STREAMED_RESULTS = ['orders', 'executions']
+
+# txtrader order status -> the CURRENT_STATUS values API_Order.render derives it from
+ORDER_STATUS_CURRENT = {
+    'Submitted': ['PENDING', 'COMPLETED'],
+    'Pending': ['LIVE'],
+    'Filled': ['COMPLETED'],
+    'Cancelled': ['COMPLETED', 'CANCELLED'],
+    'Changed': ['COMPLETED'],
+    'Accepted': ['COMPLETED'],
+    'Error': ['COMPLETED', 'DELETED'],
+}
+
+# ORDERS fields requested whatever the field list: the ones API_Order needs to render an order
+ORDER_QUERY_FIELDS = ['ORIGINAL_ORDER_ID', 'ORDER_ID', 'CLIENT_ORDER_ID', 'TYPE', 'CURRENT_STATUS', 'REASON',
+                      'DISP_NAME', 'BANK', 'BRANCH', 'CUSTOMER', 'DEPOSIT',
+                      'ORIGINAL_VOLUME', 'VOLUME_TRADED', 'ORDER_RESIDUAL', 'AVG_PRICE', 'ORDER_TIME']
+
+# order fields added by API_Order.render, not requested from the gateway
+ORDER_RENDERED_FIELDS = ['permid', 'symbol', 'account', 'status', 'filled', 'remaining', 'avgfillprice', 'updates']
+
 # default RealTick orders to NYSE and Stock type
 RTX_EXCHANGE='NYS'
 RTX_STYPE=1
@@ -39,6 +80,10 @@ ENABLE_CXN_DEBUG = False
 DISCONNECT_SECONDS = 30 
 SHUTDOWN_ON_DISCONNECT = True 
 
+api_log = logger('api')
+symbol_log = logger('symbols')
+metrics_log = logger('metrics')
+
 from twisted.python import log
 from twisted.python.failure import Failure
 from twisted.internet.protocol import Protocol, ReconnectingClientFactory
@@ -59,6 +104,8 @@ class RtxClient(LineReceiver):
         self.rtx.gateway_connect(self)
 
     def lineReceived(self, data):
+        if self.rtx.gateway_recorder:
+            self.rtx.gateway_recorder.receive(data)
         self.rtx.gateway_receive(data)
 
     def lineLengthExceeded(self, line):
@@ -109,8 +156,19 @@ class API_Symbol(object):
         self.high = 0.0
         self.low = 0.0
         self.rawdata = ''
+        self.version = 0
         self.api.symbols[symbol] = self
+        self.api.data_version['symbols'] += 1
         self.last_quote = ''
+        self.capture_id = api.tick_capture.symbol_index(symbol) if api.tick_capture else None
+        self.quote_slot = api.quote_table.slot(symbol) if api.quote_table else None
+        # every exported field, kept current by parse_fields; read by export() and query_data()
+        self.exported = {
+            'symbol': self.symbol, 'fullname': self.fullname,
+            'bid': self.bid, 'bidsize': self.bid_size, 'ask': self.ask, 'asksize': self.ask_size,
+            'last': self.last, 'size': self.size, 'volume': self.volume,
+            'high': self.high, 'low': self.low, 'close': self.close, 'vwap': self.vwap,
+        }
         self.output('API_Symbol %s %s created for client %s' %
                     (self, symbol, client_id))
         self.output('Adding %s to watchlist' % self.symbol)
@@ -125,23 +183,21 @@ class API_Symbol(object):
         return str(self)
 
     def export(self):
-        ret = {
-            'symbol': self.symbol,
-            'last': self.last,
-            'size': self.size,
-            'volume': self.volume,
-            'close': self.close,
-            'vwap': self.vwap,
-            'fullname': self.fullname
-        }
-        if self.api.enable_high_low: 
-          ret['high'] = self.high
-          ret['low'] = self.low
-        if self.api.enable_ticker:
-          ret['bid'] = self.bid
-          ret['bidsize'] = self.bid_size
-          ret['ask'] = self.ask
-          ret['asksize'] = self.ask_size
+        return self.query_data()
+
+    def query_data(self, fields=None):
+        """the exported fields, or those of fields that are exported; the disabled quote fields are left out"""
+        if fields:
+            ret = dict([(f, self.exported[f]) for f in fields if f in self.exported])
+        else:
+            ret = dict(self.exported)
+        hidden = []
+        if not self.api.enable_high_low:
+            hidden += ['high', 'low']
+        if not self.api.enable_ticker:
+            hidden += ['bid', 'bidsize', 'ask', 'asksize']
+        for f in hidden:
+            ret.pop(f, None)
         return ret
 
     def add_client(self, client):
@@ -157,16 +213,32 @@ class API_Symbol(object):
             self.output('Removing %s from watchlist' % self.symbol)
             # TODO: stop live updates of market data from RTX
 
+    def quote_event(self):
+        return ('quote.%s:%s %d %s %d' % (self.symbol, self.bid, self.bid_size, self.ask, self.ask_size),
+                (self.symbol, self.bid, self.bid_size, self.ask, self.ask_size))
+
+    def trade_event(self):
+        return ('trade.%s:%s %d %d' % (self.symbol, self.last, self.size, self.volume),
+                (self.symbol, self.last, self.size, self.volume))
+
     def update_quote(self):
-        quote = 'quote.%s:%s %d %s %d' % (
-            self.symbol, self.bid, self.bid_size, self.ask, self.ask_size)
+        quote, data = self.quote_event()
         if quote != self.last_quote:
             self.last_quote = quote
-            self.api.WriteAllClients(quote)
+            self.api.WriteAllClients(quote, data)
 
     def update_trade(self):
-        self.api.WriteAllClients('trade.%s:%s %d %d' % (
-            self.symbol, self.last, self.size, self.volume))
+        self.api.WriteAllClients(*self.trade_event())
+
+    def snapshot_events(self):
+        """the quote and trade events for the current state, for a client subscribing while the symbol streams"""
+        events = []
+        if self.api.enable_ticker:
+            if self.bid or self.ask:
+                events.append(self.quote_event())
+            if self.last or self.volume:
+                events.append(self.trade_event())
+        return events
 
     def init_handler(self, data):
         data = json.loads(data)
@@ -189,46 +261,54 @@ class API_Symbol(object):
         trade_flag = False
         quote_flag = False
         pid = 'API_Symbol(%s)' % self.symbol
+        exported = self.exported
+        self.version += 1
  
         if data == None:
             self.api.force_disconnect('LIVEQUOTE Advise has been terminated by API for %s' % pid)
             return
 
         if 'TRDPRC_1' in data.keys():
-            self.last = self.api.parse_tql_float(data['TRDPRC_1'], pid, 'TRDPRC_1')
+            self.last = exported['last'] = self.api.parse_tql_float(data['TRDPRC_1'], pid, 'TRDPRC_1')
             trade_flag = True
         if 'HIGH_1' in data.keys():
-            self.high = self.api.parse_tql_float(data['HIGH_1'], pid, 'HIGH_1')
+            self.high = exported['high'] = self.api.parse_tql_float(data['HIGH_1'], pid, 'HIGH_1')
             trade_flag = True
         if 'LOW_1' in data.keys():
-            self.low = self.api.parse_tql_float(data['LOW_1'], pid, 'LOW_1')
+            self.low = exported['low'] = self.api.parse_tql_float(data['LOW_1'], pid, 'LOW_1')
             trade_flag = True
         if 'TRDVOL_1' in data.keys():
-            self.size = self.api.parse_tql_int(data['TRDVOL_1'], pid, 'TRDVOL_1')
+            self.size = exported['size'] = self.api.parse_tql_int(data['TRDVOL_1'], pid, 'TRDVOL_1')
             trade_flag = True
         if 'ACVOL_1' in data.keys():
-            self.volume = self.api.parse_tql_int(data['ACVOL_1'], pid, 'ACVOL_1')
+            self.volume = exported['volume'] = self.api.parse_tql_int(data['ACVOL_1'], pid, 'ACVOL_1')
             trade_flag = True
         if 'BID' in data.keys():
-            self.bid = self.api.parse_tql_float(data['BID'], pid, 'BID')
+            self.bid = exported['bid'] = self.api.parse_tql_float(data['BID'], pid, 'BID')
             if self.bid and 'BIDSIZE' in data.keys():
-                self.bidsize = self.api.parse_tql_int(data['BIDSIZE'], pid, 'BIDSIZE')
+                self.bid_size = exported['bidsize'] = self.api.parse_tql_int(data['BIDSIZE'], pid, 'BIDSIZE')
             else:
-                self.bidsize = 0
+                self.bid_size = exported['bidsize'] = 0
             quote_flag = True
         if 'ASK' in data.keys():
-            self.ask = self.api.parse_tql_float(data['ASK'], pid, 'ASK')
+            self.ask = exported['ask'] = self.api.parse_tql_float(data['ASK'], pid, 'ASK')
             if self.ask and 'ASKSIZE' in data.keys():
-              self.asksize = self.api.parse_tql_int(data['ASKSIZE'], pid, 'ASKSIZE')
+              self.ask_size = exported['asksize'] = self.api.parse_tql_int(data['ASKSIZE'], pid, 'ASKSIZE')
             else:
-                self.asksize = 0
+                self.ask_size = exported['asksize'] = 0
             quote_flag = True
         if 'COMPANY_NAME' in data.keys():
-            self.fullname = self.api.parse_tql_str(data['COMPANY_NAME'], pid, 'COMPANY_NAME')
+            self.fullname = exported['fullname'] = self.api.parse_tql_str(data['COMPANY_NAME'], pid, 'COMPANY_NAME')
         if 'HST_CLOSE' in data.keys():
-            self.close = self.api.parse_tql_float(data['HST_CLOSE'], pid, 'HST_CLOSE')
+            self.close = exported['close'] = self.api.parse_tql_float(data['HST_CLOSE'], pid, 'HST_CLOSE')
         if 'VWAP' in data.keys():
-            self.vwap = self.api.parse_tql_float(data['VWAP'], pid, 'VWAP')
+            self.vwap = exported['vwap'] = self.api.parse_tql_float(data['VWAP'], pid, 'VWAP')
+
+        if self.api.tick_capture:
+            self.capture_fields(data)
+
+        if self.api.quote_table and (quote_flag or trade_flag):
+            self.api.quote_table.publish(self.quote_slot, self)
 
         if self.api.enable_ticker:
             if quote_flag:
@@ -236,6 +316,13 @@ class API_Symbol(object):
             if trade_flag:
                 self.update_trade()
 
+    def capture_fields(self, data):
+        capture = self.api.tick_capture
+        for key in data:
+            if key in TICK_CAPTURE_FIELDS:
+                attr, field = TICK_CAPTURE_FIELDS[key]
+                capture.write(self.capture_id, field, getattr(self, attr))
+
     #def update_handler(self, data):
     #    self.output('API_Symbol update: %s' % data)
     #    self.rawdata = data
@@ -374,6 +461,94 @@ class API_Order(object):
                 return True
         return False
 
+class OrderQuery(object):
+    """the filters and field list of a query_orders or query_executions request
+
+    tql() gives the what and where arguments of the ORDERS request, so the gateway only sends the
+    rows and fields asked for.  The gateway selects rows, not orders, and TQL cannot match whole
+    account numbers, so match() checks each rendered order as well.  status holds txtrader
+    statuses ('Filled') or gateway CURRENT_STATUS values ('LIVE'); since is an ORDER_TIME value
+    ('HH:MM:SS'), selecting the orders updated since then.
+    """
+
+    def __init__(self, status=None, symbol=None, account=None, since=None, fields=None):
+        self.status = set(status or [])
+        self.symbol = set([s.upper() for s in symbol or []])
+        self.account = set(account or [])
+        self.since = since
+        self.fields = fields or []
+
+    def tql(self):
+        """return (what, where) for the ORDERS request"""
+        what = '*'
+        if self.fields:
+            what = ','.join(ORDER_QUERY_FIELDS + [f for f in self.fields if f not in ORDER_QUERY_FIELDS + ORDER_RENDERED_FIELDS])
+        where = []
+        if self.status:
+            current = set([])
+            for status in self.status:
+                current.update(ORDER_STATUS_CURRENT.get(status, [status.upper()]))
+            where.append(tql_in('CURRENT_STATUS', current))
+        if self.symbol:
+            where.append(tql_in('DISP_NAME', self.symbol))
+        if self.account:
+            parts = [account.split('.') for account in self.account]
+            for i, field in enumerate(['BANK', 'BRANCH', 'CUSTOMER', 'DEPOSIT']):
+                where.append(tql_in(field, set([p[i] for p in parts if len(p) > i])))
+        if self.since:
+            where.append("ORDER_TIME>='%s'" % self.since)
+        return what, ','.join(where)
+
+    def match(self, fields):
+        """True if the rendered order fields pass the filters"""
+        if self.status and not (fields.get('status') in self.status or fields.get('CURRENT_STATUS') in self.status):
+            return False
+        if self.symbol and fields.get('symbol') not in self.symbol:
+            return False
+        if self.account and fields.get('account') not in self.account:
+            return False
+        if self.since and fields.get('ORDER_TIME', '') < self.since:
+            return False
+        return True
+
+    def project(self, fields):
+        if not self.fields:
+            return fields
+        return dict([(f, fields[f]) for f in self.fields if f in fields])
+
+
+def tql_in(field, values):
+    """a TQL where term matching any of values"""
+    values = sorted(values)
+    if len(values) == 1:
+        return "%s='%s'" % (field, values[0])
+    return '%s={%s}' % (field, ','.join(["'%s'" % v for v in values]))
+
+
+class StreamedResults(object):
+    """an order or execution collection, rendered one order at a time
+
+    items are the (id, API_Order) pairs selected when the request completes; render_item returns
+    the fields of an order, or None to leave it out.  The webserver renders the items a batch per
+    reactor turn as it writes them; rendered() is the whole dict, for the other clients.
+    """
+
+    def __init__(self, items, render_item):
+        self.items = items
+        self.render_item = render_item
+
+    def __len__(self):
+        return len(self.items)
+
+    def rendered(self):
+        results = {}
+        for k, v in self.items:
+            fields = self.render_item(v)
+            if fields is not None:
+                results[k] = fields
+        return results
+
+
 class API_Callback(object):
     def __init__(self, api, id, label, callable, timeout=0):
         """callable is stored and used to return results later"""
@@ -389,10 +564,20 @@ class API_Callback(object):
         self.data = None
         self.expired = False
 
+    def cancelled(self):
+        """True if the requester has gone away (an HTTP client that disconnected)"""
+        return bool(getattr(self.callable, 'cancelled', False))
+
     def complete(self, results):
         """complete callback by calling callable function with value of results"""
         self.elapsed = time.time() - self.started
-        if not self.done:
+        if self.cancelled():
+            # nobody is waiting: the order rows still update api.orders, but nothing is formatted
+            if self.label in ('orders', 'order_status', 'executions') and not self.data:
+                self.apply_order_rows(results)
+            self.callable = None
+            self.done = True
+        elif not self.done:
             ret = self.format_results(results)
             if self.callable.callback.__name__ == 'sendString':
                 ret = '%s.%s: %s' % (self.api.channel, self.label, ret)
@@ -408,11 +593,14 @@ class API_Callback(object):
     def check_expire(self):
         #SElf.api.output('API_Callback.check_expire() %s' % self)
         if not self.done:
-            if time.time() > self.expire:
+            if self.cancelled():
+                # done, so CheckPendingResults drops it; a late response is still recognized and discarded
+                self.done = True
+            elif time.time() > self.expire:
                 msg = 'error: callback expired: %s' % repr((self.id, self.label, self))
                 self.api.WriteAllClients(msg)
                 if self.callable.callback.__name__ == 'sendString':
-                    self.callable.callback('%s.error: %s callback expired', (self.api.channel, self.label))
+                    self.callable.callback('%s.error: %s callback expired' % (self.api.channel, self.label))
                 else:
                     self.callable.errback(Failure(Exception(msg)))
                 self.expired = True
@@ -431,6 +619,11 @@ class API_Callback(object):
         elif self.label == 'order_status':
             results = self.format_orders(results, self.id)
 
+        if self.label in STREAMED_RESULTS:
+            if getattr(self.callable, 'stream_results', False):
+                # the webserver renders and serializes these collections a batch at a time as it writes them
+                return results
+            results = results.rendered()
         return json.dumps(results)
 
     def format_account_data(self, rows):
@@ -457,27 +650,51 @@ class API_Callback(object):
         return positions
 
     def format_orders(self, rows, oid=None):
-        for row in rows or []:
-            if row:
-                self.api.handle_order_response(row)
+        if not self.data:
+            self.apply_order_rows(rows)
         if oid:
-            results = self.api.orders[oid].render()
-        else:
-            results={}
-            for k,v in self.api.orders.items():
-                results[k] = v.render()
-        return results
+            return self.api.orders[oid].render()
+        if self.data:
+            return StreamedResults(self.queried_orders(rows), self.render_queried_order)
+        return StreamedResults(self.api.orders.items(), self.render_order)
+
+    def render_order(self, order):
+        return order.render()
+
+    def render_queried_order(self, order):
+        fields = order.render()
+        if self.data.match(fields):
+            return self.data.project(fields)
 
     def format_executions(self, rows):
-        for row in rows:
+        if not self.data:
+            self.apply_order_rows(rows)
+        if self.data:
+            return StreamedResults(self.queried_orders(rows), self.render_queried_execution)
+        return StreamedResults(self.api.orders.items(), self.render_execution)
+
+    def render_execution(self, order):
+        if order.is_filled():
+            return dict(order.fields, updates=order.updates)
+
+    def render_queried_execution(self, order):
+        if order.is_filled() and self.data.match(order.fields):
+            return self.data.project(dict(order.fields, updates=order.updates))
+
+    def apply_order_rows(self, rows):
+        for row in rows or []:
             if row:
                 self.api.handle_order_response(row)
-        results={}
-        for k,v in self.api.orders.items():
-            if v.is_filled():
-                results[k]=v.fields
-                results[k]['updates']=v.updates
-        return results
+
+    def queried_orders(self, rows):
+        """the (oid, order) pairs of the orders in the rows of a filtered ORDERS request
+
+        The rows only select the orders: they may be projected, or older than the order's current
+        state (the gateway selects rows, not orders), so they are not applied to api.orders; the
+        ORDERS advise keeps the orders current.
+        """
+        oids = set([row['ORIGINAL_ORDER_ID'] for row in rows if row and 'ORIGINAL_ORDER_ID' in row])
+        return [(oid, self.api.orders[oid]) for oid in oids if oid in self.api.orders]
 
 class RTX_Connection(object):
     def __init__(self, api, service, topic, enable_logging=False):
@@ -690,12 +907,20 @@ class RTX(object):
         self.id = 'RTX'
         self.output('RTX init')
         self.config = Config(self.channel)
+        configure_logging(self.config)
         self.api_hostname = self.config.get('API_HOST')
         self.api_port = int(self.config.get('API_PORT'))
         self.username = self.config.get('USERNAME')
         self.password = self.config.get('PASSWORD')
         self.http_port = int(self.config.get('HTTP_PORT'))
         self.tcp_port = int(self.config.get('TCP_PORT'))
+        self.tcp_socket = self.config.get('TCP_SOCKET')
+        self.http_socket = self.config.get('HTTP_SOCKET')
+        self.socket_mode = int(self.config.get('SOCKET_MODE'), 8)
+        self.socket_auth = bool(int(self.config.get('SOCKET_AUTH')))
+        self.http_gzip = bool(int(self.config.get('HTTP_GZIP')))
+        self.client_high_water = int(self.config.get('CLIENT_HIGH_WATER'))
+        self.fanout_workers = int(self.config.get('FANOUT_WORKERS'))
         self.enable_ticker = bool(int(self.config.get('ENABLE_TICKER')))
         self.enable_high_low= bool(int(self.config.get('ENABLE_HIGH_LOW')))
         self.enable_seconds_tick = bool(int(self.config.get('ENABLE_SECONDS_TICK')))
@@ -703,6 +928,18 @@ class RTX(object):
         self.debug_api_messages = bool(int(self.config.get('DEBUG_API_MESSAGES')))
         self.log_client_messages = bool(int(self.config.get('LOG_CLIENT_MESSAGES')))
         self.log_order_updates = bool(int(self.config.get('LOG_ORDER_UPDATES')))
+        self.tick_capture = None
+        if bool(int(self.config.get('ENABLE_TICK_CAPTURE'))):
+            self.tick_capture = tickcapture.TickCapture(self.config.get('TICK_CAPTURE_DIR'), self.output)
+            reactor.addSystemEventTrigger('before', 'shutdown', self.tick_capture.close)
+        self.quote_table = None
+        if bool(int(self.config.get('ENABLE_QUOTE_TABLE'))):
+            self.quote_table = quotetable.QuoteTable(self.config.get('QUOTE_TABLE_FILE'), int(self.config.get('QUOTE_TABLE_CAPACITY')), self.output)
+            reactor.addSystemEventTrigger('before', 'shutdown', self.quote_table.close)
+        self.gateway_recorder = None
+        if bool(int(self.config.get('ENABLE_GATEWAY_RECORDER'))):
+            self.gateway_recorder = GatewayRecorder(self.config.get('GATEWAY_RECORD_DIR'), self.output)
+            reactor.addSystemEventTrigger('before', 'shutdown', self.gateway_recorder.close)
         self.callback_timeout = {}
         for t in TIMEOUT_TYPES:
             self.callback_timeout[t] = int(self.config.get('TIMEOUT_%s' % t))
@@ -712,6 +949,7 @@ class RTX(object):
         self.localzone = tzlocal.get_localzone()
         self.current_account = ''
         self.clients = set([])
+        self.event_symbols = SymbolTable()
         self.orders = {}
         self.pending_orders = {}
         self.tickets = {}
@@ -749,11 +987,16 @@ class RTX(object):
         self.cx_time = None
         self.seconds_disconnected = 0
         self.callback_metrics = {}
+        # bumped when the data changes; the webserver's response cache is keyed on them
+        self.data_version = {'accounts': 0, 'order_route': 0, 'symbols': 0}
         self.set_order_route(self.config.get('API_ROUTE'), None)
-        reactor.connectTCP(self.api_hostname, self.api_port, RtxClientFactory(self))
+        self.start_gateway()
         self.repeater = LoopingCall(self.EverySecond)
         self.repeater.start(1)
 
+    def start_gateway(self):
+        reactor.connectTCP(self.api_hostname, self.api_port, RtxClientFactory(self))
+
     def record_callback_metrics(self, label, elapsed, expired):
         m = self.callback_metrics.setdefault(label, {'tot':0, 'min': 9999, 'max': 0, 'avg': 0, 'exp': 0, 'hst': []})
         total = m['tot']  
@@ -800,6 +1043,7 @@ class RTX(object):
             self.seconds_disconnected = 0
             self.account_request_pending = False
             self.accounts = None
+            self.data_version['accounts'] += 1
             self.update_connection_status('Disconnected')
             self.error_handler(self.id, 'error: API Disconnected')
 
@@ -811,6 +1055,8 @@ class RTX(object):
             hexdump(msg)
         if self.log_api_messages:
             self.output('<-- %s' % repr(msg))
+        if self.gateway_recorder:
+            self.gateway_recorder.send(msg)
         if self.gateway_sender:
             self.gateway_sender('%s\n' % str(msg))
 
@@ -856,6 +1102,7 @@ class RTX(object):
         if data['msg'] == 'startup':
             self.connected = True
             self.accounts = None
+            self.data_version['accounts'] += 1
             self.update_connection_status('Startup')
             self.output('Connected to %s' % data['item'])
             self.setup_local_queries()
@@ -882,10 +1129,7 @@ class RTX(object):
         self.output('Initial Orders refresh complete.')
 
     def output(self, msg):
-        if 'error' in msg:
-            log.err(msg)
-        else:
-            log.msg(msg)
+        api_log.log(ERROR if 'error' in msg else INFO, msg)
 
     def open_client(self, client):
         self.clients.add(client)
@@ -897,7 +1141,12 @@ class RTX(object):
             if client in ts.clients:
                 ts.del_client(client)
                 if not ts.clients:
-                    del(self.symbols[ts.symbol])
+                    self.drop_symbol(ts.symbol)
+
+    def drop_symbol(self, symbol):
+        """remove an inactive symbol; every removal changes the query_symbols cache version"""
+        del(self.symbols[symbol])
+        self.data_version['symbols'] += 1
 
     def set_primary_exchange(self, symbol, exchange):
         if exchange:
@@ -964,7 +1213,8 @@ class RTX(object):
 
     def send_order_status(self, order):
         fields = order.render()
-        self.WriteAllClients('order.%s %s %s %s' % (fields['permid'], fields['account'], fields['TYPE'], fields['status']))
+        self.WriteAllClients('order.%s %s %s %s' % (fields['permid'], fields['account'], fields['TYPE'], fields['status']),
+                             (fields['permid'], [fields['account'], fields['TYPE'], fields['status']]))
 
     def make_account(self, row):
         return '%s.%s.%s.%s' % (row['BANK'], row['BRANCH'], row['CUSTOMER'], row['DEPOSIT'])
@@ -974,6 +1224,7 @@ class RTX(object):
         if rows:
             self.accounts = list(set([self.make_account(row) for row in rows]))
             self.accounts.sort()
+            self.data_version['accounts'] += 1
             self.account_request_pending = False
             self.WriteAllClients('accounts: %s' % json.dumps(self.accounts))
             self.update_connection_status('Up')
@@ -1025,9 +1276,7 @@ class RTX(object):
     def EverySecond(self):
         if self.connected:
             if self.enable_seconds_tick:
-                self.rtx_request('TA_SRV', 'LIVEQUOTE', 'LIVEQUOTE', 'DISP_NAME,TRDTIM_1,TRD_DATE',
-                                 "DISP_NAME='$TIME'", 'tick', self.handle_time, self.timer_callbacks, 
-                                 self.callback_timeout['TIMER'], self.handle_time_error)
+                self.request_time()
         else:
             self.seconds_disconnected += 1
             if self.seconds_disconnected > DISCONNECT_SECONDS:
@@ -1038,16 +1287,27 @@ class RTX(object):
         if not int(time.time()) % 60:
             self.EveryMinute()
 
+    def request_time(self):
+        self.rtx_request('TA_SRV', 'LIVEQUOTE', 'LIVEQUOTE', 'DISP_NAME,TRDTIM_1,TRD_DATE',
+                         "DISP_NAME='$TIME'", 'tick', self.handle_time, self.timer_callbacks, 
+                         self.callback_timeout['TIMER'], self.handle_time_error)
+
     def EveryMinute(self):
         if self.callback_metrics:
-            self.output('callback_metrics: %s' % json.dumps(self.callback_metrics))   
+            metrics_log.info('callback_metrics: %s', lazy(self.format_callback_metrics))
+            metrics_log.debug('callback_metrics history: %s', lazy(json.dumps, self.callback_metrics))
+
+    def format_callback_metrics(self):
+        """callback metrics without the elapsed time histories"""
+        return json.dumps(dict([(label, dict([(k, v) for k, v in m.items() if k != 'hst']))
+                                for label, m in self.callback_metrics.items()]))
 
-    def WriteAllClients(self, msg):
+    def WriteAllClients(self, msg, data=None):
+        """send msg to all clients; data holds the event fields for the binary encodings"""
         if self.log_client_messages:
             self.output('WriteAllClients: %s.%s' % (self.channel, msg))
-        msg = str('%s.%s' % (self.channel, msg))
-        for c in self.clients:
-            c.sendString(msg)
+        if self.clients:
+            write_event(self.clients, Event(self.channel, msg, data, self.event_symbols))
 
     def error_handler(self, id, msg):
         """report error messages"""
@@ -1108,7 +1368,8 @@ class RTX(object):
                 self.now = self.feedzone.localize(datetime.datetime(year,month,day,hour,minute,second)).astimezone(self.localzone)
                 if minute != self.last_minute:
                     self.last_minute = minute
-                    self.WriteAllClients('time: %s %s:00' % (self.now.strftime('%Y-%m-%d'), self.now.strftime('%H:%M')))
+                    timestamp = '%s:00' % self.now.strftime('%Y-%m-%d %H:%M')
+                    self.WriteAllClients('time: %s' % timestamp, timestamp)
         else:
             self.error_handler(self.id, 'handle_time: unexpected null input')
 
@@ -1296,7 +1557,7 @@ class RTX(object):
             cb.complete({'status': 'Error', 'errorMsg': 'Order not found', 'id': oid})
 
     def symbol_enable(self, symbol, client, callback):
-        self.output('symbol_enable(%s,%s,%s)' % (symbol, client, callback))
+        symbol_log.info('symbol_enable(%s,%s,%s)', symbol, client, callback)
         if not symbol in self.symbols.keys():
             cb = API_Callback(self, symbol, 'add-symbol', callback, self.callback_timeout['ADDSYMBOL'])
             symbol = API_Symbol(self, symbol, client, cb)
@@ -1304,7 +1565,14 @@ class RTX(object):
         else:
             self.symbols[symbol].add_client(client)
             API_Callback(self, symbol, 'add-symbol', callback).complete(True)
-        self.output('symbol_enable: symbols=%s' % repr(self.symbols))
+            self.send_snapshot(self.symbols[symbol], client)
+        symbol_log.debug('symbol_enable: symbols=%r', sorted(self.symbols))
+
+    def send_snapshot(self, symbol, client):
+        """send the current quote and trade to a client that subscribed to an already streaming symbol"""
+        if isinstance(client, EventSubscriber):
+            for msg, data in symbol.snapshot_events():
+                client.send_event(Event(self.channel, msg, data, self.event_symbols))
 
     def symbol_init(self, symbol):
         ret = not 'SYMBOL_ERROR' in symbol.rawdata.keys()
@@ -1314,16 +1582,16 @@ class RTX(object):
         return ret
 
     def symbol_disable(self, symbol, client):
-        self.output('symbol_disable(%s,%s)' % (symbol, client))
-        self.output('self.symbols=%s' % repr(self.symbols))
+        symbol_log.info('symbol_disable(%s,%s)', symbol, client)
+        symbol_log.debug('self.symbols=%r', sorted(self.symbols))
         if symbol in self.symbols.keys():
             ts = self.symbols[symbol]
             ts.del_client(client)
             if not ts.clients:
-                del(self.symbols[symbol])
-            self.output('ret True: self.symbols=%s' % repr(self.symbols))
+                self.drop_symbol(symbol)
+            symbol_log.debug('ret True: self.symbols=%r', sorted(self.symbols))
             return True
-        self.output('ret False: self.symbols=%s' % repr(self.symbols))
+        symbol_log.debug('ret False: self.symbols=%r', sorted(self.symbols))
 
     def update_connection_status(self, status):
         self.connection_status = status
@@ -1348,10 +1616,13 @@ class RTX(object):
         cxn.request('POSITION', '*', '', cb)
         self.position_callbacks.append(cb)
 
-    def request_orders(self, callback):
+    def request_orders(self, callback, **filters):
+        """filters are the OrderQuery arguments; without them all orders are requested"""
         cxn = self.cxn_get('ACCOUNT_GATEWAY', 'ORDER')
         cb = API_Callback(self, 0, 'orders', callback, self.callback_timeout['ORDERSTATUS'])
-        cxn.request('ORDERS', '*', '', cb)
+        cb.data = OrderQuery(**filters) if filters else None
+        what, where = cb.data.tql() if cb.data else ('*', '')
+        cxn.request('ORDERS', what, where, cb)
         self.openorder_callbacks.append(cb)
 
     def request_order(self, oid, callback):
@@ -1359,9 +1630,12 @@ class RTX(object):
         self.cxn_get('ACCOUNT_GATEWAY', 'ORDER').request('ORDERS', '*', "ORIGINAL_ORDER_ID='%s'" % oid, cb)
         self.order_status_callbacks.append(cb)
 
-    def request_executions(self, callback):
+    def request_executions(self, callback, **filters):
+        """filters are the OrderQuery arguments; without them all orders are requested"""
         cb = API_Callback(self, 0, 'executions', callback, self.callback_timeout['ORDERSTATUS'])
-        self.cxn_get('ACCOUNT_GATEWAY', 'ORDER').request('ORDERS', '*', '', cb)
+        cb.data = OrderQuery(**filters) if filters else None
+        what, where = cb.data.tql() if cb.data else ('*', '')
+        self.cxn_get('ACCOUNT_GATEWAY', 'ORDER').request('ORDERS', what, where, cb)
         self.execution_callbacks.append(cb)
 
     def request_account_data(self, account, fields, callback):
@@ -1420,6 +1694,7 @@ class RTX(object):
                 route = {route: None}
         if (type(route)==dict) and (len(route.keys()) == 1) and (type(route.keys()[0]) in [str, unicode]):
             self.order_route = route
+            self.data_version['order_route'] += 1
             if callback:
                 self.get_order_route(callback)
         else:
@@ -0,0 +1,557 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  simulator.py
+  ------------
+
+  TxTrader RTGW simulator - a local stand-in for the RealTick gateway for load testing
+
+  Speaks the RTGW line protocol used by RTX (connect, request, advise, adviserequest, unadvise,
+  poke, execute, terminate; ack/status/response/update messages and the startup system message)
+  and serves the tables RTX uses:
+
+    LIVEQUOTE   synthetic random walk quotes and trades, pushed at a fixed rate per symbol
+    ORDERS      order lifecycle: PENDING -> LIVE -> fills; cancels, changes, rejects
+    ACCOUNT     the configured accounts
+    POSITION    positions resulting from simulated fills
+    DEPOSIT     account equity
+
+  Symbols of one to eight characters [A-Z0-9.] are valid; anything else is reported as an unknown
+  symbol and its orders are rejected.  Every reply and order event is delayed by the configured
+  latency (plus optional random jitter); with zero latency replies are written synchronously.
+
+  usage: envdir etc/txtrader python -m txtrader.simulator [options]
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import datetime
+import ujson as json
+from collections import OrderedDict
+
+import pytz
+from twisted.python import log
+from twisted.internet import reactor
+from twisted.internet.protocol import ServerFactory
+from twisted.internet.task import LoopingCall
+from twisted.protocols.basic import LineReceiver
+
+# market data generation interval; each interval carries rate * TICK_INTERVAL updates per symbol
+TICK_INTERVAL = 0.05
+
+VALID_SYMBOL = re.compile(r'^[A-Z0-9.]{1,8}$')
+TQL_TERM = re.compile(r"(\w+)(>=|=)(?:'([^']*)'|\{([^}]*)\})")
+
+QUOTE_FIELDS = ['BID', 'BIDSIZE', 'ASK', 'ASKSIZE']
+TRADE_FIELDS = ['TRDPRC_1', 'TRDVOL_1', 'ACVOL_1', 'HIGH_1', 'LOW_1', 'VWAP', 'TRDTIM_1']
+
+ACK = {
+    'request': 'REQUEST_OK',
+    'advise': 'ADVISE_OK',
+    'adviserequest': 'ADVISEREQUEST_OK',
+    'unadvise': 'UNADVISE_OK',
+    'poke': 'POKE_OK',
+    'execute': 'EXECUTE_OK',
+    'terminate': 'TERMINATE_OK',
+}
+
+
+def parse_where(where):
+    """parse a TQL where clause of the form A='x',B={'y','z'},C>='w' into {field: set(values) or ('>=', value)}"""
+    terms = {}
+    for field, op, value, values in TQL_TERM.findall(where):
+        if op == '>=':
+            terms[field] = (op, value)
+        elif values:
+            terms[field] = set([v.strip().strip("'") for v in values.split(',')])
+        else:
+            terms[field] = set([value])
+    return terms
+
+
+def match_where(row, terms):
+    for field, values in terms.items():
+        if isinstance(values, tuple):
+            if row.get(field) is None or row.get(field) < values[1]:
+                return False
+        elif row.get(field) not in values:
+            return False
+    return True
+
+
+def project(row, what):
+    if what == '*':
+        return row
+    return dict([(f, row[f]) for f in what.split(',') if f in row])
+
+
+def parse_poke(data):
+    """parse poke data 'FIELD=value,FIELD=value' into an OrderedDict"""
+    fields = OrderedDict()
+    for item in data.split(','):
+        if '=' in item:
+            k, v = item.split('=', 1)
+            fields[k] = v
+    return fields
+
+
+class SimSymbol(object):
+    def __init__(self, symbol, rng):
+        self.symbol = symbol
+        self.close = round(rng.uniform(10, 500), 2)
+        self.last = self.close
+        self.size = 100
+        self.volume = 0
+        self.turnover = 0.0
+        self.high = self.close
+        self.low = self.close
+        self.bid = round(self.close - 0.01, 2)
+        self.ask = round(self.close + 0.01, 2)
+        self.bid_size = 100
+        self.ask_size = 100
+        self.updates = 0.0
+
+    def vwap(self):
+        return self.turnover / self.volume if self.volume else self.close
+
+    def step_quote(self, rng):
+        mid = max(round((self.bid + self.ask) / 2 + rng.choice([-0.01, 0.0, 0.01]), 2), 0.02)
+        spread = rng.choice([0.01, 0.01, 0.02, 0.03])
+        self.bid = round(mid - spread / 2, 2) if spread > 0.01 else round(mid - 0.01, 2)
+        self.ask = round(self.bid + spread, 2)
+        self.bid_size = rng.randint(1, 20) * 100
+        self.ask_size = rng.randint(1, 20) * 100
+        return QUOTE_FIELDS
+
+    def step_trade(self, rng):
+        self.trade(rng.choice([self.bid, self.ask]), rng.randint(1, 10) * 100)
+        return TRADE_FIELDS
+
+    def trade(self, price, size):
+        self.last = price
+        self.size = size
+        self.volume += size
+        self.turnover += price * size
+        self.high = max(self.high, price)
+        self.low = min(self.low, price)
+
+    def row(self, fields=None):
+        row = {
+            'DISP_NAME': self.symbol,
+            'COMPANY_NAME': '%s SIMULATED' % self.symbol,
+            'TRDPRC_1': '%.2f' % self.last,
+            'TRDVOL_1': '%d' % self.size,
+            'ACVOL_1': '%d' % self.volume,
+            'BID': '%.2f' % self.bid,
+            'BIDSIZE': '%d' % self.bid_size,
+            'ASK': '%.2f' % self.ask,
+            'ASKSIZE': '%d' % self.ask_size,
+            'HIGH_1': '%.2f' % self.high,
+            'LOW_1': '%.2f' % self.low,
+            'HST_CLOSE': '%.2f' % self.close,
+            'VWAP': '%.2f' % self.vwap(),
+            'TRDTIM_1': time.strftime('%H:%M:%S'),
+        }
+        if fields:
+            row = dict([(f, row[f]) for f in fields if f in row])
+            row['DISP_NAME'] = self.symbol
+        return row
+
+
+class SimOrder(object):
+    def __init__(self, oid, fields):
+        self.oid = oid
+        self.fields = fields
+        self.rows = []
+        self.state = {}
+        self.symbol = fields.get('DISP_NAME')
+        self.account = '.'.join([fields.get(k, '') for k in ['BANK', 'BRANCH', 'CUSTOMER', 'DEPOSIT']])
+        self.side = -1 if fields.get('BUYORSELL', 'Buy').startswith('Sell') else 1
+        self.volume = int(float(fields.get('VOLUME', 0) or 0))
+        self.filled = 0
+        self.avg_price = 0.0
+        self.triggered = False
+        self.status = 'PENDING'
+
+    def residual(self):
+        return self.volume - self.filled
+
+
+class GatewaySimulatorProtocol(LineReceiver):
+    delimiter = '\n'
+    MAX_LENGTH = 0x1000000
+
+    def connectionMade(self):
+        self.cxns = {}
+        self.due = 0
+        self.factory.client_connected(self)
+        self.deliver([('system', None, {'msg': 'startup', 'item': 'RTGW Simulator %s' % self.factory.label})])
+
+    def connectionLost(self, reason):
+        self.factory.client_disconnected(self)
+
+    def lineReceived(self, line):
+        line = line.strip()
+        if not line:
+            return
+        self.factory.stats['received'] += 1
+        cmd, cid, args = (line.split(' ', 2) + ['', ''])[:3]
+        if cmd == 'connect':
+            self.cxns[cid] = args
+            self.deliver([('ack', cid, 'CONNECTION PENDING'), ('status', cid, {'msg': 'OnInitAck', 'status': '1'})])
+        elif cid not in self.cxns:
+            self.factory.output('simulator: command on unknown connection: %s' % line)
+        elif cmd in ['request', 'advise', 'adviserequest', 'unadvise']:
+            table, what, where = (args.split(';', 2) + ['', ''])[:3]
+            self.handle_query(cmd, cid, table, what, where)
+        elif cmd == 'poke':
+            tql, data = (args.split('!', 1) + [''])[:2]
+            self.deliver([('ack', cid, ACK[cmd]), ('status', cid, {'msg': 'OnOtherAck', 'status': '1'})])
+            if tql.startswith('ORDERS;'):
+                self.factory.order_poke(parse_poke(data))
+        elif cmd in ACK:
+            self.deliver([('ack', cid, ACK[cmd])])
+        else:
+            self.deliver([('ack', cid, 'UNKNOWN_COMMAND')])
+
+    def handle_query(self, cmd, cid, table, what, where):
+        messages = [('ack', cid, ACK[cmd])]
+        if cmd in ['request', 'adviserequest']:
+            rows = self.factory.query(table, what, where)
+            if rows is None:
+                self.deliver(messages + [('status', cid, {'msg': 'OnTerminate', 'status': '0'})])
+                return
+            rows = rows or [None]
+            for i, row in enumerate(rows):
+                messages.append(('response', cid, {'row': row, 'complete': i == len(rows) - 1}))
+        if cmd == 'unadvise':
+            self.factory.unadvise(self, cid)
+        elif cmd in ['advise', 'adviserequest']:
+            self.factory.advise(self, cid, table, what, where)
+        if cmd != 'request':
+            messages.append(('status', cid, {'msg': 'OnOtherAck', 'status': '1'}))
+        self.deliver(messages)
+
+    def deliver(self, messages):
+        """write messages after the simulated latency, preserving order on this connection"""
+        delay = self.factory.delay()
+        if delay:
+            now = time.time()
+            self.due = max(now + delay, self.due)
+            reactor.callLater(self.due - now, self.write_messages, messages)
+        else:
+            self.write_messages(messages)
+
+    def write_messages(self, messages):
+        if not self.transport:
+            return
+        stats = self.factory.stats
+        for msg_type, cid, data in messages:
+            self.sendLine(json.dumps({'type': msg_type, 'id': cid, 'data': data}))
+            stats['sent'] += 1
+            stats['types'][msg_type] = stats['types'].get(msg_type, 0) + 1
+
+
+class GatewaySimulator(ServerFactory):
+    protocol = GatewaySimulatorProtocol
+
+    def __init__(self, accounts, rate=1.0, latency=0.0, jitter=0.0, fill_size=0, timezone=None, seed=None, output=None):
+        self.label = time.strftime('%Y%m%d-%H%M%S')
+        self.accounts = accounts
+        self.rate = rate
+        self.latency = latency
+        self.jitter = jitter
+        self.fill_size = fill_size
+        self.timezone = pytz.timezone(timezone) if timezone else None
+        self.rng = random.Random(seed)
+        self.output = output or log.msg
+        self.clients = set([])
+        self.symbols = {}
+        self.quote_advises = {}
+        self.order_advises = {}
+        self.orders = OrderedDict()
+        self.working = {}
+        self.positions = {}
+        self.cash = dict([(account, 1000000.0) for account in accounts])
+        self.next_id = 0
+        self.stats = {'received': 0, 'sent': 0, 'types': {}, 'orders': 0, 'fills': 0, 'quotes': 0}
+        self.ticker = LoopingCall(self.tick)
+
+    def __str__(self):
+        return 'GatewaySimulator(rate=%s latency=%s jitter=%s clients=%d symbols=%d orders=%d)' % (
+            self.rate, self.latency, self.jitter, len(self.clients), len(self.symbols), len(self.orders))
+
+    def __repr__(self):
+        return str(self)
+
+    def startFactory(self):
+        if self.rate:
+            self.ticker.start(TICK_INTERVAL, now=False)
+
+    def stopFactory(self):
+        if self.ticker.running:
+            self.ticker.stop()
+
+    def client_connected(self, protocol):
+        self.output('%s client connected' % self)
+        self.clients.add(protocol)
+
+    def client_disconnected(self, protocol):
+        self.clients.discard(protocol)
+        for advises in [self.quote_advises, self.order_advises]:
+            for key in [k for k in advises if k[0] is protocol]:
+                del advises[key]
+        self.output('%s client disconnected: %s' % (self, json.dumps(self.stats)))
+
+    def delay(self):
+        if self.jitter:
+            return self.latency + self.rng.uniform(0, self.jitter)
+        return self.latency
+
+    def create_id(self):
+        self.next_id += 1
+        return 'SIM%08d' % self.next_id
+
+    def get_symbol(self, symbol):
+        if symbol not in self.symbols:
+            if not VALID_SYMBOL.match(symbol):
+                return None
+            self.symbols[symbol] = SimSymbol(symbol, self.rng)
+        return self.symbols[symbol]
+
+    def account_row(self, account):
+        return OrderedDict(zip(['BANK', 'BRANCH', 'CUSTOMER', 'DEPOSIT'], account.split('.')[:4]))
+
+    # queries
+
+    def query(self, table, what, where):
+        terms = parse_where(where)
+        if table == 'LIVEQUOTE':
+            rows = [self.quote_row(name) for name in terms.get('DISP_NAME', [])]
+        elif table == 'ORDERS':
+            rows = []
+            for order in self.orders.values():
+                if match_where(order.state, terms):
+                    rows.extend(order.rows)
+        elif table == 'ACCOUNT':
+            rows = [self.account_row(account) for account in self.accounts]
+        elif table == 'POSITION':
+            rows = []
+            for (account, symbol), quantity in sorted(self.positions.items()):
+                row = self.account_row(account)
+                row.update({'DISP_NAME': symbol, 'LONGPOS': '%d' % max(quantity, 0), 'SHORTPOS': '%d' % max(-quantity, 0)})
+                rows.append(row)
+        elif table == 'DEPOSIT':
+            rows = []
+            for account in self.accounts:
+                row = self.account_row(account)
+                row['EXCESS_EQ'] = '%.2f' % self.equity(account)
+                rows.append(row)
+        else:
+            return None
+        return [project(row, what) for row in rows if match_where(row, terms)]
+
+    def quote_row(self, name):
+        if name == '$TIME':
+            now = datetime.datetime.now(self.timezone) if self.timezone else datetime.datetime.now()
+            return {'DISP_NAME': name, 'TRDTIM_1': now.strftime('%H:%M:%S'), 'TRD_DATE': now.strftime('%Y-%m-%d')}
+        symbol = self.get_symbol(name)
+        if not symbol:
+            return {'DISP_NAME': name, 'SYMBOL_ERROR': 'Error 17'}
+        return symbol.row()
+
+    def equity(self, account):
+        value = self.cash.get(account, 0.0)
+        for (a, symbol), quantity in self.positions.items():
+            if a == account:
+                value += quantity * self.symbols[symbol].last
+        return value
+
+    def advise(self, protocol, cid, table, what, where):
+        if table == 'LIVEQUOTE':
+            fields = None if what == '*' else what.split(',')
+            for name in parse_where(where).get('DISP_NAME', []):
+                if self.get_symbol(name):
+                    self.quote_advises[(protocol, cid)] = (name, fields)
+        elif table == 'ORDERS':
+            self.order_advises[(protocol, cid)] = (what, parse_where(where))
+
+    def unadvise(self, protocol, cid):
+        self.quote_advises.pop((protocol, cid), None)
+        self.order_advises.pop((protocol, cid), None)
+
+    # market data
+
+    def tick(self):
+        """generate the updates due for one TICK_INTERVAL and check working orders against the new prices"""
+        advised = dict([(name, []) for name in self.working if self.working[name]])
+        for (protocol, cid), (name, fields) in self.quote_advises.items():
+            advised.setdefault(name, []).append((protocol, cid, fields))
+        for name, subscribers in advised.items():
+            symbol = self.symbols[name]
+            symbol.updates += self.rate * TICK_INTERVAL
+            while symbol.updates >= 1:
+                symbol.updates -= 1
+                self.update_symbol(symbol, subscribers)
+            if self.working.get(name):
+                self.check_orders(symbol)
+
+    def update_symbol(self, symbol, subscribers):
+        if self.rng.random() < 0.7:
+            changed = symbol.step_quote(self.rng)
+        else:
+            changed = symbol.step_trade(self.rng)
+        self.stats['quotes'] += 1
+        row = symbol.row()
+        for protocol, cid, fields in subscribers:
+            data = dict([(f, row[f]) for f in changed if fields is None or f in fields])
+            if data:
+                protocol.deliver([('update', cid, {'row': data})])
+
+    # orders
+
+    def order_poke(self, fields):
+        otype = fields.get('TYPE', '')
+        if otype == 'UserSubmitCancel':
+            self.cancel_order(fields)
+        elif otype == 'UserSubmitChange':
+            self.change_order(fields)
+        elif otype in ['UserSubmitOrder', 'UserSubmitStagedOrder']:
+            self.submit_order(fields)
+        else:
+            self.output('simulator: unsupported order TYPE: %s' % otype)
+
+    def order_event(self, order, otype, status, **extra):
+        row = OrderedDict(order.fields)
+        row['ORIGINAL_ORDER_ID'] = order.oid
+        row['ORDER_ID'] = order.oid if not order.rows else self.create_id()
+        row['TYPE'] = otype
+        row['CURRENT_STATUS'] = status
+        row['ORIGINAL_VOLUME'] = '%d' % order.volume
+        row['VOLUME_TRADED'] = '%d' % order.filled
+        row['ORDER_RESIDUAL'] = '%d' % order.residual()
+        row['AVG_PRICE'] = '%.2f' % order.avg_price
+        row['ORDER_TIME'] = time.strftime('%H:%M:%S')
+        for k, v in extra.items():
+            row[k] = v
+        if order.rows:
+            row.pop('CLIENT_ORDER_ID', None)
+        order.status = status
+        order.rows.append(row)
+        order.state.update(row)
+        for (protocol, cid), (what, terms) in self.order_advises.items():
+            if match_where(row, terms):
+                protocol.deliver([('update', cid, {'row': project(row, what)})])
+
+    def later(self, f, *args):
+        delay = self.delay()
+        if delay:
+            reactor.callLater(delay, f, *args)
+        else:
+            f(*args)
+
+    def submit_order(self, fields):
+        order = SimOrder(self.create_id(), fields)
+        self.orders[order.oid] = order
+        self.stats['orders'] += 1
+        if fields['TYPE'] == 'UserSubmitStagedOrder':
+            self.order_event(order, 'UserSubmitStagedOrder', 'LIVE')
+        elif order.account not in self.accounts:
+            self.order_event(order, 'ClerkReject', 'COMPLETED', REASON='Unknown account')
+        elif not self.get_symbol(order.symbol or ''):
+            self.order_event(order, 'ClerkReject', 'COMPLETED', REASON='Unknown symbol')
+        elif order.volume <= 0:
+            self.order_event(order, 'ClerkReject', 'COMPLETED', REASON='Invalid volume')
+        else:
+            self.order_event(order, 'UserSubmitOrder', 'PENDING')
+            self.later(self.accept_order, order)
+
+    def accept_order(self, order):
+        if order.status in ['PENDING', 'COMPLETED']:
+            self.order_event(order, 'ExchangeAcceptOrder', 'LIVE')
+            self.working.setdefault(order.symbol, {})[order.oid] = order
+            self.later(self.check_orders, self.symbols[order.symbol])
+
+    def cancel_order(self, fields):
+        order = self.orders.get(fields.get('REFERS_TO_ID'))
+        if order and order.status in ['PENDING', 'LIVE']:
+            self.working.get(order.symbol, {}).pop(order.oid, None)
+            self.order_event(order, 'UserSubmitCancel', 'COMPLETED', REASON='User cancel')
+            order.status = 'CANCELLED'
+
+    def change_order(self, fields):
+        order = self.orders.get(fields.get('REFERS_TO_ID'))
+        if order and order.status in ['PENDING', 'LIVE']:
+            for k in ['PRICE', 'STOP_PRICE', 'PRICE_TYPE', 'VOLUME']:
+                if k in fields:
+                    order.fields[k] = fields[k]
+            order.volume = int(float(order.fields.get('VOLUME', order.volume)))
+            self.working.get(order.symbol, {}).pop(order.oid, None)
+            self.order_event(order, 'UserSubmitChange', 'COMPLETED')
+            self.later(self.accept_order, order)
+
+    def check_orders(self, symbol):
+        for order in self.working.get(symbol.symbol, {}).values():
+            price = self.fill_price(order, symbol)
+            if price is not None:
+                self.fill_order(order, symbol, price)
+
+    def fill_price(self, order, symbol):
+        """return the execution price if the working order is marketable at current prices"""
+        market = symbol.ask if order.side > 0 else symbol.bid
+        price_type = order.fields.get('PRICE_TYPE', 'Market')
+        if price_type in ['Stop', 'StopLimit'] and not order.triggered:
+            stop = float(order.fields.get('STOP_PRICE', 0))
+            if (order.side > 0 and symbol.last < stop) or (order.side < 0 and symbol.last > stop):
+                return None
+            order.triggered = True
+        if price_type in ['AsEntered', 'StopLimit']:
+            limit = float(order.fields.get('PRICE', 0))
+            if (order.side > 0 and market > limit) or (order.side < 0 and market < limit):
+                return None
+        return market
+
+    def fill_order(self, order, symbol, price):
+        quantity = min(order.residual(), self.fill_size) if self.fill_size else order.residual()
+        order.avg_price = (order.avg_price * order.filled + price * quantity) / (order.filled + quantity)
+        order.filled += quantity
+        symbol.trade(price, quantity)
+        key = (order.account, order.symbol)
+        self.positions[key] = self.positions.get(key, 0) + order.side * quantity
+        self.cash[order.account] = self.cash.get(order.account, 0.0) - order.side * quantity * price
+        self.stats['fills'] += 1
+        if order.residual():
+            self.order_event(order, 'ExchangeTradeOrder', 'LIVE', PRICE_TRADED='%.2f' % price, VOLUME_TRADED_LAST='%d' % quantity)
+        else:
+            self.working[order.symbol].pop(order.oid, None)
+            self.order_event(order, 'ExchangeTradeOrder', 'COMPLETED', PRICE_TRADED='%.2f' % price, VOLUME_TRADED_LAST='%d' % quantity)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='RTGW protocol simulator')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('TXTRADER_API_PORT', 51070)))
+    parser.add_argument('--interface', default='127.0.0.1')
+    parser.add_argument('--account', action='append', help='account BANK.BRANCH.CUSTOMER.DEPOSIT (repeatable)')
+    parser.add_argument('--rate', type=float, default=1.0, help='LIVEQUOTE updates per second per advised symbol')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every reply and order event')
+    parser.add_argument('--jitter', type=float, default=0.0, help='maximum random seconds added to latency')
+    parser.add_argument('--fill-size', type=int, default=0, help='maximum shares per fill (0 fills the order at once)')
+    parser.add_argument('--timezone', default=os.environ.get('TXTRADER_API_TIMEZONE'), help='timezone of the $TIME symbol')
+    parser.add_argument('--seed', type=int, default=None)
+    options = parser.parse_args()
+    accounts = options.account or [os.environ.get('TXTRADER_API_ACCOUNT', 'DEMO1.TEST.DEMO.1')]
+
+    log.startLogging(sys.stdout)
+    simulator = GatewaySimulator(accounts, options.rate, options.latency, options.jitter, options.fill_size,
+                                 options.timezone, options.seed)
+    reactor.listenTCP(options.port, simulator, interface=options.interface)
+    log.msg('%s listening on %s:%d' % (simulator, options.interface, options.port))
+    reactor.run()
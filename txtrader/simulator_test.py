@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+  simulator_test.py
+  -----------------
+
+  TxTrader RTGW simulator unit test script
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+from txtrader import simulator
+from txtrader.simulator import GatewaySimulator, parse_where
+from twisted.test import proto_helpers
+
+import os
+import ujson as json
+import pytest
+
+ACCOUNT = 'DEMO1.TEST.DEMO.1'
+
+
+class Gateway(object):
+    def __init__(self, **kwargs):
+        self.simulator = GatewaySimulator([ACCOUNT], seed=1, output=lambda msg: None, **kwargs)
+        self.protocol = self.simulator.buildProtocol(('127.0.0.1', 0))
+        self.transport = proto_helpers.StringTransport()
+        self.protocol.makeConnection(self.transport)
+
+    def send(self, line):
+        self.protocol.dataReceived('%s\n' % line)
+
+    def messages(self):
+        lines = [l for l in self.transport.value().split('\n') if l]
+        self.transport.clear()
+        return [json.loads(l) for l in lines]
+
+    def connect(self, cid, key='ACCOUNT_GATEWAY;ORDER'):
+        self.send('connect %s %s' % (cid, key))
+        return self.messages()
+
+
+@pytest.fixture
+def gw():
+    return Gateway()
+
+
+def test_startup_and_connect(gw):
+    startup = gw.messages()
+    assert startup == [{'type': 'system', 'id': None, 'data': {'msg': 'startup', 'item': startup[0]['data']['item']}}]
+    assert gw.connect('c1') == [
+        {'type': 'ack', 'id': 'c1', 'data': 'CONNECTION PENDING'},
+        {'type': 'status', 'id': 'c1', 'data': {'msg': 'OnInitAck', 'status': '1'}},
+    ]
+
+
+def test_parse_where():
+    assert parse_where("DISP_NAME='IBM'") == {'DISP_NAME': set(['IBM'])}
+    assert parse_where("A='1',CURRENT_STATUS={'LIVE','PENDING'}") == {'A': set(['1']), 'CURRENT_STATUS': set(['LIVE', 'PENDING'])}
+    assert parse_where("ORDER_TIME>='09:30:00'") == {'ORDER_TIME': ('>=', '09:30:00')}
+
+
+def test_request_account(gw):
+    gw.connect('c1')
+    gw.send('request c1 ACCOUNT;*;')
+    ack, response = gw.messages()
+    assert ack['data'] == 'REQUEST_OK'
+    assert response['data'] == {'row': {'BANK': 'DEMO1', 'BRANCH': 'TEST', 'CUSTOMER': 'DEMO', 'DEPOSIT': '1'}, 'complete': True}
+
+
+def test_livequote_advise(gw):
+    gw.connect('q1', 'TA_SRV;LIVEQUOTE')
+    gw.send("request q1 LIVEQUOTE;*;DISP_NAME='IBM'")
+    ack, response = gw.messages()
+    assert response['data']['row']['DISP_NAME'] == 'IBM'
+    assert 'HST_CLOSE' in response['data']['row']
+
+    gw.send("request q1 LIVEQUOTE;*;DISP_NAME='BADSYMBOL'")
+    assert 'SYMBOL_ERROR' in gw.messages()[1]['data']['row']
+
+    gw.send("advise q1 LIVEQUOTE;TRDPRC_1,TRDVOL_1,ACVOL_1;DISP_NAME='IBM'")
+    assert [m['data'] for m in gw.messages()] == ['ADVISE_OK', {'msg': 'OnOtherAck', 'status': '1'}]
+    gw.simulator.rate = 200
+    gw.simulator.tick()
+    updates = gw.messages()
+    assert len(updates) > 0
+    for update in updates:
+        assert update['type'] == 'update'
+        assert set(update['data']['row'].keys()) <= set(['TRDPRC_1', 'TRDVOL_1', 'ACVOL_1'])
+
+
+def _orders(gw, fields):
+    gw.connect('o1')
+    gw.send('advise o1 ORDERS;*;')
+    gw.connect('o2')
+    gw.messages()
+    gw.send('poke o2 ORDERS;*;!%s' % ','.join(['%s=%s' % i for i in fields]))
+    messages = gw.messages()
+    assert [m['data'] for m in messages[:2]] == ['POKE_OK', {'msg': 'OnOtherAck', 'status': '1'}]
+    return [m['data']['row'] for m in messages[2:]]
+
+
+def _order_fields(symbol, quantity, price_type='Market', price=None):
+    fields = [('BANK', 'DEMO1'), ('BRANCH', 'TEST'), ('CUSTOMER', 'DEMO'), ('DEPOSIT', '1'),
+              ('BUYORSELL', 'Buy' if quantity > 0 else 'Sell'), ('DISP_NAME', symbol),
+              ('PRICE_TYPE', price_type), ('VOLUME', abs(quantity)), ('CLIENT_ORDER_ID', 'coid-1'),
+              ('TYPE', 'UserSubmitOrder')]
+    if price is not None:
+        fields.append(('PRICE', price))
+    return fields
+
+
+def test_market_order_fill(gw):
+    rows = _orders(gw, _order_fields('IBM', 300))
+    assert [(r['TYPE'], r['CURRENT_STATUS']) for r in rows] == [
+        ('UserSubmitOrder', 'PENDING'), ('ExchangeAcceptOrder', 'LIVE'), ('ExchangeTradeOrder', 'COMPLETED')]
+    assert rows[0]['CLIENT_ORDER_ID'] == 'coid-1'
+    assert 'CLIENT_ORDER_ID' not in rows[1]
+    assert len(set([r['ORIGINAL_ORDER_ID'] for r in rows])) == 1
+    assert rows[2]['VOLUME_TRADED'] == rows[2]['ORIGINAL_VOLUME'] == '300'
+
+    gw.send('request o2 POSITION;*;')
+    response = gw.messages()[1]['data']['row']
+    assert (response['DISP_NAME'], response['LONGPOS'], response['SHORTPOS']) == ('IBM', '300', '0')
+
+    oid = rows[0]['ORIGINAL_ORDER_ID']
+    gw.send("request o2 ORDERS;*;ORIGINAL_ORDER_ID='%s'" % oid)
+    assert [m['data']['row'] for m in gw.messages()[1:]] == rows
+
+
+def test_partial_fills():
+    gw = Gateway(fill_size=100)
+    rows = _orders(gw, _order_fields('IBM', 200))
+    assert [(r['TYPE'], r['CURRENT_STATUS'], r['VOLUME_TRADED']) for r in rows[2:]] == [
+        ('ExchangeTradeOrder', 'LIVE', '100')]
+    gw.simulator.tick()
+    rows = [m['data']['row'] for m in gw.messages() if m['id'] == 'o1']
+    assert [(r['TYPE'], r['CURRENT_STATUS'], r['VOLUME_TRADED']) for r in rows] == [
+        ('ExchangeTradeOrder', 'COMPLETED', '200')]
+
+
+def test_order_reject(gw):
+    rows = _orders(gw, _order_fields('BADSYMBOL', 100))
+    assert [(r['TYPE'], r['CURRENT_STATUS'], r['CLIENT_ORDER_ID']) for r in rows] == [('ClerkReject', 'COMPLETED', 'coid-1')]
+
+
+def test_limit_order_cancel(gw):
+    rows = _orders(gw, _order_fields('IBM', 100, 'AsEntered', 0.01))
+    assert [r['CURRENT_STATUS'] for r in rows] == ['PENDING', 'LIVE']
+    oid = rows[0]['ORIGINAL_ORDER_ID']
+
+    gw.send("request o2 ORDERS;ORIGINAL_ORDER_ID,CURRENT_STATUS;CURRENT_STATUS={'LIVE','PENDING'}")
+    assert set([m['data']['row']['ORIGINAL_ORDER_ID'] for m in gw.messages()[1:]]) == set([oid])
+
+    gw.send('poke o2 ORDERS;*;!TYPE=UserSubmitCancel,REFERS_TO_ID=%s' % oid)
+    rows = [m['data']['row'] for m in gw.messages()[2:]]
+    assert [(r['TYPE'], r['CURRENT_STATUS'], r['ORIGINAL_ORDER_ID']) for r in rows] == [('UserSubmitCancel', 'COMPLETED', oid)]
+    assert not gw.simulator.working['IBM']
+
+
+def test_latency(monkeypatch):
+    clock = proto_helpers.MemoryReactorClock()
+    monkeypatch.setattr(simulator, 'reactor', clock)
+    gw = Gateway(latency=0.5)
+    assert gw.connect('c1') == []
+    clock.advance(1)
+    assert [m['type'] for m in gw.messages()] == ['system', 'ack', 'status']
+
+
+@pytest.mark.skipif('TXTRADER_API_HOST' not in os.environ, reason='needs the etc/txtrader environment (envdir)')
+def test_order_query():
+    from txtrader.benchmark import Benchmark, SYMBOLS, ACCOUNT as BENCH_ACCOUNT
+    from txtrader.rtx import RTX_LocalCallback
+    bench = Benchmark(quick=True)
+    api = bench.api
+
+    def query(request, **filters):
+        results = []
+        lines = bench.link.collect(lambda: request(RTX_LocalCallback(api, results.append), **filters))
+        for line in lines:
+            api.gateway_receive(line)
+        bench.link.pump()
+        return len(lines), json.loads(results[0])
+
+    rows, orders = query(api.request_orders)
+    assert len(orders) == len(SYMBOLS)
+    # the filters are sent to the gateway, which returns only the matching rows
+    filtered_rows, orders = query(api.request_orders, symbol=['ibm'], account=[BENCH_ACCOUNT], status=['Filled'], fields=['symbol', 'status'])
+    assert filtered_rows < rows
+    assert orders.values() == [{'symbol': 'IBM', 'status': 'Filled'}]
+    assert api.cxn_get('ACCOUNT_GATEWAY', 'ORDER').last_query.endswith(
+        "DISP_NAME='IBM',BANK='BENCH',BRANCH='TEST',CUSTOMER='BENCH',DEPOSIT='1'")
+    assert query(api.request_orders, status=['Pending'])[1] == {}
+    assert query(api.request_orders, since='99:00:00')[1] == {}
+
+    executions = query(api.request_executions, symbol=['IBM', 'MSFT'])[1]
+    assert sorted([e['symbol'] for e in executions.values()]) == sorted(set(['IBM', 'MSFT']) & set(SYMBOLS))
+
+
+@pytest.mark.skipif('TXTRADER_API_HOST' not in os.environ, reason='needs the etc/txtrader environment (envdir)')
+def test_order_query_stale_rows():
+    from txtrader.benchmark import Benchmark
+    from txtrader.rtx import API_Callback, RTX_LocalCallback, OrderQuery
+    api = Benchmark(quick=True).api
+    order = [o for o in api.orders.values() if o.fields['DISP_NAME'] == 'IBM'][0]
+    assert order.render()['status'] == 'Filled'
+    # the gateway selects rows: a Pending query matches the filled order's older LIVE row
+    query = OrderQuery(status=['Pending'], fields=['status'])
+    what = query.tql()[0].split(',')
+    live = [r for r in order.suborders.values() if r['CURRENT_STATUS'] == 'LIVE'][0]
+    row = dict([(k, v) for k, v in live.items() if k in what])
+    sent = []
+    api.send_order_status = sent.append
+    results = []
+    cb = API_Callback(api, 0, 'orders', RTX_LocalCallback(api, results.append))
+    cb.data = query
+    cb.complete([row])
+    assert json.loads(results[0]) == {}
+    assert (order.fields['CURRENT_STATUS'], order.render()['status']) == ('COMPLETED', 'Filled')
+    assert sent == []
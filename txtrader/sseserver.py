@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  sseserver.py
+  ------------
+
+  TxTrader Server-Sent Events module - order, execution, connection status and account events
+  on the webserver's /events path.
+
+  Each event is one SSE message: the event type and one line of JSON,
+
+    event: order
+    data: {"type":"order","id":"<permid>","account":"...","symbol":"...","data":{...}}
+
+  with the types order, execution, connection-status, accounts and current-account.  The
+  'account' and 'symbol' query parameters (comma separated lists) select the order and
+  execution events to send, e.g. /events?account=DEMO1.TEST.DEMO.1&symbol=IBM,MSFT; status
+  and account events are always sent.  The events are the ones WriteAllClients sends to the
+  TCP clients, with the same flow control.  HTTP basic auth is required, as on the other paths.
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+
+import ujson as json
+
+from twisted.web import http
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
+
+from txtrader.events import CATEGORIES, EventSubscriber
+from txtrader.webserver import client_address
+
+# event message prefix -> SSE event type
+SSE_TYPES = (
+    ('order.', 'order'),
+    ('open-order.', 'order'),
+    ('execution.', 'execution'),
+    ('connection-status-changed:', 'connection-status'),
+    ('accounts:', 'accounts'),
+    ('current-account:', 'current-account'),
+)
+
+# event categories that can carry these messages; the others are never queued for SSE clients
+SSE_CATEGORIES = ['order', 'execution', 'status']
+
+
+def sse_record(api, event):
+    """return (type, account, symbol, message) for an event sent to SSE clients, or None; built once per event"""
+    if event.sse is None:
+        event.sse = ()
+        for prefix, sse_type in SSE_TYPES:
+            if event.msg.startswith(prefix):
+                event.sse = sse_message(api, event, prefix, sse_type)
+                break
+    return event.sse or None
+
+
+def sse_message(api, event, prefix, sse_type):
+    record = {'type': sse_type}
+    rest = event.msg[len(prefix):]
+    if sse_type in ('order', 'execution'):
+        # 'order.<id>: <json>' (tws) or 'order.<id> <account> <type> <status>' (rtx)
+        record['id'], rest = (rest.split(': ' if ': ' in rest else ' ', 1) + [''])[:2]
+        if event.data is not None:
+            data = event.data[1]
+            if not isinstance(data, dict):
+                data = rtx_order(api, record['id'], data)
+        else:
+            data = parse_value(rest)
+        record['data'] = data
+        if isinstance(data, dict):
+            record['account'] = data.get('account')
+            record['symbol'] = data.get('symbol')
+    else:
+        record['data'] = parse_value(rest.strip())
+    message = 'event: %s\ndata: %s\n\n' % (sse_type, json.dumps(record))
+    return sse_type, record.get('account'), record.get('symbol'), message
+
+
+def rtx_order(api, permid, fields):
+    """rtx order events carry [account, type, status]; the symbol is looked up in the api's orders"""
+    order = api.orders.get(permid)
+    symbol = order.fields.get('symbol') if order else None
+    return {'permid': permid, 'account': fields[0], 'type': fields[1], 'status': fields[2], 'symbol': symbol}
+
+
+def parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def filter_arg(request, name):
+    values = ','.join(request.args.get(name, [])).upper().split(',')
+    return set([v.strip() for v in values if v.strip()])
+
+
+class SSESubscriber(EventSubscriber):
+    """one /events request: the selected events are written to it as they are sent to the TCP clients"""
+
+    def __init__(self, api, request):
+        self.api = api
+        self.transport = request
+        self.accounts = filter_arg(request, 'account')
+        self.symbols = filter_arg(request, 'symbol')
+        self.init_events()
+        self.excluded = set([c for c in CATEGORIES if c not in SSE_CATEGORIES])
+
+    def send_event(self, event):
+        # events this request does not select are discarded before they are queued
+        record = sse_record(self.api, event)
+        if not record:
+            return
+        sse_type, account, symbol, message = record
+        if sse_type in ('order', 'execution'):
+            if self.accounts and (account or '').upper() not in self.accounts:
+                return
+            if self.symbols and (symbol or '').upper() not in self.symbols:
+                return
+        EventSubscriber.send_event(self, event)
+
+    def transmit_event(self, event):
+        self.transport.write(event.sse[3])
+
+    def peer_name(self):
+        return 'sse %s' % client_address(self.transport)
+
+
+class EventsResource(Resource):
+    isLeaf = True
+
+    def __init__(self, api, trusted=False):
+        Resource.__init__(self)
+        self.api = api
+        self.trusted = trusted
+
+    def render_GET(self, request):
+        if not (self.trusted or (request.getUser() == self.api.username and request.getPassword() == self.api.password)):
+            request.setResponseCode(http.UNAUTHORIZED)
+            return json.dumps({'status': 'Unauthorized'})
+        request.setHeader('Content-type', 'text/event-stream')
+        request.setHeader('Cache-control', 'no-cache')
+        subscriber = SSESubscriber(self.api, request)
+        request.write(': connected\n\n')
+        subscriber.start_events(self.api.client_high_water)
+        self.api.open_client(subscriber)
+        request.notifyFinish().addBoth(self.finished, subscriber)
+        return NOT_DONE_YET
+
+    def finished(self, result, subscriber):
+        subscriber.stopProducing()
+        self.api.close_client(subscriber)
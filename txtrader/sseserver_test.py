@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+  sseserver_test.py
+  -----------------
+
+  TxTrader Server-Sent Events unit test script
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+from txtrader.events_test import API
+from txtrader.sseserver import EventsResource
+from twisted.web.server import Request, NOT_DONE_YET
+from twisted.web.test.requesthelper import DummyChannel
+
+import json
+
+
+class Order(object):
+    def __init__(self, fields):
+        self.fields = fields
+
+
+def connect(api, args, trusted=True):
+    request = Request(DummyChannel())
+    request.method = 'GET'
+    request.args = args
+    request.client = request.channel.transport.getPeer()
+    written = []
+    request.write = written.append
+    return request, EventsResource(api, trusted).render_GET(request), written
+
+
+def messages(written):
+    ret = []
+    for message in written[1:]:
+        event, data = message.rstrip('\n').split('\n')
+        ret.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return ret
+
+
+def test_event_stream():
+    api = API()
+    api.orders = {'1001': Order({'symbol': 'IBM'}), '1002': Order({'symbol': 'MSFT'})}
+    request, result, written = connect(api, {'account': ['demo1.test.demo.1'], 'symbol': ['IBM,AAPL']})
+    assert result == NOT_DONE_YET
+    assert request.responseHeaders.getRawHeaders('content-type') == ['text/event-stream']
+    assert written == [': connected\n\n']
+
+    api.WriteAllClients('quote.IBM:131.2 300 131.25 100', ('IBM', 131.2, 300, 131.25, 100))
+    api.WriteAllClients('order.1001 DEMO1.TEST.DEMO.1 BUY Submitted', ('1001', ['DEMO1.TEST.DEMO.1', 'BUY', 'Submitted']))
+    api.WriteAllClients('order.1002 DEMO1.TEST.DEMO.1 BUY Submitted', ('1002', ['DEMO1.TEST.DEMO.1', 'BUY', 'Submitted']))
+    api.WriteAllClients('execution.X1: {"account": "DEMO2.TEST.DEMO.1", "symbol": "IBM"}')
+    api.WriteAllClients('execution.X2: {"account": "DEMO1.TEST.DEMO.1", "symbol": "AAPL"}')
+    api.WriteAllClients('connection-status-changed: Down')
+    api.WriteAllClients('accounts: ["DEMO1.TEST.DEMO.1"]')
+    events = messages(written)
+    assert [(e, d['id'] if 'id' in d else d['data']) for e, d in events] == [
+        ('order', '1001'),
+        ('execution', 'X2'),
+        ('connection-status', 'Down'),
+        ('accounts', ['DEMO1.TEST.DEMO.1']),
+    ]
+    assert events[0][1]['data'] == {'permid': '1001', 'account': 'DEMO1.TEST.DEMO.1', 'type': 'BUY',
+                                    'status': 'Submitted', 'symbol': 'IBM'}
+
+    # the subscriber is removed when the request finishes
+    request.connectionLost(Exception('closed'))
+    assert api.clients == set([])
+
+
+def test_paused_stream():
+    api = API()
+    request, result, written = connect(api, {'account': ['demo1.test.demo.1']})
+    subscriber = list(api.clients)[0]
+    subscriber.pauseProducing()
+    api.WriteAllClients('execution.X1: {"account": "DEMO2.TEST.DEMO.1", "symbol": "IBM"}')
+    api.WriteAllClients('execution.X2: {"account": "DEMO1.TEST.DEMO.1", "symbol": "AAPL"}')
+    # only the selected events are queued
+    assert len(subscriber.queue) == 1
+    subscriber.resumeProducing()
+    assert [d['id'] for e, d in messages(written)] == ['X2']
+
+
+def test_unauthorized():
+    api = API()
+    request, result, written = connect(api, {}, trusted=False)
+    assert request.code == 401
+    assert not api.clients
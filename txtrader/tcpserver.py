@@ -12,16 +12,42 @@
 """
 
 from txtrader.version import VERSION, DATE, LABEL
+from txtrader.events import CATEGORIES, ENCODINGS, EventSubscriber, text_frame
+from txtrader.webserver import webserver
+from txtrader.logger import logger
 
 import sys
+import ujson as json
 
 from twisted.internet.protocol import Factory
-from twisted.internet import reactor
+from twisted.internet import reactor, defer
 from twisted.protocols import basic
 from socket import gethostname
 
+tcp_log = logger('tcp')
 
-class tcpserver(basic.NetstringReceiver):
+
+class TCPResponder(object):
+    """callback target for one command: responses are sent on the connection, tagged with the request id
+
+    The api completes it like a Deferred; because callback is named sendString, API_Callback
+    formats the results as a '<channel>.<label>: <json>' message.
+    """
+
+    def __init__(self, protocol, request_id=None):
+        self.protocol = protocol
+        self.prefix = '#%s ' % request_id if request_id else ''
+
+    def sendString(self, msg):
+        self.protocol.sendString(self.prefix + msg)
+
+    callback = sendString
+
+    def errback(self, failure):
+        self.sendString('.error: %s' % failure.getErrorMessage())
+
+
+class tcpserver(EventSubscriber, basic.NetstringReceiver):
     def __init__(self):
         #self.delimiter = '\n'
         self.commands = {
@@ -47,121 +73,192 @@ class tcpserver(basic.NetstringReceiver):
             'setaccount': self.cmd_setaccount,
             'accounts': self.cmd_accounts,
             'shutdown': self.cmd_shutdown,
+            'filter': self.cmd_filter,
+            'json': self.cmd_json,
         }
         self.authmap = set([])
+        self.init_events()
 
     def stringReceived(self, line):
         line = line.strip()
-        self.factory.output('user command: %s' % '%s xxxxxxxxxxx' % ' '.join(
+        # an optional leading '#<request_id>' token is echoed at the start of each response to the command
+        request_id = None
+        if line.startswith('#'):
+            request_id, line = (line[1:].split(None, 1) + [''])[:2]
+        tcp_log.info('user command: %s', '%s xxxxxxxxxxx' % ' '.join(
             line.split()[:2]) if line.startswith('auth') else line)
+        responder = TCPResponder(self, request_id)
         if line:
             cmd = line.split()[0]
             if cmd in self.commands.keys():
-                if cmd == 'auth' or self.check_authorized():
-                    response = self.commands[cmd](line)
-                    if response:
-                        self.sendString(response)
+                if cmd == 'auth' or self.check_authorized(responder):
+                    try:
+                        self.commands[cmd](line, responder)
+                    except Exception as ex:
+                        self.factory.output('ALERT: command %s failed: %s' % (repr(line), repr(ex)))
+                        responder.sendString('.error: %s failed: %s' % (cmd, ex))
             else:
-                if self.check_authorized():
-                    self.sendString('.what?')
+                if self.check_authorized(responder):
+                    responder.sendString('.what?')
         else:
-            self.check_authorized()
-
-    def cmd_auth(self, line):
+            self.check_authorized(responder)
+
+    # write one message to the connection; the WebSocket session overrides this
+    write_string = basic.NetstringReceiver.sendString
+
+    def sendString(self, string):
+        if self.encoding:
+            string = text_frame(string)
+        self.write_string(string)
+
+    def transmit_event(self, event):
+        if not self.encoding:
+            self.write_string(event.text)
+            return
+        if event.sid is not None and event.sid not in self.sent_symbols:
+            self.sent_symbols.add(event.sid)
+            self.write_string(event.symbol_frame())
+        self.write_string(event.encode())
+
+    def cmd_auth(self, line, responder):
         auth, username, password = line.split()[:3]
+        flags = dict([f.split('=', 1) for f in line.split()[3:] if '=' in f])
         if self.factory.validate(username, password):
             self.authmap.add(self.transport.getPeer())
+            self.set_filter(line.split()[3:])
+            encoding = flags.get('encoding')
+            if encoding in ENCODINGS:
+                # the reply is the last text netstring; everything after it is a frame
+                responder.sendString('.Authorized %s %s' % (self.factory.api.channel, encoding))
+                self.encoding = encoding
+            else:
+                responder.sendString('.Authorized %s' % self.factory.api.channel)
             self.factory.api.open_client(self)
-            return '.Authorized %s' % self.factory.api.channel
         else:
-            self.check_authorized()
+            self.check_authorized(responder)
 
-    def check_authorized(self):
-        if not self.transport.getPeer() in self.authmap:
-            self.sendString('.Authorization required!')
+    def check_authorized(self, responder):
+        if not (self.factory.trusted or self.transport.getPeer() in self.authmap):
+            responder.sendString('.Authorization required!')
             self.factory.api.close_client(self)
             self.transport.loseConnection()
             return False
         return True
 
-    def cmd_shutdown(self, line):
+    def cmd_filter(self, line, responder):
+        self.set_filter(line.split()[1:])
+        responder.sendString('.filter: %s' % ' '.join([c for c in CATEGORIES if c not in self.excluded]))
+
+    def cmd_json(self, line, responder):
+        """json {"id": ID, "method": "NAME", "params": {...}} - call the JSON over HTTP function NAME"""
+        request_id = None
+        try:
+            request = json.loads(line[len('json'):])
+            request_id = request.get('id')
+            method = str(request['method'])
+            params = request.get('params') or {}
+        except Exception as ex:
+            return self.json_response(responder, request_id, 'error', json.dumps('invalid request: %s' % ex))
+        d = defer.Deferred()
+        d.addCallback(lambda result: self.json_response(responder, request_id, 'result', result))
+        d.addErrback(lambda failure: self.json_response(responder, request_id, 'error', json.dumps(failure.getErrorMessage())))
+        try:
+            if method == 'add_symbol':
+                # symbol subscriptions belong to this connection, not to the webserver
+                self.factory.api.symbol_enable(str(params['symbol']).upper(), self, d)
+            elif method == 'del_symbol':
+                d.callback(json.dumps(self.factory.api.symbol_disable(str(params['symbol']).upper(), self)))
+            elif method in self.factory.webserver.commands:
+                getattr(self.factory.webserver, 'json_%s' % method)(params, d)
+            else:
+                d.errback(Exception('unknown method: %s' % method))
+        except Exception as ex:
+            self.factory.output('ALERT: json %s failed: %s' % (method, repr(ex)))
+            if not d.called:
+                d.errback(Exception('%s failed: %s' % (method, ex)))
+
+    def json_response(self, responder, request_id, key, value):
+        """send a json command response; value is JSON text, as rendered for the webserver"""
+        responder.sendString('%s.json: {"id":%s,"%s":%s}' % (self.factory.api.channel, json.dumps(request_id), key, value))
+
+    def cmd_shutdown(self, line, responder):
         self.factory.output('client at %s requested shutdown' %
                             self.transport.getPeer())
         self.factory.api.close_client(self)
         reactor.callLater(1, reactor.stop)
 
-    def cmd_help(self, line):
-        self.sendString('.commands: %s' % repr(self.commands.keys()))
+    def cmd_help(self, line, responder):
+        responder.sendString('.commands: %s' % repr(self.commands.keys()))
 
-    def cmd_disconnect(self, line):
+    def cmd_disconnect(self, line, responder):
         self.authmap.discard(self.transport.getPeer())
         self.transport.loseConnection()
 
-    def cmd_status(self, line):
-        self.sendString('.status: %s' % self.factory.api.query_connection_status())
+    def cmd_status(self, line, responder):
+        responder.sendString('.status: %s' % self.factory.api.query_connection_status())
 
-    def cmd_setaccount(self, line):
+    def cmd_setaccount(self, line, responder):
         setaccount, account = line.split()[:2]
-        self.factory.api.set_account(account, self.sendString)
+        self.factory.api.set_account(account, responder)
 
-    def cmd_accounts(self, line):
-        self.sendString('.accounts: %s' % self.factory.api.accounts)
+    def cmd_accounts(self, line, responder):
+        responder.sendString('.accounts: %s' % self.factory.api.accounts)
 
-    def cmd_getbars(self, line):
+    def cmd_getbars(self, line, responder):
         bars, symbol, period, start_date, start_time, end_date, end_time = line.split()[:7]
-        self.factory.api.query_bars(symbol, period, ' '.join((start_date, start_time)), ' '.join((end_date, end_time)), self.sendString)
+        self.factory.api.query_bars(symbol, period, ' '.join((start_date, start_time)), ' '.join((end_date, end_time)), responder)
 
-    def cmd_add(self, line):
+    def cmd_add(self, line, responder):
         add, symbol = line.split()[:2]
-        self.factory.api.symbol_enable(symbol, self)
-        self.sendString('.symbol %s added' % symbol)
+        self.factory.api.symbol_enable(symbol, self, responder)
 
-    def cmd_del(self, line):
+    def cmd_del(self, line, responder):
         add, symbol = line.split()[:2]
         self.factory.api.symbol_disable(symbol, self)
-        self.sendString('.symbol %s deleted' % symbol)
+        responder.sendString('.symbol %s deleted' % symbol)
 
-    def cmd_market_order(self, line):
+    def cmd_market_order(self, line, responder):
         order, symbol, qstr = line.split()[:3]
-        self.factory.api.market_order(symbol, int(qstr), self.sendString)
+        self.factory.api.market_order(symbol, int(qstr), responder)
 
-    def cmd_stop_order(self, line):
+    def cmd_stop_order(self, line, responder):
         order, symbol, price, qstr = line.split()[:4]
-        self.factory.api.stop_order(symbol, float(price), int(qstr), self.sendString)
+        self.factory.api.stop_order(symbol, float(price), int(qstr), responder)
 
-    def cmd_limit_order(self, line):
+    def cmd_limit_order(self, line, responder):
         order, symbol, price, qstr = line.split()[:4]
-        self.factory.api.limit_order(symbol, float(price), int(qstr), self.sendString)
+        self.factory.api.limit_order(symbol, float(price), int(qstr), responder)
 
-    def cmd_stoplimit_order(self, line):
+    def cmd_stoplimit_order(self, line, responder):
         order, symbol, stop_price, limit_price, qstr = line.split()[:5] 
-        self.factory.api.stoplimit_order(symbol, float(stop_price), float( limit_price), int(qstr), self.sendString)
+        self.factory.api.stoplimit_order(symbol, float(stop_price), float( limit_price), int(qstr), responder)
 
-    def cmd_cancel(self, line):
+    def cmd_cancel(self, line, responder):
         cancel, id = line.split()[:2]
-        self.factory.api.cancel_order(id, self.sendString)
+        self.factory.api.cancel_order(id, responder)
 
-    def cmd_symbols(self, line):
+    def cmd_symbols(self, line, responder):
         symbols = self.factory.api.symbols
-        self.sendString('.symbols: %s' % repr(symbols))
+        responder.sendString('.symbols: %s' % repr(symbols))
 
-    def cmd_positions(self, line):
-        self.factory.api.request_positions(self.sendString)
+    def cmd_positions(self, line, responder):
+        self.factory.api.request_positions(responder)
 
-    def cmd_orders(self, line):
-        self.factory.api.request_orders(self.sendString)
+    def cmd_orders(self, line, responder):
+        self.factory.api.request_orders(responder)
 
-    def cmd_executions(self, line):
-        self.factory.api.request_executions(self.sendString)
+    def cmd_executions(self, line, responder):
+        self.factory.api.request_executions(responder)
 
-    def cmd_globalcancel(self, line):
+    def cmd_globalcancel(self, line, responder):
         self.factory.api.request_global_cancel()
-        self.sendString('.global order cancel requested')
+        responder.sendString('.global order cancel requested')
 
     def connectionMade(self):
         self.factory.output('client connection from %s' %
                             self.transport.getPeer())
         self.authmap.discard(self.transport.getPeer())
+        self.start_events(self.factory.api.client_high_water)
         self.sendString('.connected: %s %s %s %s on %s' % (self.factory.api.label, str(VERSION), str(DATE), str(LABEL), str(gethostname())))
 
     def connectionLost(self, reason):
@@ -171,11 +268,14 @@ class tcpserver(basic.NetstringReceiver):
 
 
 class serverFactory(Factory):
+    """netstring server; a trusted factory accepts any credentials (Unix socket access is controlled by its file mode)"""
     protocol = tcpserver
 
-    def __init__(self, api):
+    def __init__(self, api, trusted=False):
         self.api = api
+        self.trusted = trusted
         self.output = api.output
+        self.webserver = webserver(api)
 
     def validate(self, username, password):
-        return username == self.api.username and password == self.api.password
+        return self.trusted or (username == self.api.username and password == self.api.password)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+  tcpserver_test.py
+  -----------------
+
+  TxTrader TCP server command channel unit test script
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+from txtrader.events_test import API, connect, received, netstring
+from txtrader.rtx import API_Callback
+from txtrader.tcpserver import serverFactory
+from twisted.test import proto_helpers
+
+import os
+import pytest
+
+
+class CallbackAPI(API):
+    """api completing set_account asynchronously with rtx API_Callbacks"""
+    callback_timeout = {'DEFAULT': 5}
+
+    def __init__(self):
+        API.__init__(self)
+        self.pending = {}
+        self.symbols = {}
+
+    def set_account(self, account, callback):
+        self.pending[account] = API_Callback(self, account, 'set-account', callback)
+
+    def record_callback_metrics(self, label, elapsed, expired):
+        pass
+
+    def symbol_enable(self, symbol, client, callback):
+        self.symbols[symbol] = client
+        API_Callback(self, symbol, 'add-symbol', callback).complete(True)
+
+    def symbol_disable(self, symbol, client):
+        return self.symbols.pop(symbol, None) == client
+
+
+def test_request_ids():
+    api = CallbackAPI()
+    server, transport = connect(api, netstring('#1 auth user pass'))
+    assert received(transport)[-1] == '#1 .Authorized rtx'
+
+    # pipelined commands complete out of order; responses carry their request ids
+    server.dataReceived(''.join([netstring('#a%d setaccount ACCOUNT%d' % (i, i)) for i in range(3)]))
+    server.dataReceived(netstring('status'))
+    assert received(transport) == ['.status: Up']
+    for i in [2, 0, 1]:
+        api.pending['ACCOUNT%d' % i].complete(i > 0)
+    assert received(transport) == ['#a2 rtx.set-account: true', '#a0 rtx.set-account: false', '#a1 rtx.set-account: true']
+
+
+def test_command_errors():
+    api = CallbackAPI()
+    server, transport = connect(api, netstring('auth user pass'))
+    received(transport)
+    server.dataReceived(netstring('#7 setaccount'))
+    response = received(transport)
+    assert len(response) == 1 and response[0].startswith('#7 .error: setaccount failed:')
+    assert not transport.disconnecting
+
+    server.dataReceived(netstring('#8 setaccount ACCOUNT1'))
+    callback = api.pending['ACCOUNT1']
+    callback.expire = 0
+    callback.check_expire()
+    # the expiry is broadcast to all clients, then answered on the request
+    assert received(transport)[-1] == '#8 rtx.error: set-account callback expired'
+
+
+def test_json_command():
+    api = CallbackAPI()
+    server, transport = connect(api, netstring('auth user pass'))
+    received(transport)
+    requests = [
+        '#1 json {"id":1,"method":"status"}',
+        'json {"id":"a","method":"add_symbol","params":{"symbol":"ibm"}}',
+        'json {"id":3,"method":"query_symbols"}',
+        'json {"id":4,"method":"set_account","params":{"account":"demo1.test.demo.1"}}',
+        'json {"id":5,"method":"no_such_method"}',
+        'json {"id":6,"method":"set_account"}',
+        'json {"method":',
+    ]
+    server.dataReceived(''.join([netstring(r) for r in requests]))
+    api.pending['DEMO1.TEST.DEMO.1'].complete(True)
+    responses = received(transport)
+    assert responses[:4] == [
+        '#1 rtx.json: {"id":1,"result":"Up"}',
+        'rtx.json: {"id":"a","result":true}',
+        'rtx.json: {"id":3,"result":["IBM"]}',
+        'rtx.json: {"id":5,"error":"unknown method: no_such_method"}',
+    ]
+    assert responses[4].startswith('rtx.json: {"id":6,"error":"set_account failed:')
+    assert responses[5].startswith('rtx.json: {"id":null,"error":"invalid request:')
+    assert responses[6] == 'rtx.json: {"id":4,"result":true}'
+    assert api.symbols == {'IBM': server}
+
+    server.dataReceived(netstring('json {"id":8,"method":"del_symbol","params":{"symbol":"IBM"}}'))
+    assert received(transport) == ['rtx.json: {"id":8,"result":true}']
+
+
+def test_trusted_factory():
+    api = CallbackAPI()
+    protocol = serverFactory(api, trusted=True).buildProtocol(None)
+    transport = proto_helpers.StringTransport()
+    protocol.makeConnection(transport)
+    # commands are accepted without auth; auth with any credentials starts the event stream
+    protocol.dataReceived(netstring('status') + netstring('auth nobody nothing noquotes'))
+    assert received(transport)[1:] == ['.status: Up', '.Authorized rtx']
+    assert api.clients == set([protocol])
+    assert not serverFactory(api).validate('nobody', 'nothing')
+
+
+@pytest.mark.skipif('TXTRADER_API_HOST' not in os.environ, reason='needs the etc/txtrader environment (envdir)')
+def test_subscribe_snapshot():
+    from txtrader.benchmark import Benchmark
+    api = Benchmark(quick=True).api
+    server, transport = connect(api, netstring('auth %s %s notrades' % (api.username, api.password)))
+    received(transport)
+    # IBM is already streaming: the new subscriber gets its current quote right away
+    server.dataReceived(netstring('#1 add IBM'))
+    ibm = api.symbols['IBM']
+    assert received(transport) == ['#1 rtx.add-symbol: true', 'rtx.%s' % ibm.quote_event()[0]]
+    assert server in ibm.clients
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  tickcapture.py
+  --------------
+
+  TxTrader tick capture module - record market data updates to memory-mapped daily files.
+
+  Each capture day is a pair of files in the capture directory:
+
+    ticks-YYYYMMDD.dat      header followed by fixed size records (time, symbol index, field, value)
+    ticks-YYYYMMDD.symbols  symbol directory; the symbol index is the line number
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+
+import os
+import time
+import mmap
+import struct
+
+MAGIC = 'TXTK'
+FORMAT_VERSION = 1
+
+# header: magic, format version, record size, record count
+HEADER = struct.Struct('<4sIIxxxxQ')
+
+# record: timestamp, symbol index, field id, value
+RECORD = struct.Struct('<dIHxxd')
+
+# preallocate file space this many records at a time
+GROW_RECORDS = 262144
+
+FIELDS = ['bid', 'bidsize', 'ask', 'asksize', 'last', 'size', 'volume', 'high', 'low', 'close', 'vwap']
+FIELD_ID = dict([(name, i) for i, name in enumerate(FIELDS)])
+
+BID = FIELD_ID['bid']
+BIDSIZE = FIELD_ID['bidsize']
+ASK = FIELD_ID['ask']
+ASKSIZE = FIELD_ID['asksize']
+LAST = FIELD_ID['last']
+SIZE = FIELD_ID['size']
+VOLUME = FIELD_ID['volume']
+HIGH = FIELD_ID['high']
+LOW = FIELD_ID['low']
+CLOSE = FIELD_ID['close']
+VWAP = FIELD_ID['vwap']
+
+
+def capture_filenames(directory, day):
+    """return (data_file, symbol_file) for day given as YYYYMMDD string"""
+    base = os.path.join(directory, 'ticks-%s' % day)
+    return ('%s.dat' % base, '%s.symbols' % base)
+
+
+class TickCapture(object):
+    """Append-only writer; call write() from the market data handlers with the index from symbol_index()"""
+
+    def __init__(self, directory, output=None):
+        self.directory = directory
+        self.output = output
+        self.symbols = []
+        self.symbol_ids = {}
+        self.file = None
+        self.map = None
+        self.symbol_file = None
+        self.day = None
+        self.day_end = 0
+        self.count = 0
+        self.offset = HEADER.size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.open_day(time.time())
+
+    def __str__(self):
+        return 'TickCapture(%s day=%s records=%d symbols=%d)' % (self.directory, self.day, self.count, len(self.symbols))
+
+    def __repr__(self):
+        return str(self)
+
+    def open_day(self, now):
+        self.close()
+        t = time.localtime(now)
+        self.day = time.strftime('%Y%m%d', t)
+        self.day_end = time.mktime((t.tm_year, t.tm_mon, t.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+        data_file, symbol_file = capture_filenames(self.directory, self.day)
+
+        # a restart during the day appends to the existing capture; symbol indexes must stay the same
+        known = []
+        if os.path.exists(symbol_file):
+            with open(symbol_file) as f:
+                known = [line.rstrip('\n') for line in f]
+        if known[:len(self.symbols)] != self.symbols[:len(known)]:
+            self.error('symbol directory %s does not match, capture disabled' % symbol_file)
+            return
+        for symbol in known[len(self.symbols):]:
+            self.symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+
+        if os.path.exists(data_file):
+            self.file = open(data_file, 'r+b')
+            magic, version, size, count = HEADER.unpack(self.file.read(HEADER.size))
+            if magic != MAGIC or size != RECORD.size:
+                self.error('capture file %s has incompatible format, capture disabled' % data_file)
+                self.file.close()
+                self.file = None
+                return
+            self.count = count
+        else:
+            self.file = open(data_file, 'w+b')
+            self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.size, 0))
+            self.count = 0
+        self.symbol_file = open(symbol_file, 'a')
+        for symbol in self.symbols[len(known):]:
+            self.symbol_file.write('%s\n' % symbol)
+        self.symbol_file.flush()
+
+        self.offset = HEADER.size + self.count * RECORD.size
+        self.file.seek(0, os.SEEK_END)
+        self.map_file(max(self.file.tell(), self.offset + GROW_RECORDS * RECORD.size))
+        if self.output:
+            self.output('%s opened' % self)
+
+    def map_file(self, length):
+        if self.map:
+            self.map.close()
+        self.file.truncate(length)
+        self.map = mmap.mmap(self.file.fileno(), length)
+
+    def error(self, msg):
+        if self.output:
+            self.output('ALERT: TickCapture: %s' % msg)
+
+    def symbol_index(self, symbol):
+        """return the capture index for symbol, adding it to the directory on first use"""
+        sid = self.symbol_ids.get(symbol)
+        if sid is None:
+            sid = len(self.symbols)
+            self.symbol_ids[symbol] = sid
+            self.symbols.append(symbol)
+            if self.symbol_file:
+                self.symbol_file.write('%s\n' % symbol)
+                self.symbol_file.flush()
+        return sid
+
+    def write(self, sid, field, value):
+        if not self.map:
+            return
+        now = time.time()
+        if now >= self.day_end:
+            self.open_day(now)
+            if not self.map:
+                return
+        if self.offset + RECORD.size > len(self.map):
+            self.map_file(len(self.map) + GROW_RECORDS * RECORD.size)
+        RECORD.pack_into(self.map, self.offset, now, sid, field, value)
+        self.offset += RECORD.size
+        self.count += 1
+        HEADER.pack_into(self.map, 0, MAGIC, FORMAT_VERSION, RECORD.size, self.count)
+
+    def flush(self):
+        if self.map:
+            self.map.flush()
+
+    def close(self):
+        if self.map:
+            self.map.flush()
+            self.map.close()
+            self.map = None
+        if self.file:
+            self.file.close()
+            self.file = None
+        if self.symbol_file:
+            self.symbol_file.close()
+            self.symbol_file = None
+
+
+def read_symbols(directory, day):
+    with open(capture_filenames(directory, day)[1]) as f:
+        return [line.rstrip('\n') for line in f]
+
+
+def read_ticks(directory, day):
+    """generate (time, symbol, field_name, value) tuples for a captured day"""
+    data_file, symbol_file = capture_filenames(directory, day)
+    symbols = read_symbols(directory, day)
+    with open(data_file, 'rb') as f:
+        magic, version, size, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or size != RECORD.size:
+            raise Exception('%s: incompatible tick capture file' % data_file)
+        for i in xrange(count):
+            t, sid, field, value = RECORD.unpack(f.read(RECORD.size))
+            yield (t, symbols[sid], FIELDS[field], value)
+
+
+def load_ticks(directory, day):
+    """return (symbols, records) for a captured day, records is a numpy structured array mapped from the file"""
+    import numpy
+    data_file, symbol_file = capture_filenames(directory, day)
+    dtype = numpy.dtype([('time', '<f8'), ('symbol', '<u4'), ('field', '<u2'), ('pad', '<u2'), ('value', '<f8')])
+    with open(data_file, 'rb') as f:
+        magic, version, size, count = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or size != dtype.itemsize:
+        raise Exception('%s: incompatible tick capture file' % data_file)
+    records = numpy.memmap(data_file, dtype=dtype, mode='r', offset=HEADER.size, shape=(count,))
+    return read_symbols(directory, day), records
+
+
+if __name__ == '__main__':
+    from sys import argv
+    directory, day = argv[1:3]
+    for tick in read_ticks(directory, day):
+        print('%.6f %s %s %s' % tick)
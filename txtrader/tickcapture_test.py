@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+  tickcapture_test.py
+  -------------------
+
+  TxTrader tick capture unit test script
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+from txtrader import tickcapture
+
+import time
+import pytest
+
+
+def test_capture_read(tmpdir):
+    directory = str(tmpdir.join('ticks'))
+    tc = tickcapture.TickCapture(directory)
+    ibm = tc.symbol_index('IBM')
+    aapl = tc.symbol_index('AAPL')
+    assert tc.symbol_index('IBM') == ibm
+    tc.write(ibm, tickcapture.BID, 131.2)
+    tc.write(aapl, tickcapture.VOLUME, 1000)
+    tc.write(ibm, tickcapture.ASKSIZE, 300)
+    day = tc.day
+    tc.close()
+
+    ticks = list(tickcapture.read_ticks(directory, day))
+    assert [t[1:] for t in ticks] == [('IBM', 'bid', 131.2), ('AAPL', 'volume', 1000.0), ('IBM', 'asksize', 300.0)]
+    assert ticks[0][0] <= ticks[2][0] <= time.time()
+
+
+def test_capture_reopen_appends(tmpdir):
+    directory = str(tmpdir)
+    tc = tickcapture.TickCapture(directory)
+    tc.write(tc.symbol_index('IBM'), tickcapture.LAST, 130.0)
+    tc.close()
+
+    tc = tickcapture.TickCapture(directory)
+    assert tc.count == 1
+    assert tc.symbol_index('IBM') == 0
+    tc.write(tc.symbol_index('TSLA'), tickcapture.LAST, 300.0)
+    day = tc.day
+    tc.close()
+
+    assert tickcapture.read_symbols(directory, day) == ['IBM', 'TSLA']
+    assert [t[1:] for t in tickcapture.read_ticks(directory, day)] == [('IBM', 'last', 130.0), ('TSLA', 'last', 300.0)]
+
+
+def test_capture_grow(tmpdir, monkeypatch):
+    monkeypatch.setattr(tickcapture, 'GROW_RECORDS', 4)
+    directory = str(tmpdir)
+    tc = tickcapture.TickCapture(directory)
+    sid = tc.symbol_index('IBM')
+    for i in range(10):
+        tc.write(sid, tickcapture.SIZE, i)
+    day = tc.day
+    tc.close()
+    assert [t[3] for t in tickcapture.read_ticks(directory, day)] == [float(i) for i in range(10)]
+
+
+def test_load_ticks(tmpdir):
+    numpy = pytest.importorskip('numpy')
+    directory = str(tmpdir)
+    tc = tickcapture.TickCapture(directory)
+    sid = tc.symbol_index('IBM')
+    for price in [1.0, 2.0, 3.0]:
+        tc.write(sid, tickcapture.LAST, price)
+    day = tc.day
+    tc.close()
+    symbols, records = tickcapture.load_ticks(directory, day)
+    assert symbols == ['IBM']
+    assert len(records) == 3
+    assert list(records['value']) == [1.0, 2.0, 3.0]
+    assert numpy.all(records['field'] == tickcapture.LAST)
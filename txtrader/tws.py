@@ -19,11 +19,33 @@ import json
 import time
 
 from txtrader.config import Config
+from txtrader import tickcapture, quotetable
+from txtrader.events import Event, EventSubscriber, SymbolTable, write_event
+from txtrader.logger import logger, configure_logging, INFO, ERROR
 
 DEFAULT_TWS_CALLBACK_TIMEOUT = 5
 
+# callback results passed unserialized to HTTP requests, which stream them
+STREAMED_RESULTS = ['orders', 'executions']
+
+# TWS tick types recorded by tick capture: tick field -> capture field id
+TICK_CAPTURE_FIELDS = {
+    0: tickcapture.BIDSIZE,
+    1: tickcapture.BID,
+    2: tickcapture.ASK,
+    3: tickcapture.ASKSIZE,
+    4: tickcapture.LAST,
+    5: tickcapture.SIZE,
+    6: tickcapture.HIGH,
+    7: tickcapture.LOW,
+    8: tickcapture.VOLUME,
+    9: tickcapture.CLOSE,
+}
+
 SHUTDOWN_ON_TWS_DISCONNECT = True
 
+api_log = logger('api')
+
 from twisted.python import log
 from twisted.internet import reactor
 from twisted.internet.task import LoopingCall
@@ -52,9 +74,15 @@ class TWS_Symbol(object):
         self.size = 0
         self.volume = 0
         self.close = 0.0
+        self.version = 0
         self.tws.symbols[symbol] = self
+        self.tws.data_version['symbols'] += 1
         self.last_quote = ''
         self.tws.symbols_by_id[self.ticker_id] = self
+        self.capture_id = tws.tick_capture.symbol_index(symbol) if tws.tick_capture else None
+        self.quote_slot = tws.quote_table.slot(symbol) if tws.quote_table else None
+        # export() kept current field by field by the tick handlers; read by query_data()
+        self.exported = self.export()
         contract = self.tws.create_contract(
             symbol, 'STK', 'SMART', 'SMART', 'USD')
         self.output('TWS_Symbol %s %s created for client %s' %
@@ -82,6 +110,12 @@ class TWS_Symbol(object):
             'fullname': self.symbol,
         }
 
+    def query_data(self, fields=None):
+        """the exported fields, or those of fields that are exported"""
+        if fields:
+            return dict([(f, self.exported[f]) for f in fields if f in self.exported])
+        return dict(self.exported)
+
     def add_client(self, client):
         self.output('TWS_Symbol %s %s adding client %s' %
                     (self, self.symbol, client))
@@ -95,16 +129,32 @@ class TWS_Symbol(object):
             self.output('cancelMktData(%d)' % self.ticker_id)
             self.tws.tws_conn.cancelMktData(self.ticker_id)
 
+    def quote_event(self):
+        return ('quote.%s:%s %d %s %d' % (self.symbol, self.bid, self.bid_size, self.ask, self.ask_size),
+                (self.symbol, self.bid, self.bid_size, self.ask, self.ask_size))
+
+    def trade_event(self):
+        return ('trade.%s:%s %d %d' % (self.symbol, self.last, self.size, self.volume),
+                (self.symbol, self.last, self.size, self.volume))
+
     def update_quote(self):
-        quote = 'quote.%s:%s %d %s %d' % (
-            self.symbol, self.bid, self.bid_size, self.ask, self.ask_size)
+        quote, data = self.quote_event()
         if quote != self.last_quote:
             self.last_quote = quote
-            self.tws.WriteAllClients(quote)
+            self.tws.WriteAllClients(quote, data)
 
     def update_trade(self):
-        self.tws.WriteAllClients('trade.%s:%s %d %d' % (
-            self.symbol, self.last, self.size, self.volume))
+        self.tws.WriteAllClients(*self.trade_event())
+
+    def snapshot_events(self):
+        """the quote and trade events for the current state, for a client subscribing while the symbol streams"""
+        events = []
+        if self.tws.enable_ticker:
+            if self.bid or self.ask:
+                events.append(self.quote_event())
+            if self.last or self.volume:
+                events.append(self.trade_event())
+        return events
 
 
 class TWS_Callback(object):
@@ -122,12 +172,22 @@ class TWS_Callback(object):
 
     def complete(self, results):
         """complete callback by calling callable function with value of results[self.type]"""
-        if not self.done:
-            if self.callable.callback.__name__ == 'write':
-                results = '%s.%s: %s\n' % (
+        if getattr(self.callable, 'cancelled', False):
+            # the requester has gone away (an HTTP client that disconnected): skip formatting
+            self.callable = None
+            self.done = True
+        elif not self.done:
+            if self.callable.callback.__name__ == 'sendString':
+                results = '%s.%s: %s' % (
                     self.tws.channel, self.label, json.dumps(results))
-            self.tws.output('TWS_Callback.complete(%s)' % repr(results))
-            self.callable.callback(json.dumps(results))
+            elif self.label in STREAMED_RESULTS and getattr(self.callable, 'stream_results', False):
+                # the webserver serializes the streamed collections a batch at a time as it writes them
+                self.tws.output('TWS_Callback.complete(%s: %d items streamed)' % (self.label, len(results)))
+            else:
+                results = json.dumps(results)
+            if isinstance(results, basestring):
+                self.tws.output('TWS_Callback.complete(%s)' % repr(results))
+            self.callable.callback(results)
             self.callable = None
             self.done = True
         else:
@@ -139,9 +199,9 @@ class TWS_Callback(object):
             if time.time() > self.expire:
                 msg = 'error: callback expired: %s' % repr((self.id, self.label))
                 self.tws.WriteAllClients(msg)
-                if self.callable.callback.__name__ == 'write':
+                if self.callable.callback.__name__ == 'sendString':
                     self.callable.callback(
-                        '%s.error: %s callback expired\n', (self.tws.channel, self.label))
+                        '%s.error: %s callback expired' % (self.tws.channel, self.label))
                 else:
                     self.callable.errback(Failure(Exception(msg)))
                 self.done = True
@@ -153,16 +213,32 @@ class TWS(object):
         self.output('TWS init')
         self.channel = 'tws'
         self.config = Config(self.channel)
+        configure_logging(self.config)
         self.username = self.config.get('USERNAME')
         self.password = self.config.get('PASSWORD')
         self.http_port = int(self.config.get('HTTP_PORT'))
         self.tcp_port = int(self.config.get('TCP_PORT'))
+        self.tcp_socket = self.config.get('TCP_SOCKET')
+        self.http_socket = self.config.get('HTTP_SOCKET')
+        self.socket_mode = int(self.config.get('SOCKET_MODE'), 8)
+        self.socket_auth = bool(int(self.config.get('SOCKET_AUTH')))
+        self.http_gzip = bool(int(self.config.get('HTTP_GZIP')))
+        self.client_high_water = int(self.config.get('CLIENT_HIGH_WATER'))
+        self.fanout_workers = int(self.config.get('FANOUT_WORKERS'))
         self.callback_timeout = int(self.config.get('CALLBACK_TIMEOUT'))
         if not self.callback_timeout:
             self.callback_timeout = DEFAULT_TWS_CALLBACK_TIMEOUT
         self.output('callback_timeout=%d' % self.callback_timeout)
         self.enable_ticker = bool(int(self.config.get('ENABLE_TICKER')))
         self.log_api_messages = bool(int(self.config.get('LOG_API_MESSAGES')))
+        self.tick_capture = None
+        if bool(int(self.config.get('ENABLE_TICK_CAPTURE'))):
+            self.tick_capture = tickcapture.TickCapture(self.config.get('TICK_CAPTURE_DIR'), self.output)
+            reactor.addSystemEventTrigger('before', 'shutdown', self.tick_capture.close)
+        self.quote_table = None
+        if bool(int(self.config.get('ENABLE_QUOTE_TABLE'))):
+            self.quote_table = quotetable.QuoteTable(self.config.get('QUOTE_TABLE_FILE'), int(self.config.get('QUOTE_TABLE_CAPACITY')), self.output)
+            reactor.addSystemEventTrigger('before', 'shutdown', self.quote_table.close)
         self.output_second_ticks = bool(
             int(self.config.get('ENABLE_SECONDS_TICK')))
         self.suppress_error_codes = [
@@ -170,6 +246,7 @@ class TWS(object):
         self.label = 'TWS Gateway'
         self.current_account = ''
         self.clients = set([])
+        self.event_symbols = SymbolTable()
         self.orders = {}
         self.pending_orders = {}
         self.openorder_callbacks = []
@@ -180,11 +257,14 @@ class TWS(object):
         self.position_callbacks = []
         self.executions = {}
         self.execution_callbacks = []
-        self.bardata_callbacks = []
-        self.cancel_callbacks = []
-        self.order_callbacks = []
-        self.addsymbol_callbacks = []
+        # callbacks completed by id are kept in dicts of lists keyed by str(id):
+        # order and cancel by order id, bardata by request id, addsymbol by ticker id
+        self.bardata_callbacks = {}
+        self.cancel_callbacks = {}
+        self.order_callbacks = {}
+        self.addsymbol_callbacks = {}
         self.accountdata_callbacks = []
+        self.order_ids = {}
         self.last_connection_status = ''
         self.connection_status = 'Initializing'
         self.LastError = -1
@@ -212,6 +292,8 @@ class TWS(object):
         self.ticker_ids = {}
         self.symbols = {}
         self.symbols_by_id = {}
+        # bumped when the data changes; the webserver's response cache is keyed on them
+        self.data_version = {'accounts': 0, 'order_route': 0, 'symbols': 0}
         self.primary_exchange_map = {}
         self.tws_conn = None
         repeater = LoopingCall(self.EverySecond)
@@ -222,10 +304,7 @@ class TWS(object):
         repeater.start(1)
 
     def output(self, msg):
-        if 'error' in msg.lower():
-            log.err(msg)
-        else:
-            log.msg(msg)
+        api_log.log(ERROR if 'error' in msg.lower() else INFO, msg)
 
     def open_client(self, client):
         self.clients.add(client)
@@ -237,7 +316,12 @@ class TWS(object):
             if client in ts.clients:
                 ts.del_client(client)
                 if not ts.clients:
-                    del(self.symbols[ts.symbol])
+                    self.drop_symbol(ts.symbol)
+
+    def drop_symbol(self, symbol):
+        """remove an inactive symbol; every removal changes the query_symbols cache version"""
+        del(self.symbols[symbol])
+        self.data_version['symbols'] += 1
 
     def set_primary_exchange(self, symbol, exchange):
         if exchange:
@@ -248,20 +332,38 @@ class TWS(object):
 
     def CheckPendingResults(self):
         # check each callback list for timeouts
-        for cblist in [self.position_callbacks, self.openorder_callbacks, self.execution_callbacks, self.bardata_callbacks, self.order_callbacks, self.cancel_callbacks, self.addsymbol_callbacks, self.accountdata_callbacks]:
+        for cblist in [self.position_callbacks, self.openorder_callbacks, self.execution_callbacks, self.accountdata_callbacks]:
             dlist = []
             for cb in cblist:
                 cb.check_expire()
                 if cb.done:
                     dlist.append(cb)
-                    if cblist == self.order_callbacks:
+            # delete any callbacks that are done
+            for cb in dlist:
+                cblist.remove(cb)
+
+        # check each callback dict for timeouts
+        for cbdict in [self.bardata_callbacks, self.order_callbacks, self.cancel_callbacks, self.addsymbol_callbacks]:
+            for key, cblist in cbdict.items():
+                for cb in cblist:
+                    cb.check_expire()
+                    if cb.done and cbdict is self.order_callbacks:
                         mid = str(cb.id)
                         if mid in self.pending_orders.keys():
                             del(self.pending_orders[mid])
                             self.output('pending order %s expired' % mid)
-            # delete any callbacks that are done
-            for cb in dlist:
-                cblist.remove(cb)
+                # delete any callbacks that are done
+                cblist = [cb for cb in cblist if not cb.done]
+                if cblist:
+                    cbdict[key] = cblist
+                else:
+                    del(cbdict[key])
+
+    def add_callback(self, cbdict, key, cb):
+        cbdict.setdefault(str(key), []).append(cb)
+
+    def get_callbacks(self, cbdict, key):
+        return cbdict.get(str(key), [])
 
     def process_pending_order(self, mid, pid):
         # if there's a pending order with this msg id, this is the first time we
@@ -285,6 +387,7 @@ class TWS(object):
             oldstatus = ''
         m['permid'] = str(msg.permId)
         m['id'] = msg.orderId
+        self.order_ids[mid] = pid
         m['status'] = msg.status
         if msg.status == 'Filled' and 'submit_time' in m and not 'fill_time' in m:
             m['fill_time'] = time.time()
@@ -297,22 +400,20 @@ class TWS(object):
         m['whyheld'] = msg.whyHeld
 
         # callbacks are keyed by message-id, not permid
-        for cb in self.cancel_callbacks:
-            if cb.id == mid:
-                self.output('cancel_callback[%s] completed' % mid)
-                cb.complete(m)
+        for cb in self.get_callbacks(self.cancel_callbacks, mid):
+            self.output('cancel_callback[%s] completed' % mid)
+            cb.complete(m)
 
-        for cb in self.order_callbacks:
-            if cb.id == mid:
-                self.output('order_callback[%s] completed' % mid)
-                cb.complete(m)
+        for cb in self.get_callbacks(self.order_callbacks, mid):
+            self.output('order_callback[%s] completed' % mid)
+            cb.complete(m)
 
         if json.dumps(m) != oldstatus:
             self.send_order_status(m)
 
     def send_order_status(self, order):
         self.WriteAllClients('order.%s: %s' %
-                             (order['permid'], json.dumps(order)))
+                             (order['permid'], json.dumps(order)), (order['permid'], order))
 
     def handle_open_order(self, msg):
         mid = str(msg.orderId)
@@ -326,6 +427,7 @@ class TWS(object):
         else:
             oldstatus = ''
         m['id'] = msg.orderId
+        self.order_ids[mid] = pid
         m['symbol'] = msg.contract.m_symbol
         m['action'] = msg.order.m_action
         m['quantity'] = msg.order.m_totalQuantity
@@ -343,6 +445,7 @@ class TWS(object):
 
     def handle_accounts(self, msg):
         self.accounts = msg.accountsList.split(',')
+        self.data_version['accounts'] += 1
         self.WriteAllClients('accounts: %s' % json.dumps(self.accounts))
 
     def set_account(self, account_name, callback):
@@ -378,11 +481,11 @@ class TWS(object):
             else:
                 self.output('TWS API disconnected; attempting connection...')
 
-    def WriteAllClients(self, msg):
+    def WriteAllClients(self, msg, data=None):
+        """send msg to all clients; data holds the event fields for the binary encodings"""
         #self.output('WriteAllClients: %s.%s' % (self.channel, msg))
-        msg = str('%s.%s\n' % (self.channel, msg))
-        for c in self.clients:
-            c.transport.write(msg)
+        if self.clients:
+            write_event(self.clients, Event(self.channel, msg, data, self.event_symbols))
 
     def error_handler(self, msg):
         """Handles the capturing of error messages"""
@@ -400,23 +503,19 @@ class TWS(object):
 
         self.output('%s: %s' % (status.lower(), result))
 
-        for cb in self.order_callbacks:
-            if str(cb.id) == str(msg.id):
-                cb.complete(result)
+        for cb in self.get_callbacks(self.order_callbacks, msg.id):
+            cb.complete(result)
 
-        for cb in self.cancel_callbacks:
-            if str(cb.id) == str(msg.id):
-                cb.complete(result)
+        for cb in self.get_callbacks(self.cancel_callbacks, msg.id):
+            cb.complete(result)
 
-        for cb in self.bardata_callbacks:
-            if str(cb.id) == str(msg.id):
-                 cb.complete(['Error: %s' % msg.errorMsg, None])
+        for cb in self.get_callbacks(self.bardata_callbacks, msg.id):
+            cb.complete(['Error: %s' % msg.errorMsg, None])
 
-        for cb in self.addsymbol_callbacks:
-            if str(cb.id.ticker_id) == str(msg.id):
-                cb.complete(False)
-                del(self.symbols[self.symbols_by_id[msg.id].symbol])
-                del(self.symbols_by_id[msg.id])
+        for cb in self.get_callbacks(self.addsymbol_callbacks, msg.id):
+            cb.complete(False)
+            self.drop_symbol(self.symbols_by_id[msg.id].symbol)
+            del(self.symbols_by_id[msg.id])
 
         order = self.find_order_with_id(str(msg.id))
         if order:
@@ -435,10 +534,8 @@ class TWS(object):
             self.WriteAllClients('%s: %s' % (status.lower(), msg))
 
     def find_order_with_id(self, id):
-        for order in self.orders.values():
-            if 'id' in order.keys() and str(order['id']) == str(id):
-                return order
-        return None
+        pid = self.order_ids.get(str(id))
+        return self.orders.get(pid) if pid else None
 
     def reply_handler(self, msg):
         """Handles of server replies"""
@@ -454,8 +551,8 @@ class TWS(object):
         t = time.localtime(msg.time)
         if t[4] != self.last_minute or self.output_second_ticks:
             self.last_minute = t[4]
-            self.WriteAllClients('time: %s' %
-                                 time.strftime('%Y-%m-%d %H:%M:%S', t))
+            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', t)
+            self.WriteAllClients('time: %s' % timestamp, timestamp)
 
     def create_contract(self, symbol, sec_type, exch, prim_exch, curr):
         """Create a Contract object defining what will
@@ -541,7 +638,7 @@ class TWS(object):
                 order.m_auxPrice = stop_price
             if order_type in ['LMT', 'STP LMT']:
                 order.m_lmtPrice = price
-            self.order_callbacks.append(tcb)
+            self.add_callback(self.order_callbacks, order_id, tcb)
             resp = self.tws_conn.placeOrder(order_id, contract, order)
             self.output('placeOrder(%s) returned %s' %
                         (repr((order_id, contract, order)), repr(resp)))
@@ -559,65 +656,82 @@ class TWS(object):
                 resp = self.tws_conn.cancelOrder(mid)
                 self.output('cancelOrder(%s) returned %s' %
                             (repr(mid), repr(resp)))
-                self.cancel_callbacks.append(tcb)
+                self.add_callback(self.cancel_callbacks, mid, tcb)
         else:
             tcb.complete(
                 {'status': 'Error', 'errorMsg': 'Order not found', 'id': mid})
 
     def symbol_enable(self, symbol, client, callback):
         if not symbol in self.symbols.keys():
-            self.addsymbol_callbacks.append(TWS_Callback(
-                self, TWS_Symbol(self, symbol, client), 'add-symbol', callback))
+            ts = TWS_Symbol(self, symbol, client)
+            self.add_callback(self.addsymbol_callbacks, ts.ticker_id, TWS_Callback(self, ts, 'add-symbol', callback))
         else:
             self.symbols[symbol].add_client(client)
             TWS_Callback(self, 0, 'add-symbol', callback).complete(True)
+            self.send_snapshot(self.symbols[symbol], client)
+
+    def send_snapshot(self, symbol, client):
+        """send the current quote and trade to a client that subscribed to an already streaming symbol"""
+        if isinstance(client, EventSubscriber):
+            for msg, data in symbol.snapshot_events():
+                client.send_event(Event(self.channel, msg, data, self.event_symbols))
 
     def symbol_disable(self, symbol, client):
         if symbol in self.symbols.keys():
             ts = self.symbols[symbol]
             ts.del_client(client)
             if not ts.clients:
-                del(self.symbols[symbol])
+                self.drop_symbol(symbol)
             return True
 
     def handle_tick_size(self, msg):
         symbol = self.symbols_by_id[msg.tickerId]
+        symbol.version += 1
+        if self.tick_capture and msg.field in TICK_CAPTURE_FIELDS:
+            self.tick_capture.write(symbol.capture_id, TICK_CAPTURE_FIELDS[msg.field], msg.size)
         # if self.enable_ticker:
         #  self.output('%s %s %d %s %d' % (repr(msg), symbol, msg.field, TickType().getField(msg.field), msg.size))
         if msg.field == 0:  # bid_size
-            symbol.bid_size = msg.size
+            symbol.bid_size = symbol.exported['bidsize'] = msg.size
             if self.enable_ticker:
                 symbol.update_quote()
         elif msg.field == 3:  # ask_size
-            symbol.ask_size = msg.size
+            symbol.ask_size = symbol.exported['asksize'] = msg.size
             if self.enable_ticker:
                 symbol.update_quote()
         elif msg.field == 5:  # last_size
-            symbol.size = msg.size
+            symbol.size = symbol.exported['size'] = msg.size
         elif msg.field == 8:  # volume
-            symbol.volume = msg.size
+            symbol.volume = symbol.exported['volume'] = msg.size
             if self.enable_ticker:
                 symbol.update_trade()
+        if self.quote_table:
+            self.quote_table.publish(symbol.quote_slot, symbol)
 
     def handle_tick_price(self, msg):
-        for cb in self.addsymbol_callbacks:
-            if str(cb.id.ticker_id) == str(msg.tickerId) and not cb.done:
+        for cb in self.get_callbacks(self.addsymbol_callbacks, msg.tickerId):
+            if not cb.done:
                 cb.complete(True)
         # if self.enable_ticker:
         #    self.output('%s %d %s %s' % (repr(msg), msg.field, TickType().getField(msg.field), msg.price))
         symbol = self.symbols_by_id[msg.tickerId]
+        symbol.version += 1
+        if self.tick_capture and msg.field in TICK_CAPTURE_FIELDS:
+            self.tick_capture.write(symbol.capture_id, TICK_CAPTURE_FIELDS[msg.field], msg.price)
         if msg.field == 1:  # bid
-            symbol.bid = msg.price
+            symbol.bid = symbol.exported['bid'] = msg.price
             if self.enable_ticker:
                 symbol.update_quote()
         elif msg.field == 2:  # ask
-            symbol.ask = msg.price
+            symbol.ask = symbol.exported['ask'] = msg.price
             if self.enable_ticker:
                 symbol.update_quote()
         elif msg.field == 4:  # last
-            symbol.last = msg.price
+            symbol.last = symbol.exported['last'] = msg.price
         elif msg.field == 9:  # close
-            symbol.close = msg.price
+            symbol.close = symbol.exported['close'] = msg.price
+        if self.quote_table:
+            self.quote_table.publish(symbol.quote_slot, symbol)
 
     def handle_tick_string(self, msg):
         pass
@@ -674,7 +788,10 @@ class TWS(object):
             cb.complete(self.positions)
         self.position_callbacks = []
 
-    def request_orders(self, callback):
+    def request_orders(self, callback, **filters):
+        if filters:
+            callback.errback(Failure(Exception('order query filters are not supported by the TWS api')))
+            return
         if not self.openorder_callbacks:
             self.tws_conn.reqAllOpenOrders()
         self.openorder_callbacks.append(
@@ -688,7 +805,10 @@ class TWS(object):
             cb.complete(self.orders)
         self.openorder_callbacks = []
 
-    def request_executions(self, callback):
+    def request_executions(self, callback, **filters):
+        if filters:
+            callback.errback(Failure(Exception('execution query filters are not supported by the TWS api')))
+            return
         if not self.execution_callbacks:
             self.executions = {}
             filter = ExecutionFilter()
@@ -764,7 +884,7 @@ class TWS(object):
         e['price'] = msg.execution.m_price
         e['side'] = msg.execution.m_side
         e['time'] = msg.execution.m_time
-        self.WriteAllClients('execution.%s: %s' % (e['execId'], json.dumps(e)))
+        self.WriteAllClients('execution.%s: %s' % (e['execId'], json.dumps(e)), (e['execId'], e))
 
     def handle_exec_details_end(self, msg):
         for cb in self.execution_callbacks:
@@ -793,7 +913,7 @@ class TWS(object):
             whatToShow = 'TRADES'
             useRTH = 0
             formatDate = 1
-            self.bardata_callbacks.append(cb)
+            self.add_callback(self.bardata_callbacks, id, cb)
             self.output('edt:%s ds:%s bss:%s' %
                         (endDateTime, durationStr, barSizeSetting))
             self.tws_conn.reqHistoricalData(
@@ -804,14 +924,13 @@ class TWS(object):
                 (bar_symbol, bar_period, bar_start, bar_end)), 'Count: 0'])
 
     def handle_historical_data(self, msg):
-        for cb in self.bardata_callbacks:
-            if cb.id == msg.reqId:
-                if not cb.data:
-                    cb.data = []
-                if msg.date.startswith('finished'):
-                    cb.complete(['OK', cb.data])
-                else:
-                    cb.data.append(dict(msg.items()))
+        for cb in self.get_callbacks(self.bardata_callbacks, msg.reqId):
+            if not cb.data:
+                cb.data = []
+            if msg.date.startswith('finished'):
+                cb.complete(['OK', cb.data])
+            else:
+                cb.data.append(dict(msg.items()))
         # self.output('historical_data: %s' % msg) #repr((id, start_date, bar_open, bar_high, bar_low, bar_close, bar_volume, count, WAP, hasGaps)))
 
     def query_connection_status(self):
@@ -827,4 +946,8 @@ if __name__ == '__main__':
     tws=TWS()
     reactor.listenTCP(tws.tcp_port, serverFactory(tws))
     reactor.listenTCP(tws.http_port, webServerFactory(tws))
+    if tws.tcp_socket:
+        reactor.listenUNIX(tws.tcp_socket, serverFactory(tws, tws.socket_auth), mode=tws.socket_mode, wantPID=True)
+    if tws.http_socket:
+        reactor.listenUNIX(tws.http_socket, webServerFactory(tws, tws.socket_auth), mode=tws.socket_mode, wantPID=True)
     reactor.run()
@@ -13,30 +13,85 @@
 
 from twisted.web import http
 from twisted.web.server import Site, NOT_DONE_YET
-from twisted.web.resource import Resource
-from twisted.internet import reactor, endpoints, defer
+from twisted.web.resource import Resource, EncodingResourceWrapper
+from twisted.web.server import GzipEncoderFactory
+from twisted.internet import reactor, endpoints, defer, task
 
 from pprint import pprint
 import sys
+import hashlib
 from datetime import datetime
 import ujson as json
 from txtrader.version import HEADER
+from txtrader.events import EventSubscriber
+from txtrader.logger import logger, WRITER
+
+http_log = logger('http')
+
+# GET responses served from the cache while the named api.data_version counter is unchanged
+CACHED_DATA = {
+    'query_accounts': 'accounts',
+    'get_order_route': 'order_route',
+    'query_symbols': 'symbols',
+}
+
+# GET responses that never change while the server runs
+CACHED_STATIC = ['help', 'version']
+
+# items of a streamed collection serialized per cooperator step
+STREAM_BATCH = 500
 
 class webserver(object):
-    def __init__(self, api):
+    def __init__(self, api, trusted=False):
         self.started = datetime.now()
         self.api = api
+        self.trusted = trusted
         self.output = api.output
         self.root = Resource()
+        # serialized responses: key -> (version, etag, body)
+        self.cache = {}
         self.commands = [name[5:]
                          for name in dir(self) if name.startswith('json_')]
         for route in self.commands:
             self.root.putChild(route, Leaf(
-                self, getattr(self, 'json_%s' % route)))
+                self, getattr(self, 'json_%s' % route), route))
 
     def render(self, d, data):
         d.callback(json.dumps(data))
 
+    def cache_version(self, command, args):
+        """return (key, version) if the response to command can be cached, else None"""
+        if command in CACHED_STATIC:
+            return command, 0
+        if command in CACHED_DATA:
+            return command, self.api.data_version[CACHED_DATA[command]]
+        if command == 'query_symbol':
+            symbol = str(args.get('symbol', '')).upper()
+            if symbol in self.api.symbols:
+                # the symbol's version restarts if it is deleted and added again; the symbols version does not
+                return (command, symbol), (self.api.data_version['symbols'], self.api.symbols[symbol].version)
+        return None
+
+    def cache_store(self, body, key, version, request):
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        self.cache[key] = (version, etag, body)
+        request.setETag(etag)
+        return body
+
+    def write_response(self, result, request):
+        """write a command's result and finish the request
+
+        Results are JSON strings, except the order and execution collections, which the api
+        passes unrendered to a ResultDeferred; those are streamed by a JSONProducer.
+        """
+        if isinstance(result, basestring):
+            request.write(result)
+            request.finish()
+            return None
+        d = JSONProducer(request, result).start()
+        d.addCallbacks(lambda ign: request.finish(), lambda failure: failure.trap(task.TaskStopped))
+        return d
+
     def json_shutdown(self, args, d):
         """shutdown(message) 
 
@@ -100,6 +155,14 @@ class webserver(object):
         symbol = str(args['symbol']).upper()
         self.render(d, self.api.symbol_disable(symbol, self))
 
+    def json_query_clients(self, args, d):
+        """query_clients() => [{'peer': 'host:port', 'encoding': 'text', 'paused': False, 'queued': n, ...}, ...]
+
+        Return event stream flow control status for each TCP client: queue depth, peak queue depth,
+        quotes/trades dropped by conflation, number of pauses, and slow consumer disconnect flag
+        """
+        self.render(d, [c.event_status() for c in self.api.clients if isinstance(c, EventSubscriber)])
+
     def json_query_symbols(self, args, d):
         """query_symbols() => ['symbol', ...]
 
@@ -129,6 +192,23 @@ class webserver(object):
             ret = self.api.symbols[symbol].rawdata
         self.render(d, ret)
 
+    def json_query_symbols_data(self, args, d):
+        """query_symbols_data(['symbol', ...], ['field', ...]) => {'symbol': {'fieldname': data, ...}, ...}
+
+        Return current data for many symbols at once; all active symbols if symbols is empty or '*',
+        all fields if fields is empty.  Lists may also be given as comma separated strings.
+        Symbols that are not active return None.
+        """
+        symbols = list_arg(args.get('symbols'))
+        fields = list_arg(args.get('fields'))
+        if not symbols or symbols == ['*']:
+            symbols = self.api.symbols.keys()
+        ret = {}
+        for symbol in symbols:
+            symbol = symbol.upper()
+            ret[symbol] = self.api.symbols[symbol].query_data(fields) if symbol in self.api.symbols else None
+        self.render(d, ret)
+
     def json_query_accounts(self, args, d):
         """query_accounts() => ['account_name', ...]
 
@@ -173,18 +253,21 @@ class webserver(object):
         self.api.request_order(oid, d)
 
     def json_query_orders(self, args, d):
-        """query_orders() => {'order_id': {'field': data, ...}, ...}
+        """query_orders(status=None, symbol=None, account=None, since=None, fields=None) => {'order_id': {'field': data, ...}, ...}
 
-        Return dict keyed by order id containing dicts of order data fields
+        Return dict keyed by order id containing dicts of order data fields.  The optional filters
+        select orders by status, symbol and account (lists or comma separated strings) and by the
+        time of the last update ('HH:MM:SS'); only the named fields are returned when fields is given.
         """
-        self.api.request_orders(d)
+        self.api.request_orders(d, **order_filters(args))
 
     def json_query_executions(self, args, d):
-        """query_executions() => {'exec_id': {'field': data, ...}, ...}
+        """query_executions(status=None, symbol=None, account=None, since=None, fields=None) => {'exec_id': {'field': data, ...}, ...}
 
-        Return dict keyed by execution id containing dicts of execution report data fields
+        Return dict keyed by execution id containing dicts of execution report data fields,
+        selected by the filters of query_orders
         """
-        self.api.request_executions(d)
+        self.api.request_executions(d, **order_filters(args))
 
     def json_market_order(self, args, d):
         """market_order('account', 'symbol', quantity) => {'field':, data, ...}
@@ -317,6 +400,51 @@ class webserver(object):
         route = args['route']
         self.api.set_order_route(route, d)
 
+    def json_batch(self, args, d):
+        """batch([{'command': 'name', 'args': {...}}, ...]) => [{'result': ...} or {'error': 'message'}, ...]
+
+        Run several commands at once; the results are returned in request order when all have completed.
+        POST the list as the request body.
+        """
+        requests = args if isinstance(args, list) else args.get('requests', [])
+        if not isinstance(requests, list):
+            # a GET passes requests as a string
+            self.render(d, {'error': 'batch requests must be a list: POST the list as the request body'})
+            return
+        deferreds = []
+        for i, request in enumerate(requests):
+            r = ResultDeferred()
+            # each result is embedded in the batch response, so it is returned serialized
+            r.stream_results = False
+            r.addCallbacks(lambda result: '{"result":%s}' % result, lambda failure: json.dumps({'error': failure.getErrorMessage()}))
+            deferreds.append(r)
+            try:
+                command = str(request['command'])
+                if command == 'batch' or command not in self.commands:
+                    raise Exception('unknown command: %s' % command)
+                getattr(self, 'json_%s' % command)(request.get('args') or {}, r)
+            except Exception as ex:
+                if not r.called:
+                    r.errback(Exception('batch entry %d failed: %s' % (i, ex)))
+        if isinstance(d, ResultDeferred):
+            d.batched = deferreds
+        dl = defer.gatherResults(deferreds)
+        dl.addCallback(self.batch_complete, d)
+
+    def batch_complete(self, results, d):
+        if not (d.called or getattr(d, 'cancelled', False)):
+            d.callback('[%s]' % ','.join(results))
+
+    def json_log_levels(self, args, d):
+        """log_levels(level, levels, sample) => {'level': 'INFO', 'levels': {'subsystem': 'LEVEL', ...}, 'sample': {'subsystem': n, ...}, 'dropped': n}
+
+        Return the log settings, first changing those given: level is the default level (DEBUG, INFO, WARNING, ERROR or OFF),
+        levels sets per-subsystem levels ('tcp=DEBUG,http=WARNING'), sample logs one in n records per subsystem ('tcp=10').
+        Subsystems: api, symbols, metrics, tcp, http.  levels and sample replace the previous settings; '' clears them.
+        """
+        WRITER.configure(args.get('level'), args.get('levels'), args.get('sample'))
+        self.render(d, WRITER.settings())
+
     def json_help(self, args, d):
         """help() => {'command': 'command(parameters) => return', ...}
 
@@ -327,18 +455,137 @@ class webserver(object):
             help[command] = getattr(self, 'json_%s' % command).__doc__
         self.render(d, help)
 
+def list_arg(value):
+    """a list argument given as a JSON list (POST) or a comma separated string (GET)"""
+    if not value:
+        return []
+    if isinstance(value, basestring):
+        value = value.split(',')
+    return [str(v).strip() for v in value if str(v).strip()]
+
+
+class ResultDeferred(defer.Deferred):
+    """the Deferred of an HTTP request: the api may fire it with an unserialized collection
+
+    It is cancelled when the client disconnects before the response is written; the api
+    callbacks check cancelled and drop their results without formatting them.  The Deferreds
+    of the commands in a batch request are cancelled with it.
+    """
+    stream_results = True
+    cancelled = False
+    batched = ()
+
+    def cancel(self):
+        self.cancelled = True
+        # a response being written is stopped by its JSONProducer instead
+        if not self.called:
+            defer.Deferred.cancel(self)
+        # cancelled last: the batch results they complete are then not written
+        for r in self.batched:
+            r.cancel()
+
+
+class JSONProducer(object):
+    """push producer writing a collection to a request as one JSON object, STREAM_BATCH items per step
+
+    The collection is a dict, or the api's order collection: its items() are (id, order) pairs
+    and its render_item(order) returns the order's fields, or None to leave the order out.  The
+    steps run on the global cooperator, which bounds the time spent per reactor turn; the
+    request pauses the producer while the client's send buffer is full.  The response goes out
+    with chunked transfer encoding and the serialized collection is never held whole.  Each
+    item is rendered and serialized when its chunk is written, so orders changing meanwhile
+    are sent as of that step.
+    """
+
+    def __init__(self, request, data, batch=STREAM_BATCH):
+        self.request = request
+        self.items = data.items() if isinstance(data, dict) else data.items
+        self.render_item = getattr(data, 'render_item', None)
+        self.batch = batch
+        self.paused = False
+        self.task = None
+
+    def start(self):
+        """return a Deferred firing when the object is written; it fails with TaskStopped if the client goes away"""
+        if len(self.items) <= self.batch:
+            self.request.write('{%s}' % self.chunk(self.items))
+            return defer.succeed(None)
+        self.task = task.cooperate(self.chunks())
+        self.request.registerProducer(self, True)
+        self.request.notifyFinish().addErrback(lambda failure: self.stopProducing())
+        return self.task.whenDone().addBoth(self.stopped)
+
+    def chunk(self, items):
+        if self.render_item:
+            items = [(k, self.render_item(v)) for k, v in items]
+            items = [(k, v) for k, v in items if v is not None]
+        return ','.join(['%s:%s' % (json.dumps(str(k)), json.dumps(v)) for k, v in items])
+
+    def chunks(self):
+        self.request.write('{')
+        separator = ''
+        for i in xrange(0, len(self.items), self.batch):
+            chunk = self.chunk(self.items[i:i + self.batch])
+            if chunk:
+                self.request.write(separator + chunk)
+                separator = ','
+            yield None
+        self.request.write('}')
+
+    def stopped(self, result):
+        # a request whose connection was lost has no channel to unregister from
+        if self.request.channel is not None:
+            self.request.unregisterProducer()
+        else:
+            self.request.producer = None
+        return result
+
+    def pauseProducing(self):
+        if not self.paused:
+            self.paused = True
+            self.task.pause()
+
+    def resumeProducing(self):
+        if self.paused:
+            self.paused = False
+            self.task.resume()
+
+    def stopProducing(self):
+        try:
+            self.task.stop()
+        except task.TaskDone:
+            pass
+
+
+def order_filters(args):
+    """the query_orders and query_executions filters given in args"""
+    filters = dict([(k, list_arg(args.get(k))) for k in ['status', 'symbol', 'account', 'fields'] if args.get(k)])
+    if args.get('since'):
+        filters['since'] = str(args['since'])
+    return filters
+
+
+def client_address(request):
+    """host:port of a TCP client, or the socket path for a Unix socket client"""
+    client = request.client
+    if hasattr(client, 'host'):
+        return '%s:%d' % (client.host, client.port)
+    return 'unix:%s' % (request.getHost().name or '')
+
+
 class Leaf(Resource):
-    def __init__(self, root, cmdfunc):
+    def __init__(self, root, cmdfunc, command):
         Resource.__init__(self)
         self.root = root
         self.cmdfunc = cmdfunc
+        self.command = command
         self.isLeaf = True
 
     def render(self, request):
         self.request = request
         user = self.request.getUser()
         password = self.request.getPassword()
-        if user == self.root.api.username and password == self.root.api.password:
+        if self.root.trusted or (user == self.root.api.username and password == self.root.api.password):
             return Resource.render(self, request)
         else:
             request.setResponseCode(http.UNAUTHORIZED)
@@ -349,16 +596,35 @@ class Leaf(Resource):
         # get only supports a single value for each named parameter
         for key, value in request.args.iteritems():
           data[key]=value[0]
-        self.root.output('RX GET %s:%d %s %s' % (request.client.host, request.client.port, request.path, repr(data)))
+        http_log.info('RX GET %s %s %r', client_address(request), request.path, data)
         request.setHeader('Content-type', 'application/json')
-        d = defer.Deferred()
-        d.addCallback(request.write)
-        d.addCallback(lambda ign: request.finish())
+        cached = self.root.cache_version(self.command, data)
+        if cached:
+            key, version = cached
+            entry = self.root.cache.get(key)
+            if entry and entry[0] == version:
+                if request.setETag(entry[1]) == http.CACHED:
+                    return ''
+                return entry[2]
+        d = ResultDeferred()
+        if cached:
+            d.addCallback(self.root.cache_store, key, version, request)
+        d.addCallback(self.root.write_response, request)
+        d.addErrback(self.client_gone)
         d.addErrback(self.api_timeout, request)
         d.addErrback(lambda ign: request.finish())
+        request.notifyFinish().addErrback(self.request_lost, request, d)
         self.cmdfunc(data, d)
         return NOT_DONE_YET
 
+    def request_lost(self, failure, request, d):
+        # the client disconnected before its response was finished: abandon the work for it
+        http_log.info('client %s gone, %s abandoned', client_address(request), request.path)
+        d.cancel()
+
+    def client_gone(self, failure):
+        failure.trap(defer.CancelledError)
+
     def api_timeout(self, failure, request):
         self.root.output('WARNING: API timeout errback: %s' % repr(failure))
         request.setResponseCode(504)
@@ -367,13 +633,14 @@ class Leaf(Resource):
     def render_POST(self, request):
         # pprint(request.__dict__)
         data = json.loads(request.content.getvalue())
-        self.root.output('RX POST %s:%d %s %s' % (request.client.host, request.client.port, request.path, repr(data)))
+        http_log.info('RX POST %s %s %r', client_address(request), request.path, data)
         request.setHeader('Content-type', 'application/json')
-        d = defer.Deferred()
-        d.addCallback(request.write)
-        d.addCallback(lambda ign: request.finish())
+        d = ResultDeferred()
+        d.addCallback(self.root.write_response, request)
+        d.addErrback(self.client_gone)
         d.addErrback(self.api_error, request)
         d.addErrback(lambda ign: request.finish())
+        request.notifyFinish().addErrback(self.request_lost, request, d)
         self.cmdfunc(data, d)
         return NOT_DONE_YET
 
@@ -383,8 +650,21 @@ class Leaf(Resource):
         return failure
 
 
-def webServerFactory(api):
-    return Site(webserver(api).root)
+def webServerFactory(api, trusted=False):
+    """the JSON over HTTP site; a trusted site skips basic auth, for a Unix socket protected by its file mode"""
+    root = webserver(api, trusted).root
+    if api.http_gzip:
+        # responses are compressed for clients sending Accept-Encoding: gzip
+        for name, leaf in root.children.items():
+            root.putChild(name, EncodingResourceWrapper(leaf, [GzipEncoderFactory()]))
+    # imported here: the WebSocket session is a tcpserver, and tcpserver imports this module
+    from txtrader.wsserver import streamResource
+    from txtrader.sseserver import EventsResource
+    stream = streamResource(api, trusted)
+    if stream:
+        root.putChild('stream', stream)
+    root.putChild('events', EventsResource(api, trusted))
+    return Site(root)
 
 if __name__ == '__main__':
 
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+  webserver_test.py
+  -----------------
+
+  TxTrader JSON over HTTP server unit test script
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+from txtrader.webserver import webserver, STREAM_BATCH
+from txtrader.tcpserver_test import CallbackAPI
+from txtrader.rtx import API_Callback
+from twisted.internet import reactor, defer
+from twisted.web.server import Request, NOT_DONE_YET
+from twisted.web.test.requesthelper import DummyChannel
+from StringIO import StringIO
+
+import os
+import json
+import pytest
+
+
+def test_batch():
+    api = CallbackAPI()
+    server = webserver(api)
+    results = []
+    d = defer.Deferred()
+    d.addCallback(results.append)
+    server.json_batch([
+        {'command': 'set_account', 'args': {'account': 'demo1.test.demo.1'}},
+        {'command': 'status'},
+        {'command': 'add_symbol', 'args': {'symbol': 'ibm'}},
+        {'command': 'set_account'},
+        {'command': 'batch', 'args': []},
+    ], d)
+    # nothing is returned until every command has completed
+    assert results == []
+    api.pending['DEMO1.TEST.DEMO.1'].complete(True)
+    batch = json.loads(results[0])
+    assert batch[:3] == [{'result': True}, {'result': 'Up'}, {'result': True}]
+    assert batch[3]['error'].startswith('batch entry 3 failed:')
+    assert batch[4] == {'error': 'batch entry 4 failed: unknown command: batch'}
+
+
+def test_batch_not_list():
+    results = []
+    d = defer.Deferred()
+    d.addCallback(results.append)
+    webserver(CallbackAPI()).json_batch({'requests': '[{"command": "status"}]'}, d)
+    assert json.loads(results[0]) == {'error': 'batch requests must be a list: POST the list as the request body'}
+
+
+@pytest.mark.skipif('TXTRADER_API_HOST' not in os.environ, reason='needs the etc/txtrader environment (envdir)')
+def test_query_symbols_data():
+    from txtrader.benchmark import Benchmark, SYMBOLS
+    bench = Benchmark(quick=True)
+    api = bench.api
+    for line in bench.quote_updates(500):
+        api.gateway_receive(line)
+    server = webserver(api)
+
+    def query(args):
+        results = []
+        d = defer.Deferred()
+        d.addCallback(results.append)
+        server.json_query_symbols_data(args, d)
+        return json.loads(results[0])
+
+    # the incrementally maintained data matches a full export after the updates
+    data = query({})
+    assert sorted(data.keys()) == sorted(SYMBOLS)
+    for symbol in SYMBOLS:
+        assert data[symbol] == json.loads(json.dumps(api.symbols[symbol].export()))
+    ibm = api.symbols['IBM']
+    assert query({'symbols': 'ibm,XXX', 'fields': 'bid,last,nosuchfield'}) == {'IBM': {'bid': ibm.bid, 'last': ibm.last}, 'XXX': None}
+    assert query({'symbols': ['IBM'], 'fields': ['volume']}) == {'IBM': {'volume': ibm.volume}}
+
+    # the quote fields are left out when they are disabled, as in export()
+    api.enable_ticker = False
+    assert 'bid' not in query({})['IBM']
+    assert query({'symbols': 'IBM', 'fields': 'bid,asksize,last'}) == {'IBM': {'last': ibm.last}}
+    assert query({})['IBM'] == json.loads(json.dumps(ibm.export()))
+
+
+class VersionedAPI(CallbackAPI):
+    def __init__(self):
+        CallbackAPI.__init__(self)
+        self.data_version = {'accounts': 0, 'order_route': 0, 'symbols': 0}
+
+    def symbol_enable(self, symbol, client, callback):
+        CallbackAPI.symbol_enable(self, symbol, client, callback)
+        self.data_version['symbols'] += 1
+
+
+def get(leaf, etag=None):
+    """GET from leaf; return (response code, etag, body)"""
+    channel = DummyChannel()
+    request = Request(channel, False)
+    request.method = 'GET'
+    request.path = '/%s' % leaf.command
+    request.args = {}
+    request.gotLength(0)
+    if etag:
+        request.requestHeaders.setRawHeaders('if-none-match', [etag])
+    body = leaf.render_GET(request)
+    if body != NOT_DONE_YET:
+        request.write(body)
+        request.finish()
+    body = channel.transport.written.getvalue().split('\r\n\r\n', 1)[1]
+    return request.code, request.responseHeaders.getRawHeaders('etag', [None])[0], body
+
+
+def test_response_cache():
+    api = VersionedAPI()
+    server = webserver(api)
+    leaf = server.root.children['query_symbols']
+    code, etag, body = get(leaf)
+    assert (code, json.loads(body)) == (200, [])
+    assert get(leaf) == (200, etag, body)
+    assert get(leaf, etag) == (304, etag, '')
+
+    # a new symbol changes the version: the response is built again and the old tag no longer matches
+    server.json_add_symbol({'symbol': 'ibm'}, defer.Deferred())
+    code, new_etag, body = get(leaf, etag)
+    assert (code, json.loads(body)) == (200, ['IBM'])
+    assert new_etag != etag
+    assert server.cache['query_symbols'][1:] == (new_etag, body)
+
+    help = server.root.children['help']
+    code, etag, body = get(help)
+    assert get(help, etag)[0] == 304
+
+
+@pytest.mark.skipif('TXTRADER_API_HOST' not in os.environ, reason='needs the etc/txtrader environment (envdir)')
+def test_response_cache_client_disconnect():
+    from txtrader.benchmark import Benchmark, SYMBOLS
+    api = Benchmark(quick=True).api
+    leaf = webserver(api).root.children['query_symbols']
+    code, etag, body = get(leaf)
+    assert sorted(json.loads(body)) == sorted(SYMBOLS)
+    # the benchmark's symbols all belong to one client; they go when it disconnects
+    api.close_client('bench')
+    assert api.symbols == {}
+    code, new_etag, body = get(leaf, etag)
+    assert (code, json.loads(body)) == (200, [])
+    assert new_etag != etag
+
+
+class Order(object):
+    def __init__(self, oid):
+        self.fields = {'permid': oid, 'status': 'Filled'}
+
+    def render(self):
+        return dict(self.fields)
+
+
+class OrdersAPI(CallbackAPI):
+    def __init__(self, count):
+        CallbackAPI.__init__(self)
+        self.orders = dict([('%d' % i, Order('%d' % i)) for i in range(count)])
+        self.order_rows = []
+
+    def handle_order_response(self, row):
+        self.order_rows.append(row)
+
+    def request_orders(self, callback):
+        self.pending['orders'] = API_Callback(self, 0, 'orders', callback)
+
+
+def test_streamed_response():
+    api = OrdersAPI(STREAM_BATCH * 2 + 10)
+    leaf = webserver(api).root.children['query_orders']
+    request = Request(DummyChannel(), False)
+    request.method = 'GET'
+    request.path = '/query_orders'
+    request.args = {}
+    writes = []
+    write = request.write
+    request.write = lambda data: writes.append(data) or write(data)
+    assert leaf.render_GET(request) == NOT_DONE_YET
+    rendered = []
+    for order in api.orders.values():
+        order.render = lambda render=order.render: rendered.append(1) or render()
+    api.pending['orders'].complete([])
+    # the orders are rendered and written a batch at a time, one cooperator step each
+    assert rendered == []
+    for i in range(100):
+        if request.finished:
+            break
+        reactor.iterate(0.01)
+    assert request.finished
+    assert len(writes) == 5
+    assert len(rendered) == len(api.orders)
+    assert json.loads(''.join(writes)) == dict([(k, v.render()) for k, v in api.orders.items()])
+
+    # a client that goes away stops the stream
+    request = Request(DummyChannel(), False)
+    request.method = 'GET'
+    request.args = {}
+    leaf.render_GET(request)
+    api.pending['orders'].complete([])
+    request.connectionLost(Exception('closed'))
+    for i in range(5):
+        reactor.iterate(0.01)
+    assert not request.finished and request.producer is None
+
+
+def test_client_disconnect():
+    api = OrdersAPI(10)
+    leaf = webserver(api).root.children['query_orders']
+    request = Request(DummyChannel(), False)
+    request.method = 'GET'
+    request.path = '/query_orders'
+    request.args = {}
+    leaf.render_GET(request)
+    callback = api.pending['orders']
+    request.connectionLost(Exception('closed'))
+    # the callback is done, so CheckPendingResults drops it, and its late results are not formatted
+    callback.check_expire()
+    assert callback.done and not callback.expired
+    callback.format_results = None
+    row = {'ORIGINAL_ORDER_ID': '1', 'CURRENT_STATUS': 'COMPLETED'}
+    callback.complete([row])
+    assert not request.finished
+    # but the order rows still update the orders
+    assert api.order_rows == [row]
+
+
+def test_batch_client_disconnect():
+    api = OrdersAPI(10)
+    leaf = webserver(api).root.children['batch']
+    request = Request(DummyChannel(), False)
+    request.method = 'POST'
+    request.path = '/batch'
+    request.content = StringIO(json.dumps([{'command': 'query_orders'}, {'command': 'status'}]))
+    written = []
+    request.write = written.append
+    request.finish = lambda: written.append('finish')
+    assert leaf.render_POST(request) == NOT_DONE_YET
+    callback = api.pending['orders']
+    # the batched command is abandoned with the batch request, and nothing is written
+    request.connectionLost(Exception('closed'))
+    assert callback.cancelled()
+    callback.format_results = None
+    callback.complete([])
+    assert written == []
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  wsserver.py
+  -----------
+
+  TxTrader WebSocket server module - the TCP event stream and commands on the webserver's /stream path.
+
+  Each WebSocket message carries what one netstring carries on the TCP port: commands from the
+  client, responses and events from the server.  Binary encoded frames are sent as binary
+  messages, everything else as text.  The connection may authenticate with HTTP basic auth on
+  the upgrade request (filter flags and encoding are then taken from the 'flags' query
+  parameter, e.g. /stream?flags=noquotes,encoding=binary) or with an auth command as on TCP.
+
+  Requires autobahn; the /stream path is not served when it is not installed.
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+
+import base64
+
+from txtrader.tcpserver import tcpserver, serverFactory
+
+try:
+    from autobahn.twisted.websocket import WebSocketServerProtocol, WebSocketServerFactory
+    from autobahn.twisted.resource import WebSocketResource
+    from autobahn.websocket.types import ConnectionDeny
+except ImportError:
+    WebSocketServerProtocol = object
+    WebSocketResource = None
+
+
+class WebSocketSession(tcpserver):
+    """tcpserver command and event handling for one WebSocket connection"""
+
+    def __init__(self, websocket):
+        tcpserver.__init__(self)
+        self.websocket = websocket
+
+    def write_string(self, data):
+        self.websocket.sendMessage(data, isBinary=bool(self.encoding))
+
+
+class wsserver(WebSocketServerProtocol):
+
+    def onConnect(self, request):
+        self.credentials = None
+        header = request.headers.get('authorization', '')
+        if header.lower().startswith('basic '):
+            try:
+                username, password = base64.b64decode(header[6:].strip()).split(':', 1)
+            except Exception:
+                raise ConnectionDeny(ConnectionDeny.BAD_REQUEST, 'invalid authorization header')
+            if not self.factory.server.validate(username, password):
+                raise ConnectionDeny(ConnectionDeny.FORBIDDEN)
+            flags = ' '.join(','.join(request.params.get('flags', [])).split(','))
+            self.credentials = str('auth %s %s %s' % (username, password, flags))
+
+    def onOpen(self):
+        # the HTTP channel that served the upgrade is still the transport's producer
+        if getattr(self.transport, 'producer', None):
+            self.transport.unregisterProducer()
+        self.session = WebSocketSession(self)
+        self.session.factory = self.factory.server
+        self.session.makeConnection(self.transport)
+        if self.credentials:
+            self.session.stringReceived(self.credentials)
+
+    def onMessage(self, payload, isBinary):
+        self.session.stringReceived(payload)
+
+    def onClose(self, wasClean, code, reason):
+        if getattr(self, 'session', None):
+            self.session.connectionLost(reason)
+            self.session = None
+
+
+def streamResource(api, trusted=False):
+    """return the WebSocket resource for the webserver, or None if autobahn is not installed"""
+    if not WebSocketResource:
+        api.output('WebSocket /stream disabled: autobahn is not installed')
+        return None
+    factory = WebSocketServerFactory()
+    factory.protocol = wsserver
+    factory.server = serverFactory(api, trusted)
+    return WebSocketResource(factory)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+  wsserver_test.py
+  ----------------
+
+  TxTrader WebSocket server unit test script
+
+  Copyright (c) 2018 Reliance Systems Inc. <mkrueger@rstms.net>
+  Licensed under the MIT license.  See LICENSE for details.
+
+"""
+import pytest
+pytest.importorskip('autobahn')
+
+from txtrader.wsserver import wsserver, WebSocketSession, streamResource
+from txtrader.events_test import API
+from txtrader.events import Decoder
+from autobahn.websocket.types import ConnectionDeny
+from twisted.test import proto_helpers
+
+import base64
+
+
+class WebSocket(object):
+    def __init__(self):
+        self.messages = []
+
+    def sendMessage(self, payload, isBinary=False):
+        self.messages.append((isBinary, payload))
+
+
+class Request(object):
+    def __init__(self, credentials=None, flags=None):
+        self.headers = {}
+        if credentials:
+            self.headers['authorization'] = u'Basic %s' % base64.b64encode(credentials)
+        self.params = {u'flags': [flags]} if flags else {}
+
+
+def open_session(api):
+    websocket = WebSocket()
+    session = WebSocketSession(websocket)
+    session.factory = streamResource(api)._factory.server
+    session.makeConnection(proto_helpers.StringTransport())
+    return websocket, session
+
+
+def test_session_messages():
+    api = API()
+    websocket, session = open_session(api)
+    session.stringReceived('auth user pass notrades encoding=binary')
+    api.WriteAllClients('quote.IBM:131.2 300 131.25 100', ('IBM', 131.2, 300, 131.25, 100))
+    api.WriteAllClients('trade.IBM:131.21 100 1234500', ('IBM', 131.21, 100, 1234500))
+    session.stringReceived('#2 status')
+    text = [m for binary, m in websocket.messages if not binary]
+    assert text[-1] == '.Authorized rtx binary'
+    decoder = Decoder('rtx')
+    assert [decoder.decode(m) for binary, m in websocket.messages if binary] == [None, 'rtx.quote.IBM:131.2 300 131.25 100', '#2 .status: Up']
+
+    session.connectionLost(None)
+    assert not api.clients
+
+
+def test_upgrade_authorization():
+    api = API()
+    protocol = wsserver()
+    protocol.factory = streamResource(api)._factory
+    protocol.onConnect(Request('user:pass', u'noquotes,encoding=binary'))
+    assert protocol.credentials == 'auth user pass noquotes encoding=binary'
+    protocol.onConnect(Request())
+    assert protocol.credentials is None
+    with pytest.raises(ConnectionDeny):
+        protocol.onConnect(Request('user:wrong'))